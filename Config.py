@@ -17,4 +17,15 @@ N_LOG_FILES = 5
 
 MAIN_OUTPUT_DIR = os.path.join(SOCIAL_MEDIA_API_BASE_DIR,"Output")
 
+# Job status updates which could not be delivered to the API are kept here and replayed later
+STATUS_OUTBOX_PATH = os.path.join(SOCIAL_MEDIA_API_BASE_DIR, "State", "status_outbox.sqlite3")
+
+# Units used and reserved by every token, shared by all the scheduler instances of the host
+QUOTA_LEDGER_PATH = os.path.join(SOCIAL_MEDIA_API_BASE_DIR, "State", "quota_ledger.sqlite3")
+
+# Buffered job updates (messages, output path, ...) are sent at most this often (seconds) while
+# a job runs, by the first change made after the interval (there is no timer), and always on
+# status changes, at comments checkpoints and when the job ends
+JOB_UPDATE_FLUSH_INTERVAL = 60
+
 DATA_FILE_KEEP_N_DAYS = 60
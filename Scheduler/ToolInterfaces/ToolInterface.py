@@ -1,34 +1,63 @@
 import logging
-import time
 
 import sys
 
 from Scheduler.utils import BASE_DIR
+from Scheduler.utils import STATUS_UPDATE_DEADLINE, STATUS_UPDATE_BASE_DELAY, STATUS_UPDATE_MAX_DELAY
+from Scheduler.utils import CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_TIMEOUT, STATUS_DELIVERED_KEY
+from Scheduler.utils import STATUS_OUTBOX_MAX_ATTEMPTS, STATUS_OUTBOX_MAX_AGE
 import Config as config
-from atlin_api.atlin_api import Atlin, JobStatus
+from atlin_api.atlin_api import get_atlin, JobStatus
+from atlin_api.atlin_api import RetryPolicy, RetryError, RequestRejectedError, CircuitBreaker, StatusOutbox
 
 sys.path.insert(0, BASE_DIR)
 
+# Shared by all the workers of a process, the circuit breaker stops every worker
+# from hammering the API once it is known to be down
+status_retry_policy = RetryPolicy(base_delay=STATUS_UPDATE_BASE_DELAY,
+                                  max_delay=STATUS_UPDATE_MAX_DELAY,
+                                  deadline=STATUS_UPDATE_DEADLINE,
+                                  circuit_breaker=CircuitBreaker(CIRCUIT_FAILURE_THRESHOLD,
+                                                                 CIRCUIT_RESET_TIMEOUT))
+
+status_outbox = StatusOutbox(config.STATUS_OUTBOX_PATH,
+                             max_attempts=STATUS_OUTBOX_MAX_ATTEMPTS,
+                             max_age=STATUS_OUTBOX_MAX_AGE)
+
 ####################################################################################################
-# This function will continue to attempt to update the status of a job until sucessful (code 200)
-def updateJobStatus(job_uid, status) -> None:
+# This function attempts to update the status of a job, retrying with exponential backoff. If the
+# status cannot be delivered before the deadline it is stored in the outbox, which the scheduler
+# replays later, so the worker is freed immediately. A status the API rejects (e.g. 404, the job
+# was deleted) is not retried nor stored.
+def updateJobStatus(job_uid, status) -> bool:
     
     logger = logging.getLogger('genericInterface')
-       
+
+    # An older status of this job is still waiting in the outbox, the new one replaces it so
+    # the statuses reach the API in order
+    if status_outbox.contains(job_uid):
+        status_outbox.put(job_uid, status)
+        return False
+
     # Set up connection to database
-    atlin = Atlin(config.ATLIN_API_ADDRESS)
+    atlin = get_atlin(config.ATLIN_API_ADDRESS)
 
-    statusCode = atlin.job_set_status(job_uid, status).status_code
-    
-    while statusCode != 200:
-        logger.warning('updateJobStatus: Failed to update status. Attempting again')
-        statusCode = atlin.job_set_status(job_uid, status).status_code
-        time.sleep(1)
+    try:
+        status_retry_policy.call(atlin.job_set_status, job_uid, status)
+    except RequestRejectedError as e:
+        logger.warning('updateJobStatus: The status of job %s was not updated to %s (%s)', job_uid, status, e)
+        return False
+    except RetryError as e:
+        logger.warning('updateJobStatus: Failed to update status of job %s to %s (%s). Saved to outbox',
+                       job_uid, status, e)
+        status_outbox.put(job_uid, status)
+        return False
 
-    return
+    return True
 
 ####################################################################################################
-# A Generic Tool Interface which ensures the job status is updated correctly
+# A Generic Tool Interface which ensures the job status is updated correctly.
+# Only the job json goes in and the final status comes out, so it can be run in a worker process.
 def genericInterface(tool_func_ptr, 
                      job_json):
 
@@ -40,7 +69,9 @@ def genericInterface(tool_func_ptr,
     # Make call to tool
     job_complete_status = tool_func_ptr(job_json)
 
-    # update job status to as either SUCCESS or FAILURE
-    updateJobStatus(job_uid, job_complete_status)
+    # update job status to as either SUCCESS or FAILURE, unless the tool already delivered it
+    # (an older status still in the outbox must be replaced by it though)
+    if job_json.get(STATUS_DELIVERED_KEY) != job_complete_status or status_outbox.contains(job_uid):
+        updateJobStatus(job_uid, job_complete_status)
 
-    return
+    return job_complete_status
@@ -1,47 +1,82 @@
 from Tools.YouTubeAPI.youtube.youtube import *
 import traceback
 import Tools.YouTubeAPI.youtube.utils as utils
+from Tools.YouTubeAPI.youtube.comments import COMMENT_COLUMNS
 from Tools.YouTubeAPI.youtube.setup_logger import logger
 from atlin_api.atlin_api import YoutubeJobDetails
 import Tools.YouTubeAPI.youtube.config as config
+import Tools.YouTubeAPI.youtube.planner as planner
 import atlin_api.atlin_api.atlin as atlinAPI
 import atlin_api.atlin_api.job as atlinJob
 import atlin_api.atlin_api.token as atlinToken
+from atlin_api.atlin_api.job_update_buffer import JobUpdateBuffer
+from Scheduler.quota_ledger import get_quota_ledger, quota_day
+from Scheduler.utils import STATUS_DELIVERED_KEY
 from pathlib import Path
+import json
 import os
 import random
 from datetime import datetime
-from datetime import timedelta
 from dateutil import parser
 from zipfile import ZipFile
+import threading
 import Config as GralConfig
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 OUTPUT_DIR="OUTPUT_DATA"
 
+job_status = atlinAPI.JobStatus()
+job_platform = atlinAPI.JobPlatform()
+
 class AtlinYouTubeJob(atlinAPI.Atlin):
     def __init__(self, domain: str):
-        super().__init__(domain)
+        # Reuse the connection pool shared by the scheduler and the other interfaces
+        super().__init__(domain, session=atlinAPI.get_atlin(domain).session)
         self.token = atlinToken.YoutubeToken()
         self.job = atlinJob.Job()
+        # Changes to the job are buffered and sent together, see load_job
+        self.updates = None
+
+    def load_job(self, job):
+        self.job.from_json(job)
+        self.updates = JobUpdateBuffer(self,
+                                       self.job.job_uid,
+                                       current=self.job.to_dict(),
+                                       flush_interval=GralConfig.JOB_UPDATE_FLUSH_INTERVAL)
+
 
+class _JobContext(threading.local):
+    """Holds the job being run by the current worker.
+
+    Every worker thread (and every worker process, which gets its own copy of this
+    module) sees its own atlin_yt_job, so concurrent YouTube jobs do not overwrite
+    each other's job, token or output path.
+    """
+    atlin_yt_job = None
+    # last status set by change_job_status which reached the backend
+    delivered_job_status = None
+
+_context = _JobContext()
 
 ####################################################################################################
 def zip_directory():
 
     try:
         output_dir = os.path.join(BASE_DIR, OUTPUT_DIR)
-        job_uid = atlin_yt_job.job.job_uid
+        job_uid = _context.atlin_yt_job.job.job_uid
         job_output_directory = os.path.join(output_dir, job_uid)
 
-        zip_name = atlin_yt_job.job.job_uid + ".zip"
+        zip_name = _context.atlin_yt_job.job.job_uid + ".zip"
         zip_name_path = os.path.join(job_output_directory,zip_name)
 
+        # a job resumed after a pause wrote its XLSX/Parquet output in parts, the zip has one file
+        utils.merge_parts(job_output_directory)
+
         with ZipFile(zip_name_path, 'w') as zip_object:
             # Traverse all files in directory
             for folder_name, sub_folders, file_names in os.walk(job_output_directory):
                 for filename in file_names:
-                    if filename != zip_name:
+                    if filename != zip_name and not filename.endswith(config.CHECKPOINT_EXTENSION):
                         # Create filepath of files in directory
                         file_path = os.path.join(folder_name, filename)
                         # Add files to zip file
@@ -50,8 +85,8 @@ def zip_directory():
         if os.path.exists(zip_name_path):
             print("ZIP file created")
             # Update database with output folder
-            atlin_yt_job.job.output_path = zip_name_path
-            response = atlin_yt_job.job_update(job_uid=atlin_yt_job.job.job_uid, data=atlin_yt_job.job.to_dict())
+            _context.atlin_yt_job.job.output_path = zip_name_path
+            _context.atlin_yt_job.updates.update(output_path=zip_name_path)
         else:
             print("ZIP file not created")
             logger.debug(f"Zip file couldn't be created.")
@@ -68,32 +103,36 @@ def validate_output_dir(output_dir):
     if output_dir==None or len(output_dir)==0:
         output_dir= os.path.join(BASE_DIR, OUTPUT_DIR)
 
-    #Create a folder directory with the job_uid
-    job_uid = atlin_yt_job.job.job_uid
-    output_dir = os.path.join(output_dir,job_uid)
+    #Create a folder directory with the job_uid (a resumed job already has it)
+    job_uid = _context.atlin_yt_job.job.job_uid
+    if os.path.basename(os.path.normpath(output_dir)) != job_uid:
+        output_dir = os.path.join(output_dir,job_uid)
 
     #Check if the output directory exists, it if doesn't create it.
     if not os.path.isdir(output_dir):
         os.mkdir(output_dir)
 
     #Update database with output folder
-    atlin_yt_job.job.output_path = output_dir
-    response = atlin_yt_job.job_update(job_uid=atlin_yt_job.job.job_uid, data=atlin_yt_job.job.to_dict())
+    _context.atlin_yt_job.job.output_path = output_dir
+    _context.atlin_yt_job.updates.update(output_path=output_dir)
 
     return output_dir
 
 ####################################################################################################
 def load_job_state(state):
     try:
-        state.quota_exceeded = atlin_yt_job.job.job_detail.job_resume.quota_exceeded
-        state.api_key_valid = atlin_yt_job.job.job_detail.job_resume.api_key_valid
-        state.videos_ids = atlin_yt_job.job.job_detail.job_resume.videos_ids
-        state.comments_count = atlin_yt_job.job.job_detail.job_resume.comments_count
-        state.actions = atlin_yt_job.job.job_detail.job_resume.actions
-        state.all_videos_retrieved = atlin_yt_job.job.job_detail.job_resume.all_videos_retrieved
-        state.all_comments_retrieved = atlin_yt_job.job.job_detail.job_resume.all_comments_retrieved
-        state.error = atlin_yt_job.job.job_detail.job_resume.error
-        state.error_description = atlin_yt_job.job.job_detail.job_resume.error_description = state.error_description
+        state.quota_exceeded = _context.atlin_yt_job.job.job_detail.job_resume.quota_exceeded
+        state.api_key_valid = _context.atlin_yt_job.job.job_detail.job_resume.api_key_valid
+        state.videos_ids = _context.atlin_yt_job.job.job_detail.job_resume.videos_ids
+        state.comments_count = _context.atlin_yt_job.job.job_detail.job_resume.comments_count
+        state.videos_progress = getattr(_context.atlin_yt_job.job.job_detail.job_resume, "videos_progress", {})
+        state.comments_filename = getattr(_context.atlin_yt_job.job.job_detail.job_resume, "comments_filename", "")
+        state.plan = getattr(_context.atlin_yt_job.job.job_detail.job_resume, "plan", {})
+        state.actions = _context.atlin_yt_job.job.job_detail.job_resume.actions
+        state.all_videos_retrieved = _context.atlin_yt_job.job.job_detail.job_resume.all_videos_retrieved
+        state.all_comments_retrieved = _context.atlin_yt_job.job.job_detail.job_resume.all_comments_retrieved
+        state.error = _context.atlin_yt_job.job.job_detail.job_resume.error
+        state.error_description = _context.atlin_yt_job.job.job_detail.job_resume.error_description = state.error_description
     except:
         logger.debug("An error occurred when loading the state")
         ex = traceback.format_exc()
@@ -114,11 +153,9 @@ def serialize_datetime(obj):
 def save_job_message(msg=None):
     try:
         if msg!=None:
-            atlin_yt_job.job.job_message = msg
-            response = atlin_yt_job.job_update(job_uid=atlin_yt_job.job.job_uid, data=atlin_yt_job.job.to_dict())
-
-            if response.status_code != 200:
-                logger.debug("An error occurred when saving the msg/date")
+            _context.atlin_yt_job.job.job_message = msg
+            # Sent with the next flush (status change or end of the job)
+            _context.atlin_yt_job.updates.update(job_message=msg)
 
     except:
         ex = traceback.format_exc()
@@ -131,22 +168,27 @@ def save_job_state(state):
     job_status_completed = job_status.success
     try:
         youtube_job_details = YoutubeJobDetails()
-        youtube_job_details.job_submit = atlin_yt_job.job.job_detail.job_submit
+        youtube_job_details.job_submit = _context.atlin_yt_job.job.job_detail.job_submit
         youtube_job_details.job_resume.current_quota = state.current_quota
         youtube_job_details.job_resume.quota_exceeded = state.quota_exceeded
         youtube_job_details.job_resume.api_key_valid = state.api_key_valid
         youtube_job_details.job_resume.videos_ids = state.videos_ids
         youtube_job_details.job_resume.comments_count = state.comments_count
+        youtube_job_details.job_resume.videos_progress = state.videos_progress
+        youtube_job_details.job_resume.comments_filename = state.comments_filename
+        youtube_job_details.job_resume.plan = state.plan
         youtube_job_details.job_resume.actions = state.actions
         youtube_job_details.job_resume.all_videos_retrieved = state.all_videos_retrieved
         youtube_job_details.job_resume.all_comments_retrieved = state.all_comments_retrieved
         youtube_job_details.job_resume.error = state.error
         youtube_job_details.job_resume.error_description = state.error_description
 
-        atlin_yt_job.job.job_detail = youtube_job_details.to_dict()
+        _context.atlin_yt_job.job.job_detail = youtube_job_details.to_dict()
 
-        response = atlin_yt_job.job_update(job_uid=atlin_yt_job.job.job_uid, data=atlin_yt_job.job.to_dict())
-        if response.status_code != 200:
+        # The state is needed to resume the job, send it right away
+        _context.atlin_yt_job.updates.update(job_detail=_context.atlin_yt_job.job.job_detail.to_dict())
+        response = _context.atlin_yt_job.updates.flush()
+        if response is not None and response.status_code != 200:
             job_status_completed = job_status.failed
     except:
         ex = traceback.format_exc()
@@ -155,10 +197,146 @@ def save_job_state(state):
 
     return job_status_completed
 
+####################################################################################################
+# The comments retrieval is checkpointed next to the output, the state is saved with each checkpoint
+####################################################################################################
+def set_comments_checkpoint(yt):
+    checkpoint_name = _context.atlin_yt_job.job.job_uid + config.CHECKPOINT_EXTENSION
+    yt.comments.checkpoint_path = os.path.join(_context.atlin_yt_job.job.output_path, checkpoint_name)
+    yt.comments.on_checkpoint = save_job_state
+
+####################################################################################################
+# Units the backend reports as used today by a token (its token_quota), 0 if they were reported in a
+# previous quota day (the quota was reset since)
+####################################################################################################
+def backend_token_quota(token):
+    token_detail = token.token_detail
+    try:
+        modify_date = token_detail.get("modify_date")
+        if modify_date and quota_day(parser.parse(modify_date)) != quota_day():
+            return 0
+        return int(token_detail.get("token_quota") or 0)
+    except (TypeError, ValueError, OverflowError):
+        return 0
+
+####################################################################################################
+# The ledger counts at least the units the backend reports for the token, which may have been spent on
+# another host or before the ledger was used
+####################################################################################################
+def sync_token_quota(ledger, token):
+    ledger.sync_used(token.token_uid, job_platform.youtube, backend_token_quota(token))
+
+####################################################################################################
+# The units of the token are reserved in the quota ledger before they are spent (see State.reserve_quota).
+# The job takes over the reservation made by the scheduler when it was submitted (its estimated cost), and
+# starts with the units used or reserved today by the other jobs using the token
+####################################################################################################
+def reserve_job_quota(yt):
+    ledger = get_quota_ledger()
+    token_uid = _context.atlin_yt_job.token.token_uid
+    job_uid = _context.atlin_yt_job.job.job_uid
+    sync_token_quota(ledger, _context.atlin_yt_job.token)
+    reservation = ledger.adopt(job_uid, limit=planner.daily_quota())
+    if reservation is None:
+        reservation = ledger.reserve(token_uid, job_platform.youtube, 0, job_uid=job_uid, limit=planner.daily_quota())
+    reserved = reservation.units if reservation is not None else 0
+    yt.state.current_quota = ledger.used(token_uid, job_platform.youtube) - reserved
+    yt.state.quota_reservation = reservation
+
+####################################################################################################
+# Estimated cost (units) of a job, given as the job's json. The scheduler runs several jobs of a token at
+# the same time while their estimates fit in the token's quota
+####################################################################################################
+def estimate_job_cost(job):
+    job_detail = job["job_detail"]
+    if isinstance(job_detail, str):
+        job_detail = json.loads(job_detail)
+    job_submit = job_detail.get("job_submit", {})
+    job_resume = job_detail.get("job_resume", {})
+
+    plan = None
+    if job.get("job_status") == job_status.paused:
+        plan = job_resume.get("plan")
+    return planner.estimate_job_cost(job_submit.get("option_type", "QUERY"),
+                                     job_submit.get("actions", []),
+                                     int(job_submit.get("video_count") or config.DEFAULT_VIDEOS_TO_RETRIEVE),
+                                     plan=plan,
+                                     videos_ids=job_resume.get("videos_ids"),
+                                     pending_actions=job_resume.get("actions"))
+
+####################################################################################################
+# Adds the user's other YouTube tokens to the key pool of a job with the option token_pool, each one
+# with its own reservation in the quota ledger. Returns True if the pool has any key
+####################################################################################################
+def add_pool_keys(yt):
+    if not getattr(_context.atlin_yt_job.job.job_detail.job_submit, "token_pool", False):
+        return False
+
+    response = _context.atlin_yt_job.token_get(user_uid=_context.atlin_yt_job.job.user_uid, social_platform=job_platform.youtube)
+    if response.status_code != 200:
+        logger.debug("The tokens of the user couldn't be retrieved, the job only uses its own token.")
+        return False
+
+    ledger = get_quota_ledger()
+    job_uid = _context.atlin_yt_job.job.job_uid
+    added = False
+    for token_json in response.json():
+        try:
+            token = atlinToken.YoutubeToken(token_json)
+        except Exception as e:
+            logger.debug(f"A token of the user couldn't be added to the pool. {e}")
+            continue
+        if token.token_uid == _context.atlin_yt_job.token.token_uid:
+            continue
+        sync_token_quota(ledger, token)
+        reservation = ledger.reserve(token.token_uid, job_platform.youtube, 0, job_uid=job_uid, limit=planner.daily_quota())
+        yt.add_pool_key(token.token_detail['api_token'], ledger.used(token.token_uid, job_platform.youtube), reservation)
+        added = True
+    return added
+
+####################################################################################################
+# Records the units spent by the job with each key and releases the rest of the reservations. The
+# units committed today by the other tokens of the pool are saved, returns the ones of the job's token
+# (the units other jobs still have reserved are not reported, they may be released unspent)
+####################################################################################################
+def commit_job_quota(yt):
+    ledger = get_quota_ledger()
+    job_api_key = _context.atlin_yt_job.token.token_detail['api_token']
+    updated_quota = yt.state.current_quota
+    for api_key, (current_quota, reservation) in yt.keys_quota().items():
+        if reservation is not None:
+            reservation.commit()
+            current_quota = ledger.committed(reservation.token_uid, job_platform.youtube)
+        if api_key == job_api_key:
+            updated_quota = current_quota
+        elif reservation is not None:
+            response = _context.atlin_yt_job.token_set_quota(reservation.token_uid, job_platform.youtube, current_quota)
+            if response.status_code != 200:
+                logger.debug("An error occurred when updating the quota of a token of the pool.")
+    return updated_quota
+
+####################################################################################################
+def flush_job_updates():
+    try:
+        if _context.atlin_yt_job is not None and _context.atlin_yt_job.updates is not None:
+            response = _context.atlin_yt_job.updates.flush()
+            if response is not None and response.status_code != 200:
+                logger.debug("An error occurred when updating the job.")
+    except:
+        ex = traceback.format_exc()
+        logger.debug("An error occurred when updating the job.")
+        logger.debug(ex)
+
 ####################################################################################################
 def change_job_status(new_job_status):
-    response = atlin_yt_job.job_set_status(job_uid=atlin_yt_job.job.job_uid, job_status=new_job_status)
-    atlin_yt_job.job.job_status = new_job_status
+    # Send what was buffered before the status changes
+    flush_job_updates()
+    response = _context.atlin_yt_job.job_set_status(job_uid=_context.atlin_yt_job.job.job_uid, job_status=new_job_status, update_complete_date=False)
+    _context.atlin_yt_job.job.job_status = new_job_status
+    _context.delivered_job_status = new_job_status if response.status_code == 200 else None
+    if new_job_status == job_status.failed or new_job_status == job_status.success:
+        # complete_date goes with the next flush
+        _context.atlin_yt_job.updates.update(complete_date=_context.atlin_yt_job.job.complete_date)
     if response.status_code != 200:
         return response.status_code
 
@@ -189,13 +367,15 @@ def handle_state(yt):
             #Return zip file with results
             zip_directory()
 
+    flush_job_updates()
+
     #Save the quota
-    updated_quota = yt.state.current_quota
+    updated_quota = commit_job_quota(yt)
     print ("Updated quota: ")
     print(updated_quota)
     print ("Status: ")
     print (job_status_completed)
-    response = atlin_yt_job.token_set_quota(atlin_yt_job.token.token_uid, job_platform.youtube, updated_quota)
+    response = _context.atlin_yt_job.token_set_quota(_context.atlin_yt_job.token.token_uid, job_platform.youtube, updated_quota)
 
     if response.status_code!=200:
         logger.debug("An error occurred when updating the quota.")
@@ -211,13 +391,16 @@ def handle_new_job():
     response_list = []
 
     try:
-        yt = Youtube(atlin_yt_job.token.token_detail['api_token'], atlin_yt_job.token.token_detail['token_quota'])
+        yt = Youtube(_context.atlin_yt_job.token.token_detail['api_token'], _context.atlin_yt_job.token.token_detail['token_quota'])
         if not yt.service:
             logger.error("The YouTube service was not created. Verify if the API key is valid or if the quota usage has been exceeded")
             print(yt.state.error_description)
             job_status_completed = handle_state(yt)
             return job_status_completed
 
+        reserve_job_quota(yt)
+        if add_pool_keys(yt) and not yt.state.under_quota_limit(config.KEY_POOL_MIN_UNITS):
+            yt.rotate_key()
 
         if not yt.state.under_quota_limit():
             yt.state.quota_exceeded=True
@@ -225,25 +408,33 @@ def handle_new_job():
             job_status_completed = handle_state(yt)
             return job_status_completed
 
-        option = atlin_yt_job.job.job_detail.job_submit.option_type
-        actions = atlin_yt_job.job.job_detail.job_submit.actions
-        input = atlin_yt_job.job.job_detail.job_submit.option_value
-        extension = "xlsx"
+        option = _context.atlin_yt_job.job.job_detail.job_submit.option_type
+        actions = _context.atlin_yt_job.job.job_detail.job_submit.actions
+        input = _context.atlin_yt_job.job.job_detail.job_submit.option_value
+        extension = _context.atlin_yt_job.job.job_detail.job_submit.output_format.lower()
+        yt.comments.text_format = config.TEXT_FORMATS[_context.atlin_yt_job.job.job_detail.job_submit.text_format]
 
         #Validate path
-        atlin_yt_job.job.output_path = validate_output_dir(atlin_yt_job.job.output_path)
+        _context.atlin_yt_job.job.output_path = validate_output_dir(_context.atlin_yt_job.job.output_path)
+        set_comments_checkpoint(yt)
         yt.state.add_actions_to_state(actions)
 
+        #Quota plan of the job, the comments are added to it once the videos are known
+        number_of_videos = _context.atlin_yt_job.job.job_detail.job_submit.video_count if option == "QUERY" else 1 if option == "VIDEO" else 0
+        yt.state.plan = planner.create_plan(number_of_videos, search=(option == "QUERY"), metadata=("METADATA" in actions))
+
         if option == "VIDEO":
             for action in actions:
-                filename = atlin_yt_job.job.job_uid + "_" + action
+                filename = _context.atlin_yt_job.job.job_uid + "_" + action
                 filename = utils.get_filename(filename, extension)
                 if action == "METADATA":
                     response = yt.get_video_metadata_for_url(input)
-                    utils.save_file(response, atlin_yt_job.job.output_path, filename)
+                    utils.save_file(response, _context.atlin_yt_job.job.output_path, filename)
                 else:
-                    response = yt.get_video_comments_for_url(input)
-                    utils.save_file(response, atlin_yt_job.job.output_path, filename)
+                    # The comments are written as they are retrieved
+                    yt.state.comments_filename = filename
+                    with utils.open_record_writer(_context.atlin_yt_job.job.output_path, filename, COMMENT_COLUMNS) as writer:
+                        response = yt.get_video_comments_for_url(input, writer=writer)
 
                 response_list.append(response)
 
@@ -256,14 +447,16 @@ def handle_new_job():
 
             for action in actions:
 
-                filename = atlin_yt_job.job.job_uid + "_" + action + '_' + str(r) + '---'
+                filename = _context.atlin_yt_job.job.job_uid + "_" + action + '_' + str(r) + '---'
                 filename = utils.get_filename(filename, extension)
                 if action == "METADATA":
                     response = yt.get_videos_metadata_from_playlist(input)
-                    utils.save_file(response, atlin_yt_job.job.output_path, filename)
+                    utils.save_file(response, _context.atlin_yt_job.job.output_path, filename)
                 else:
-                    response = yt.get_videos_comments_from_playlist(input)
-                    utils.save_file(response, atlin_yt_job.job.output_path, filename)
+                    # The comments are written as they are retrieved
+                    yt.state.comments_filename = filename
+                    with utils.open_record_writer(_context.atlin_yt_job.job.output_path, filename, COMMENT_COLUMNS) as writer:
+                        response = yt.get_videos_comments_from_playlist(input, writer=writer)
 
                 # An error occurred while doing the above action or the quota exceeded we cannot continue executing actions
                 if yt.state.error or yt.state.quota_exceeded:
@@ -275,17 +468,19 @@ def handle_new_job():
         if option == "FILE":
             for action in actions:
                 if action == "METADATA":
-                    filename = atlin_yt_job.job.job_uid + "_" + action
+                    filename = _context.atlin_yt_job.job.job_uid + "_" + action
                     filename = utils.get_filename(filename, extension)
 
                     response = yt.get_videos_metadata_from_file(input)
-                    utils.save_file(response, atlin_yt_job.job.output_path, filename)
+                    utils.save_file(response, _context.atlin_yt_job.job.output_path, filename)
                 else:
-                    filename = atlin_yt_job.job.job_uid + "_" + action
+                    filename = _context.atlin_yt_job.job.job_uid + "_" + action
                     filename = utils.get_filename(filename, extension)
 
-                    response = yt.get_videos_comments_from_file(input)
-                    utils.save_file(response, atlin_yt_job.job.output_path, filename)
+                    # The comments are written as they are retrieved
+                    yt.state.comments_filename = filename
+                    with utils.open_record_writer(_context.atlin_yt_job.job.output_path, filename, COMMENT_COLUMNS) as writer:
+                        response = yt.get_videos_comments_from_file(input, writer=writer)
 
                 # An error occurred while doing the above action or the quota exceeded we cannot continue executing actions
                 if yt.state.error or yt.state.quota_exceeded:
@@ -295,12 +490,13 @@ def handle_new_job():
 
         if option == "QUERY":
 
-            videos = atlin_yt_job.job.job_detail.job_submit.video_count
+            videos = _context.atlin_yt_job.job.job_detail.job_submit.video_count
 
 
-            #We have to make sure we have quota to run the whole search
-            search_safety = config.UNITS_SEARCH_LIST * config.MAX_PAGES_SEARCHES
-            if not yt.state.under_quota_limit(search_safety):
+            #We have to make sure we have quota to run the whole search (it is kept reserved for it)
+            while not yt.state.ensure_quota(yt.state.plan["search"]) and yt.rotate_key():
+                pass
+            if not yt.state.ensure_quota(yt.state.plan["search"]):
                 yt.state.quota_exceeded = True
                 yt.state.videos_ids.append('NEW')
                 job_status_completed = handle_state(yt)
@@ -309,21 +505,25 @@ def handle_new_job():
             #r = random.randint(0, 1000)
             for action in actions:
 
-                #filename = atlin_yt_job.job.job_uid + "_" + action + '_' + str(r) + '---'
-                filename = atlin_yt_job.job.job_uid + "_" + action
+                #filename = _context.atlin_yt_job.job.job_uid + "_" + action + '_' + str(r) + '---'
+                filename = _context.atlin_yt_job.job.job_uid + "_" + action
                 filename = utils.get_filename(filename, extension)
 
                 if action == "METADATA":
                     response = yt.get_videos_metadata_from_query(input, videos)
-                    utils.save_file(response, atlin_yt_job.job.output_path, filename)
+                    utils.save_file(response, _context.atlin_yt_job.job.output_path, filename)
                 else:
-                    response = yt.get_videos_comments_from_query(input, videos)
-                    utils.save_file(response, atlin_yt_job.job.output_path, filename)
+                    # The comments are written as they are retrieved
+                    yt.state.comments_filename = filename
+                    with utils.open_record_writer(_context.atlin_yt_job.job.output_path, filename, COMMENT_COLUMNS) as writer:
+                        response = yt.get_videos_comments_from_query(input, videos, writer=writer)
 
                 # An error occurred while doing the above action or the quota exceeded we cannot continue executing actions
                 if yt.state.error or yt.state.quota_exceeded:
                     break
             response_list.append(response)
+
+        continue_with_pool_keys(yt, extension)
     except:
         ex = traceback.format_exc()
         st = utils.log_format("handle_new_job", ex)
@@ -338,49 +538,75 @@ def handle_new_job():
 
 
 
+####################################################################################################
+# Continues the actions of the job which were not completed (from its state)
+####################################################################################################
+def continue_job(yt, extension):
+    #Resume retrieving videos
+    if len(yt.state.actions)>0 and (config.ACTION_RETRIEVE_VIDEOS in yt.state.actions):
+        videos_ids = yt.state.videos_ids
+        if videos_ids:
+            # Get data from YouTube API
+            response = yt.videos.get_videos_and_videocreators(videos_ids)
+            filename = _context.atlin_yt_job.job.job_uid + "_" + "METADATA"
+            filename = utils.get_filename(filename, extension)
+            utils.save_file(response, _context.atlin_yt_job.job.output_path, filename)
+
+    # Resume retrieving comments
+    if len(yt.state.actions) > 0 and (config.ACTION_RETRIEVE_COMMENTS in yt.state.actions) and (not yt.state.error) and (not yt.state.quota_exceeded):
+        videos_ids = yt.state.videos_ids
+        if videos_ids:
+            # Get data from YouTube API, the comments are added to the file of the previous run(s)
+            filename = yt.state.comments_filename
+            if not filename:
+                filename = _context.atlin_yt_job.job.job_uid + "_" + "COMMENTS"
+                filename = utils.get_filename(filename, extension)
+                yt.state.comments_filename = filename
+            with utils.open_record_writer(_context.atlin_yt_job.job.output_path, filename, COMMENT_COLUMNS, append=True) as writer:
+                yt.comments.get_comments_and_commenters(videos_ids, writer=writer)
+
+####################################################################################################
+# A job with the option token_pool uses the user's other YouTube tokens when the quota of its token
+# runs out: the job continues, from where it stopped, with the next key of the pool
+####################################################################################################
+def continue_with_pool_keys(yt, extension):
+    while yt.state.quota_exceeded and "NEW" not in yt.state.videos_ids and yt.rotate_key():
+        yt.state.error = False
+        yt.state.error_description = ""
+        yt.state.quota_exceeded = False
+        continue_job(yt, extension)
+
 ####################################################################################################
 #
 ####################################################################################################
 def resume_job():
     response_list = []
     try:
-        yt = Youtube(atlin_yt_job.token.token_detail['api_token'], atlin_yt_job.token.token_detail['token_quota'])
+        yt = Youtube(_context.atlin_yt_job.token.token_detail['api_token'], _context.atlin_yt_job.token.token_detail['token_quota'])
         if not yt.service:
             logger.error("The YouTube service was not created. Verify if the API key is valid or if the quota usage has been exceeded")
             print(yt.state.error_description)
             handle_state(yt)
             return response_list
 
+        reserve_job_quota(yt)
         yt.state = load_job_state(yt.state)
         yt.state.error = False
         yt.state.error_description = ""
         yt.state.quota_exceeded = False
-        extension = "xlsx"
+        extension = _context.atlin_yt_job.job.job_detail.job_submit.output_format.lower()
+        yt.comments.text_format = config.TEXT_FORMATS[_context.atlin_yt_job.job.job_detail.job_submit.text_format]
 
         #Validate path
-        #atlin_yt_job.job.output_path = "/Users/jazminromero/development/AtlinProject/Output/YouTube"
-        atlin_yt_job.job.output_path = validate_output_dir(atlin_yt_job.job.output_path)
+        #_context.atlin_yt_job.job.output_path = "/Users/jazminromero/development/AtlinProject/Output/YouTube"
+        _context.atlin_yt_job.job.output_path = validate_output_dir(_context.atlin_yt_job.job.output_path)
+        set_comments_checkpoint(yt)
 
+        if add_pool_keys(yt) and not yt.state.under_quota_limit(config.KEY_POOL_MIN_UNITS):
+            yt.rotate_key()
 
-        #Resume retrieving videos
-        if len(yt.state.actions)>0 and (config.ACTION_RETRIEVE_VIDEOS in yt.state.actions):
-            videos_ids = yt.state.videos_ids
-            if videos_ids:
-                # Get data from YouTube API
-                response = yt.videos.get_videos_and_videocreators(videos_ids)
-                filename = atlin_yt_job.job.job_uid + "_" + "METADATA"
-                filename = utils.get_filename(filename, extension)
-                utils.save_file(response, atlin_yt_job.job.output_path, filename)
-
-        # Resume retrieving comments
-        if len(yt.state.actions) > 0 and (config.ACTION_RETRIEVE_COMMENTS in yt.state.actions) and (not yt.state.error) and (not yt.state.quota_exceeded):
-            videos_ids = yt.state.videos_ids
-            if videos_ids:
-                # Get data from YouTube API
-                response = yt.comments.get_comments_and_commenters(videos_ids)
-                filename = atlin_yt_job.job.job_uid + "_" + "COMMENTS"
-                filename = utils.get_filename(filename, extension)
-                utils.save_file(response, atlin_yt_job.job.output_path, filename)
+        continue_job(yt, extension)
+        continue_with_pool_keys(yt, extension)
     except:
         ex = traceback.format_exc()
         st = utils.log_format("resume_job", ex)
@@ -407,12 +633,12 @@ def extract_jobs(response):
 ####################################################################################################
 def retrieving_token():
     # Get token information (api token and quota)
-    token_uid = atlin_yt_job.job.token_uid
-    response = atlin_yt_job.token_get(token_uid=token_uid)
+    token_uid = _context.atlin_yt_job.job.token_uid
+    response = _context.atlin_yt_job.token_get(token_uid=token_uid)
     retrieved = True
     if response.status_code == 200:
         try:
-            atlin_yt_job.token.from_json(response.json())
+            _context.atlin_yt_job.token.from_json(response.json())
         except Exception as e:
             logger.debug(f"API Token could not been fetch {e}")
             save_job_message(msg=f"API Token could not been fetch {e}")
@@ -448,7 +674,7 @@ def is_24hrs_pass_old():
 
     execute = True
 
-    str_modify_date_local = to_local_zone(atlin_yt_job.job.modify_date)
+    str_modify_date_local = to_local_zone(_context.atlin_yt_job.job.modify_date)
     dt_modify_date_local =  datetime.strptime(str_modify_date_local, "%Y-%m-%dT%H:%M:%S.%fZ")
     print (dt_modify_date_local)
 
@@ -466,48 +692,14 @@ def is_24hrs_pass_old():
     return execute
 
 ####################################################################################################
-#
-####################################################################################################
-def has_quota_reset():
-
-
-    execute = True
-
-    #Get modify date in local zone
-    str_modify_date_local = to_local_zone(atlin_yt_job.job.modify_date)
-    dt_modify_date_local =  datetime.strptime(str_modify_date_local, "%Y-%m-%dT%H:%M:%S.%fZ")
-
-    #Set reset date
-    reset_date = dt_modify_date_local + timedelta(days=1)
-    rd = reset_date.replace(hour=4, minute=0, second=0, microsecond=0)
-
-    #Get current date (local zone)
-    current_date = datetime.now()
-    print ("Current date: ")
-    print (current_date)
-
-    #Difference between current date and reset date
-    delta = current_date - rd
-
-    if delta.total_seconds()<60:
-        execute = False
-        print ("The quota hasn't been reset.")
-
-    return execute
-
-####################################################################################################
-#
+# The scheduler submits a paused job once the quota was reset after it was paused (see
+# Scheduler/wait_queue.py), the job continues where it stopped or starts again if it never started
 ####################################################################################################
 def handle_paused_jobs():
-    execute = has_quota_reset()
-
-    if execute:
-        if "NEW" in atlin_yt_job.job.job_detail.job_resume.videos_ids:
-            job_status_completed = handle_new_job()
-        else:
-            job_status_completed = resume_job()
+    if "NEW" in _context.atlin_yt_job.job.job_detail.job_resume.videos_ids:
+        job_status_completed = handle_new_job()
     else:
-        job_status_completed = "PAUSED"
+        job_status_completed = resume_job()
 
     return job_status_completed
 
@@ -521,15 +713,10 @@ def YouTubeInterface(job):
         logger.info('Creating API class')
         print ("Starting job...")
 
-        global atlin_yt_job
-        atlin_yt_job= AtlinYouTubeJob(GralConfig.ATLIN_API_ADDRESS)
-        global job_status
-        job_status = atlinAPI.JobStatus()
-
-        global job_platform
-        job_platform = atlinAPI.JobPlatform()
+        _context.atlin_yt_job= AtlinYouTubeJob(GralConfig.ATLIN_API_ADDRESS)
+        _context.delivered_job_status = None
 
-        atlin_yt_job.job.from_json(job)
+        _context.atlin_yt_job.load_job(job)
         logger.info('Performing YouTube job:')
         logger.info(job)
 
@@ -540,17 +727,20 @@ def YouTubeInterface(job):
         if not retrieved_token:
             return job_status.failed
 
-        if atlin_yt_job.job.job_status == "CREATED":
+        if _context.atlin_yt_job.job.job_status == "CREATED":
             print("Created job...")
-            atlin_yt_job.job.job_status = "RUNNING"
+            _context.atlin_yt_job.job.job_status = "RUNNING"
             job_status_completed = handle_new_job()
-        elif atlin_yt_job.job.job_status == "PAUSED":
+        elif _context.atlin_yt_job.job.job_status == "PAUSED":
             print("Paused job...")
-            atlin_yt_job.job.job_status = "RUNNING"
+            _context.atlin_yt_job.job.job_status = "RUNNING"
             job_status_completed = handle_paused_jobs()
 
         print('Job status...')
         print (job_status_completed)
+        # the status was sent by change_job_status and complete_date goes with the last flush
+        if job_status_completed == _context.delivered_job_status:
+            job[STATUS_DELIVERED_KEY] = job_status_completed
         return job_status_completed
     except:
         ex = traceback.format_exc()
@@ -559,4 +749,6 @@ def YouTubeInterface(job):
         logger.debug(msg)
         save_job_message(msg =f"An exception occurred when executing the job {ex}")
         return job_status.failed
+    finally:
+        flush_job_updates()
 
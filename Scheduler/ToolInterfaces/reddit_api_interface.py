@@ -9,29 +9,79 @@ Returns:
     _type_: _description_
 """
 
+from datetime import datetime, timezone
 import logging
 import os
 
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
 from Tools.RedditAPITool.reddit_api_session import RedditAPISession
 from Tools.RedditAPITool.reddit_constants import RedditConstants as constants
 
-from atlin_api.atlin_api import Atlin, JobStatus
+from atlin_api.atlin_api import get_atlin, JobStatus
+from Scheduler.quota_ledger import get_quota_ledger, QuotaReservation
 import Config as config
 
 #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
-def update_quota(job_json, quota_used) -> None:
-    """update the quota available to the token
+def estimate_requests(job_dict : dict) -> int:
+    """number of requests RedditAPISession sends to complete the job
 
     Args:
-        job_json (_type_): dictionary describing the job
-        quota_used (_type_): amount of quota used
+        job_dict (dict): job dict for RedditAPISession
+
+    Returns:
+        int: number of requests
+    """
+    n_responses = job_dict[constants.REDDIT_JOB_DETAIL_N]
+    if n_responses == '':
+        return 1
+
+    return int(n_responses) // constants.MAX_NUM_RESPONSES_PER_REQUEST + 1
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+def reserve_quota(job_json : dict,
+                  job_dict : dict) -> QuotaReservation:
+    """reserve the requests of the job in the quota ledger before they are sent
+
+    Args:
+        job_json (dict): dictionary describing the job
+        job_dict (dict): job dict for RedditAPISession
+
+    Returns:
+        QuotaReservation: the reservation, None if the token has not enough quota left
+    """
+    return get_quota_ledger().reserve(job_json['token_uid'],
+                                      'REDDIT',
+                                      estimate_requests(job_dict),
+                                      job_uid=job_json['job_uid'])
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+def update_quota(job_json : dict,
+                 reservation : QuotaReservation,
+                 quota_used : int) -> None:
+    """commit the quota used by the job in the quota ledger and update the quota used
+    today by the token in the database
+
+    Args:
+        job_json (dict): dictionary describing the job
+        reservation (QuotaReservation): reservation of the job
+        quota_used (int): amount of quota used
     """
     try:
         token_uid = job_json['token_uid']
 
-        atlin_session = Atlin(config.ATLIN_API_ADDRESS)
-        atlin_session.token_set_quota(token_uid, 'REDDIT', quota_used)
+        reservation.take(quota_used, force=True)
+        reservation.commit()
+
+        atlin_session = get_atlin(config.ATLIN_API_ADDRESS)
+        atlin_session.token_set_quota(token_uid, 'REDDIT', get_quota_ledger().committed(token_uid, 'REDDIT'))
 
     except Exception as e:
         raise e
@@ -54,7 +104,7 @@ def update_output_path(job_json : dict,
     logger = logging.getLogger('RedditInterface')
 
     try:
-        atlin_session = Atlin(config.ATLIN_API_ADDRESS)
+        atlin_session = get_atlin(config.ATLIN_API_ADDRESS)
 
         job_json['output_path'] = output_path
         job_json['job_status'] = "RUNNING"
@@ -84,7 +134,7 @@ def update_job_msg(job_json : dict,
     logger = logging.getLogger('RedditInterface')
 
     try:
-        atlin_session = Atlin(config.ATLIN_API_ADDRESS)
+        atlin_session = get_atlin(config.ATLIN_API_ADDRESS)
 
         job_json['job_message'] = job_msg
 
@@ -138,7 +188,7 @@ def get_credentials_dict_from_db(job_json) -> dict:
         dict: dictionary in the DB format
     """
     # Make the get request to the API
-    atlin_session = Atlin(config.ATLIN_API_ADDRESS)
+    atlin_session = get_atlin(config.ATLIN_API_ADDRESS)
     atlin_response = None
     try :
         atlin_response = atlin_session.token_get(   user_uid=job_json['user_uid'],
@@ -409,6 +459,112 @@ def get_job_dict(job_json : dict) -> dict:
 
 #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
+def response_rows(list_of_responses : list):
+    """flatten the scraped responses into one row per post and per comment (replies included)
+
+    Args:
+        list_of_responses (list): RedditScrapeResponse objects
+
+    Yields:
+        dict: row with the columns of parquet_schema()
+    """
+
+    def comment_rows(response_number, comment, parent_id):
+        yield { 'response' : response_number,
+                'type' : 'comment',
+                'id' : comment.id,
+                'parent_id' : parent_id,
+                'depth' : comment.depth,
+                'author' : comment.author,
+                'author_fullname' : comment.author_fullname,
+                'text' : comment.body}
+
+        for reply in comment.replies:
+            yield from comment_rows(response_number, reply, comment.id)
+
+    for response_number, resp in enumerate(list_of_responses):
+        post_id = None
+
+        if resp.post_data is not None:
+            post = resp.post_data
+            post_id = post.id
+            yield { 'response' : response_number,
+                    'type' : 'post',
+                    'id' : post.id,
+                    'subreddit' : post.subreddit,
+                    'author' : post.author,
+                    'author_fullname' : post.author_fullname,
+                    'title' : post.title,
+                    'text' : post.selftext,
+                    'upvote_ratio' : post.upvote_ratio,
+                    'ups' : post.ups,
+                    'downs' : post.downs,
+                    'score' : post.score,
+                    'view_count' : post.view_count,
+                    'num_comments' : post.num_comments,
+                    'created_utc' : datetime.fromtimestamp(post.created_utc, tz=timezone.utc)
+                                    if post.created_utc is not None else None}
+
+        for comment in resp.comments:
+            yield from comment_rows(response_number, comment, post_id)
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+def parquet_schema():
+    """typed columns of the parquet output
+
+    Returns:
+        pa.Schema: schema of the rows generated by response_rows
+    """
+    return pa.schema([  ('response', pa.int32()),
+                        ('type', pa.string()),
+                        ('id', pa.string()),
+                        ('parent_id', pa.string()),
+                        ('depth', pa.int32()),
+                        ('subreddit', pa.string()),
+                        ('author', pa.string()),
+                        ('author_fullname', pa.string()),
+                        ('title', pa.string()),
+                        ('text', pa.string()),
+                        ('upvote_ratio', pa.float64()),
+                        ('ups', pa.int64()),
+                        ('downs', pa.int64()),
+                        ('score', pa.int64()),
+                        ('view_count', pa.int64()),
+                        ('num_comments', pa.int64()),
+                        ('created_utc', pa.timestamp('s', tz='UTC'))])
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+def save_responses_parquet(file_path : str,
+                           list_of_responses : list) -> None:
+    """write the scraped data to a compressed parquet file, in row groups
+
+    Args:
+        file_path (str): path of the parquet file
+        list_of_responses (list): RedditScrapeResponse objects
+
+    Raises:
+        ImportError: pyarrow is not installed
+    """
+    if pa is None:
+        raise ImportError('The PARQUET output format requires the pyarrow package.')
+
+    schema = parquet_schema()
+    rows = []
+
+    with pq.ParquetWriter(file_path, schema, compression=constants.PARQUET_COMPRESSION) as writer:
+        for row in response_rows(list_of_responses):
+            rows.append(row)
+            if len(rows) >= constants.PARQUET_ROW_GROUP_SIZE:
+                writer.write_table(pa.Table.from_pylist(rows, schema=schema))
+                rows = []
+
+        # an empty file still has the schema
+        writer.write_table(pa.Table.from_pylist(rows, schema=schema))
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
 def save_responses(job_json, list_of_responses) -> bool:
     """save the scraped data to a output folder previously generated.
 
@@ -423,8 +579,17 @@ def save_responses(job_json, list_of_responses) -> bool:
 
     folder_path = job_json['output_path']
 
+    output_format = job_json['job_detail']['job_submit'].get('output_format', constants.OUTPUT_FORMAT_TEXT)
+
     # check if the file path exists and is accessbile then write the listOfResponses_ to the file
-    if os.path.exists(folder_path):
+    if os.path.exists(folder_path) and output_format == constants.OUTPUT_FORMAT_PARQUET:
+
+        file_path = os.path.join(folder_path, job_json['job_name']+'.parquet')
+        save_responses_parquet(file_path, list_of_responses)
+
+        success_flag = True
+
+    elif os.path.exists(folder_path):
 
         file_path = os.path.join(folder_path, job_json['job_name']+'.json')
         file = open(file_path, "w", encoding='utf-8')
@@ -470,6 +635,13 @@ def reddit_interface(job_json : dict) -> JobStatus:
     if job_dict is not None:
         logger.info('job_dict: %s', job_dict)
 
+        # the requests are reserved before they are sent
+        reservation = reserve_quota(job_json, job_dict)
+        if reservation is None:
+            logger.error('Job not run: not enough quota left for the token.')
+            update_job_msg(job_json, 'There isn\'t enough quota to complete this request.')
+            return a_job_status
+
         credentials_dict = get_credentials_dict(job_json)
 
         # create an output directory to store the collected data in
@@ -491,12 +663,12 @@ def reddit_interface(job_json : dict) -> JobStatus:
                 logging.error('Unable to save job.')
                 a_job_status = JobStatus().failed
 
-            # update quota used
-            update_quota(job_json, session.number_of_requests)
-
         else:
             logger.error('Job completed: FAILED.')
 
+        # update quota used, the requests sent count even if the job failed
+        update_quota(job_json, reservation, session.number_of_requests)
+
         # update the job_message with the message returned form RedditAPISession
         update_job_msg(job_json, session.job_msg)
 
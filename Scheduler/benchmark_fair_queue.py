@@ -0,0 +1,251 @@
+""" Simulation of the order in which the JobScheduler gives workers to the jobs of the users.
+
+It replays a workload in the format of TestingFiles/jobs.csv (one job per row, no header),
+optionally flooded by one user submitting many jobs at once, first with the jobs ordered
+by creation date (FIFO) and then with the FairQueue, and reports the tail of the time the
+jobs waited for a worker, overall and per user.
+
+The simulated scheduler follows _select_jobs: at most max_workers jobs run, each platform
+has its concurrency limit and a token runs one job at a time. Jobs are started as soon as a
+worker is free (no polling delay) and last a random (exponential, seeded) time.
+
+Usage: python Scheduler/benchmark_fair_queue.py [--jobs TestingFiles/jobs.csv] [--flood 200]
+"""
+import argparse
+import csv
+from datetime import datetime, timedelta
+import heapq
+import math
+import random
+
+from pathlib import Path
+import sys
+
+BASE_DIR = Path(__file__).resolve().parent.parent.as_posix()
+sys.path.insert(0, BASE_DIR)
+
+from dateutil import parser
+
+from Scheduler.fair_queue import FairQueue
+from Scheduler.utils import MAX_WORKERS, PLATFORM_CONCURRENCY_LIMITS, YOUTUBE_JOB
+
+# columns of TestingFiles/jobs.csv
+JOB_UID, USER_UID, TOKEN_UID, CREATE_DATE = 0, 1, 2, 3
+SOCIAL_PLATFORM, JOB_TAG = 7, 8
+
+FLOOD_USER_UID = 'flood-user'
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+def load_workload(path : str,
+                  speedup : float) -> tuple[list, datetime]:
+    """Read the jobs of a jobs.csv file
+
+    Args:
+        path (str): csv file, one job per row
+        speedup (float): the time between two submissions is divided by speedup
+
+    Returns:
+        tuple[list, datetime]: jobs (with their arrival in seconds after the first one),
+                               creation date of the first job
+    """
+    with open(path, newline='', encoding='utf-8') as jobs_file:
+        rows = [row for row in csv.reader(jobs_file) if len(row) > SOCIAL_PLATFORM]
+
+    create_dates = [parser.parse(row[CREATE_DATE]) for row in rows]
+    start = min(create_dates)
+
+    jobs = []
+    for row, create_date in zip(rows, create_dates):
+        jobs.append({'job_uid' : row[JOB_UID],
+                     'user_uid' : row[USER_UID],
+                     'token_uid' : row[TOKEN_UID],
+                     'social_platform' : row[SOCIAL_PLATFORM],
+                     'job_tag' : row[JOB_TAG],
+                     'arrival' : (create_date - start).total_seconds() / speedup})
+
+    return jobs, start
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+def flood_workload(count : int,
+                   tokens : int,
+                   platform : str) -> list:
+    """Jobs of one user submitting count jobs at the start of the workload
+
+    Args:
+        count (int): number of jobs
+        tokens (int): number of tokens the jobs are spread over
+        platform (str): social platform of the jobs
+
+    Returns:
+        list: jobs
+    """
+    return [{'job_uid' : f'flood-{index}',
+             'user_uid' : FLOOD_USER_UID,
+             'token_uid' : f'flood-token-{index % tokens}',
+             'social_platform' : platform,
+             'job_tag' : '',
+             'arrival' : 0.0} for index in range(count)]
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+def simulate(jobs : list,
+             start : datetime,
+             order_jobs,
+             charge_job,
+             max_workers : int,
+             platform_limits : dict) -> dict:
+    """Run the workload through a simulated scheduler
+
+    Args:
+        jobs (list): jobs with their arrival and duration in seconds
+        start (datetime): date of the arrival 0
+        order_jobs (Callable): (waiting jobs, now) -> jobs in the order they get a worker
+        charge_job (Callable): called with every started job
+        max_workers (int): number of workers
+        platform_limits (dict): maximum number of running jobs per platform
+
+    Returns:
+        dict: job_uid -> seconds the job waited for a worker
+    """
+    arrivals = sorted(jobs, key=lambda job: job['arrival'], reverse=True)
+    waiting = []
+    running = []
+    used_token_ids = set()
+    platform_counts = {}
+    waits = {}
+    now = 0.0
+
+    while arrivals or waiting:
+        next_times = [end for end, _, _ in running[:1]]
+        if arrivals:
+            next_times.append(arrivals[-1]['arrival'])
+        now = max(now, min(next_times))
+
+        while arrivals and arrivals[-1]['arrival'] <= now:
+            job = arrivals.pop()
+            job['create_date'] = (start + timedelta(seconds=job['arrival'])).isoformat(timespec='microseconds')
+            waiting.append(job)
+
+        while running and running[0][0] <= now:
+            _, _, job = heapq.heappop(running)
+            used_token_ids.discard(job['token_uid'])
+            platform_counts[job['social_platform']] -= 1
+
+        started = set()
+        for job in order_jobs(waiting, start + timedelta(seconds=now)):
+            if len(running) >= max_workers:
+                break
+            platform = job['social_platform']
+            if job['token_uid'] in used_token_ids or platform_counts.get(platform, 0) >= platform_limits.get(platform, max_workers):
+                continue
+
+            used_token_ids.add(job['token_uid'])
+            platform_counts[platform] = platform_counts.get(platform, 0) + 1
+            heapq.heappush(running, (now + job['duration'], job['job_uid'], job))
+            charge_job(job)
+            waits[job['job_uid']] = now - job['arrival']
+            started.add(job['job_uid'])
+
+        waiting = [job for job in waiting if job['job_uid'] not in started]
+
+        if waiting and not running and not arrivals:
+            raise RuntimeError(f'{len(waiting)} job(s) can never run with these limits')
+
+    return waits
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+def percentile(values : list,
+               percent : float) -> float:
+    """Nearest rank percentile
+
+    Args:
+        values (list): numbers
+        percent (float): 0 to 100
+
+    Returns:
+        float: the value below which percent of the values are
+    """
+    values = sorted(values)
+    rank = max(math.ceil(percent / 100 * len(values)), 1)
+    return values[rank - 1]
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+def report(policy : str,
+           jobs : list,
+           waits : dict) -> None:
+    """Print the wait times of a run, in minutes
+
+    Args:
+        policy (str): name of the order the jobs were run in
+        jobs (list): jobs of the workload
+        waits (dict): job_uid -> seconds waited
+    """
+    groups = {'all users' : list(waits.values())}
+    for job in jobs:
+        groups.setdefault(job['user_uid'], []).append(waits[job['job_uid']])
+
+    print(f'\n{policy}')
+    print(f'  {"user":<38} {"jobs":>5} {"p50":>8} {"p95":>8} {"p99":>8} {"max":>8}')
+    for user_uid, user_waits in groups.items():
+        minutes = [wait / 60 for wait in user_waits]
+        print(f'  {user_uid:<38} {len(minutes):>5} {percentile(minutes, 50):>8.1f} {percentile(minutes, 95):>8.1f} '
+              f'{percentile(minutes, 99):>8.1f} {max(minutes):>8.1f}')
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+def main():
+    """
+    Replay the workload with both orders and report the wait times
+    """
+    argument_parser = argparse.ArgumentParser(description='Tail wait times of the jobs, FIFO against fair share')
+    argument_parser.add_argument('--jobs', default=str(Path(BASE_DIR) / 'TestingFiles' / 'jobs.csv'),
+                                 help='csv file in the format of TestingFiles/jobs.csv')
+    argument_parser.add_argument('--speedup', type=float, default=1.0,
+                                 help='divide the time between two submissions by this factor')
+    argument_parser.add_argument('--flood', type=int, default=200,
+                                 help='number of jobs one more user submits at the start')
+    argument_parser.add_argument('--flood-tokens', type=int, default=4,
+                                 help='number of tokens the flooding user spreads its jobs over')
+    argument_parser.add_argument('--flood-platform', default=YOUTUBE_JOB,
+                                 help='social platform of the flooding jobs')
+    argument_parser.add_argument('--duration', type=float, default=600,
+                                 help='mean duration of a job in seconds')
+    argument_parser.add_argument('--workers', type=int, default=MAX_WORKERS)
+    argument_parser.add_argument('--seed', type=int, default=0)
+    args = argument_parser.parse_args()
+
+    jobs, start = load_workload(args.jobs, args.speedup)
+    if args.flood > 0:
+        jobs = jobs + flood_workload(args.flood, args.flood_tokens, args.flood_platform)
+
+    # the same durations are used for both orders
+    generator = random.Random(args.seed)
+    for job in jobs:
+        job['duration'] = generator.expovariate(1 / args.duration)
+
+    print(f'{len(jobs)} jobs of {len({job["user_uid"] for job in jobs})} users, {args.workers} workers, '
+          f'mean duration {args.duration / 60:.1f} min')
+
+    fifo_waits = simulate([dict(job) for job in jobs],
+                          start,
+                          lambda waiting, now: sorted(waiting, key=lambda job: job['create_date']),
+                          lambda job: None,
+                          args.workers,
+                          PLATFORM_CONCURRENCY_LIMITS)
+    report('FIFO (create_date)', jobs, fifo_waits)
+
+    fair_queue = FairQueue()
+    fair_waits = simulate([dict(job) for job in jobs],
+                          start,
+                          fair_queue.order,
+                          fair_queue.charge,
+                          args.workers,
+                          PLATFORM_CONCURRENCY_LIMITS)
+    report('Fair share (FairQueue)', jobs, fair_waits)
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,6 @@
 """ This script is used to clean up data file generated by the atlin project.
 """
+import asyncio
 import time
 from datetime import datetime
 import os
@@ -15,7 +16,7 @@ BASE_DIR = Path(__file__).resolve().parent.parent.as_posix()
 sys.path.insert(0, BASE_DIR)
 
 import Config as config
-from atlin_api.atlin_api import Atlin, JobStatus
+from atlin_api.atlin_api import get_atlin, AsyncAtlin, JobStatus
 
 #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
@@ -53,7 +54,7 @@ def get_successful_jobs() -> list:
         list: return a list of api responses
     """
     # start a session with the backend API
-    atlin_session = Atlin(config.ATLIN_API_ADDRESS)
+    atlin_session = get_atlin(config.ATLIN_API_ADDRESS)
 
     response = None
 
@@ -104,22 +105,21 @@ def passed_delete_date(delta_time : float) -> bool:
 
 #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
-def set_job_status( job_uid : str,
-                    job_status : JobStatus) -> None:
+async def set_job_status(  atlin_session : AsyncAtlin,
+                            job_uid : str,
+                            job_status : JobStatus) -> None:
     """ Sets the status of a job in the db
 
     Args: Sets status of job with id 'job_uid' to 'status
+        atlin_session (AsyncAtlin): session with the backend API
         job_uid (str): uid of job in data base
         job_status (JobStatus): change job status to
 
     Raises:
         e: exception raised by atlin api accessing backend
     """
-    # start a session with the backend API
-    atlin_session = Atlin(config.ATLIN_API_ADDRESS)
-
     try:
-        atlin_session.job_set_status(job_uid, job_status)
+        await atlin_session.job_set_status(job_uid, job_status)
     except Exception as e:
         raise e
 
@@ -148,15 +148,17 @@ def delete_output_data(output_path : str) -> None:
 
 #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
-def delete_job(job : dict) -> None:
+async def delete_job(atlin_session : AsyncAtlin,
+                     job : dict) -> None:
     """Handles the detection of a job
 
     Args:
+        atlin_session (AsyncAtlin): session with the backend API
         job (dict): dictionary representation of db row
     """
     try:
-        delete_output_data(job['output_path'])
-        set_job_status(job['job_uid'], JobStatus.deleted)
+        await asyncio.to_thread(delete_output_data, job['output_path'])
+        await set_job_status(atlin_session, job['job_uid'], JobStatus.deleted)
     except Exception as e:
         raise e
 
@@ -164,6 +166,22 @@ def delete_job(job : dict) -> None:
 
 #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
+async def delete_jobs(job_list : list) -> list:
+    """Deletes all the jobs in job_list at once, sharing one connection pool to the
+    backend API
+
+    Args:
+        job_list (list): list of dictionary representations of db rows
+
+    Returns:
+        list: None for each deleted job or the exception raised deleting it
+    """
+    async with AsyncAtlin(config.ATLIN_API_ADDRESS) as atlin_session:
+        return await asyncio.gather(*(delete_job(atlin_session, job) for job in job_list),
+                                    return_exceptions=True)
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
 def main():
     """Removes data files if they are passed expiration date and updates
     the db accordingly
@@ -174,21 +192,24 @@ def main():
     done_job_list = get_successful_jobs()
     logging.info('Found %d successful job(s)', len(done_job_list))
 
-    for job in done_job_list:
-
-        delta_time = time_since_completed(job)
-        if passed_delete_date(delta_time):
-            try:
-                delete_job(job)
-                logging.info('Delete job %s', job['job_uid'])
-            except (ConnectionError, Timeout) as e:
-                logging.error('A connection error or timeout occurred: %s', e)
-            except HTTPError as e:
-                logging.error('HTTP Error: %s', e)
-            except RequestException as e:
-                logging.error('An error occurred: %s',e)
-            except OSError as e:
-                logging.error('Unable to delete data files: %s', e)
+    expired_job_list = [job for job in done_job_list
+                        if passed_delete_date(time_since_completed(job))]
+
+    results = asyncio.run(delete_jobs(expired_job_list))
+
+    for job, result in zip(expired_job_list, results):
+        try:
+            if result is not None:
+                raise result
+            logging.info('Delete job %s', job['job_uid'])
+        except (ConnectionError, Timeout) as e:
+            logging.error('A connection error or timeout occurred: %s', e)
+        except HTTPError as e:
+            logging.error('HTTP Error: %s', e)
+        except RequestException as e:
+            logging.error('An error occurred: %s',e)
+        except OSError as e:
+            logging.error('Unable to delete data files: %s', e)
 
 #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
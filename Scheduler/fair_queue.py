@@ -0,0 +1,210 @@
+""" The FairQueue orders the runnable jobs so the workers are shared fairly between users.
+
+Users are served in weighted round robin (stride scheduling): every job a user starts
+advances the user's pass by 1 / weight and the next worker goes to the user with the
+lowest pass. A user who submits 200 jobs gets the same share of the workers as a user who
+submits one, instead of every worker until the 200 jobs are done. A user who starts waiting
+(again) starts at the pass of the least served waiting user, so the time it was idle gives
+it no credit over the others.
+
+The jobs of a user are ordered by priority, read from their job_tag (see
+JOB_TAG_PRIORITIES), and by age: a job gains one priority level for every
+JOB_AGING_INTERVAL seconds it waits, so the new high priority jobs of a user can not
+hold its older jobs back forever.
+"""
+from collections import deque
+from datetime import datetime, timezone
+import heapq
+import re
+import threading
+from typing import List
+
+from dateutil import parser
+
+from Scheduler.utils import USER_WEIGHTS, DEFAULT_USER_WEIGHT, JOB_TAG_PRIORITIES, JOB_AGING_INTERVAL
+
+TAG_SEPARATORS = re.compile(r'[\s,;]+')
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+class FairQueue:
+    """Weighted round robin of the users' jobs, with priorities and aging within a user
+    """
+
+    def __init__(self,
+                 user_weights : dict = None,
+                 default_weight : float = DEFAULT_USER_WEIGHT,
+                 tag_priorities : dict = None,
+                 aging_interval : float = JOB_AGING_INTERVAL):
+
+        if user_weights is None:
+            user_weights = USER_WEIGHTS
+        self._user_weights = dict(user_weights)
+        self._default_weight = default_weight
+
+        if tag_priorities is None:
+            tag_priorities = JOB_TAG_PRIORITIES
+        self._tag_priorities = {tag.lower(): priority for tag, priority in tag_priorities.items()}
+
+        self._aging_interval = aging_interval
+
+        # user_uid -> pass, the jobs started by the user divided by its weight. Users which
+        # are not waiting are forgotten once the virtual time reaches their pass
+        self._passes = {}
+
+        # pass of the least served waiting user, it never decreases
+        self._virtual_time = 0.0
+
+        self._lock = threading.Lock()
+
+    #~~~~~~~~~~~~~~~~~~~~~ PRIVATE FUNCTIONS ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    def _wait_time(self,
+                   job : dict,
+                   now : datetime) -> float:
+        """Number of seconds the job has been waiting since it was created
+
+        Args:
+            job (dict): job description
+            now (datetime): aware datetime
+
+        Returns:
+            float: seconds, 0 if the creation date is not valid
+        """
+        try:
+            create_date = parser.parse(job['create_date'])
+            if create_date.tzinfo is None:
+                create_date = create_date.astimezone()
+            return max((now - create_date).total_seconds(), 0.0)
+        except (KeyError, TypeError, ValueError, OverflowError):
+            return 0.0
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    def _update_passes(self,
+                       waiting_users : set) -> None:
+        """Advance the virtual time to the pass of the least served waiting user, bring the
+        users which were not waiting up to it and forget the users it has caught up with
+
+        Args:
+            waiting_users (set): user_uids with jobs waiting to run
+        """
+        known_passes = [self._passes[user_uid] for user_uid in waiting_users if user_uid in self._passes]
+        if len(known_passes) > 0:
+            self._virtual_time = max(self._virtual_time, min(known_passes))
+
+        for user_uid in list(self._passes):
+            if user_uid not in waiting_users and self._passes[user_uid] <= self._virtual_time:
+                del self._passes[user_uid]
+
+        for user_uid in waiting_users:
+            self._passes[user_uid] = max(self._passes.get(user_uid, self._virtual_time), self._virtual_time)
+
+    #~~~~~~~~~~~~~~~~~~~~~~~ PUBLIC FUNCTIONS~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    def weight(self,
+               user_uid : str) -> float:
+        """Share of the workers given to the jobs of a user, relative to the other users
+
+        Args:
+            user_uid (str): uid of the user
+
+        Returns:
+            float: weight of the user
+        """
+        return self._user_weights.get(user_uid, self._default_weight)
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    def priority(self,
+                 job : dict) -> int:
+        """Priority of a job given by its job_tag, the highest priority of the words of the
+        tag found in the tag priorities
+
+        Args:
+            job (dict): job description
+
+        Returns:
+            int: priority, 0 if the tag has none
+        """
+        job_tag = job.get('job_tag') or ''
+        priorities = [self._tag_priorities[word] for word in TAG_SEPARATORS.split(job_tag.lower())
+                      if word in self._tag_priorities]
+        return max(priorities, default=0)
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    def effective_priority(self,
+                           job : dict,
+                           now : datetime) -> float:
+        """Priority of a job raised by one level for every aging interval it has waited
+
+        Args:
+            job (dict): job description
+            now (datetime): aware datetime
+
+        Returns:
+            float: aged priority
+        """
+        priority = self.priority(job)
+        if self._aging_interval:
+            priority = priority + self._wait_time(job, now) / self._aging_interval
+        return priority
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    def order(self,
+              jobs : List[dict],
+              now : datetime = None) -> List[dict]:
+        """Order the jobs waiting to run in the order they should get a worker. The user with
+        the lowest pass gets the next job, its pass advancing as if the job was started (ties
+        go to the oldest job), each user's jobs are taken by aged priority then age. The
+        passes are only advanced by charge, for the jobs actually started.
+
+        Args:
+            jobs (List[dict]): created and paused jobs
+            now (datetime, optional): aware datetime used for aging (default: the current time)
+
+        Returns:
+            List[dict]: the jobs, in fair share order
+        """
+        if now is None:
+            now = datetime.now(timezone.utc)
+
+        user_queues = {}
+        for job in jobs:
+            user_queues.setdefault(job['user_uid'], []).append(job)
+
+        for user_uid, user_jobs in user_queues.items():
+            user_jobs.sort(key=lambda job: (-self.effective_priority(job, now), job['create_date']))
+            user_queues[user_uid] = deque(user_jobs)
+
+        with self._lock:
+            self._update_passes(set(user_queues))
+            heap = [(self._passes[user_uid], user_jobs[0]['create_date'], user_uid)
+                    for user_uid, user_jobs in user_queues.items()]
+        heapq.heapify(heap)
+
+        ordered_jobs = []
+        while heap:
+            user_pass, _, user_uid = heapq.heappop(heap)
+            user_jobs = user_queues[user_uid]
+            ordered_jobs.append(user_jobs.popleft())
+            if user_jobs:
+                heapq.heappush(heap, (user_pass + 1 / self.weight(user_uid), user_jobs[0]['create_date'], user_uid))
+
+        return ordered_jobs
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    def charge(self,
+               job : dict) -> None:
+        """Account a started job to its user
+
+        Args:
+            job (dict): job given to a worker
+        """
+        user_uid = job['user_uid']
+        with self._lock:
+            user_pass = max(self._passes.get(user_uid, self._virtual_time), self._virtual_time)
+            self._passes[user_uid] = user_pass + 1 / self.weight(user_uid)
@@ -7,16 +7,27 @@ sys.path.insert(0, BASE_DIR)
 import logging
 from types import FrameType
 from requests import Response
+from requests.exceptions import RequestException
 
 import concurrent.futures
-import time
+from datetime import datetime, timezone
+import functools
+import multiprocessing
+import threading
 from typing import Callable, List
 import signal
 
-from atlin_api.atlin_api import Atlin, JobStatus
+from dateutil import parser
+
+from atlin_api.atlin_api import get_atlin, JobStatus, RetryPolicy, RetryError, RequestRejectedError
 import Config as config
+from Scheduler.utils import MAX_WORKERS, MAX_PROCESS_WORKERS, PLATFORM_CONCURRENCY_LIMITS
 
-from ToolInterfaces.ToolInterface import genericInterface
+from ToolInterfaces.ToolInterface import genericInterface, status_outbox
+from Scheduler.job_sources import JobSource, PollingJobSource
+from Scheduler.quota_ledger import get_quota_ledger, next_quota_reset
+from Scheduler.wait_queue import WaitQueue
+from Scheduler.fair_queue import FairQueue
 
 class JobScheduler:
     """The Job Scheduler checks the DB for jobs which can be run and runs them.
@@ -25,18 +36,69 @@ class JobScheduler:
 
     def __init__(   self,
                     data_base_domain = config.ATLIN_API_ADDRESS,
-                    wait_time = 60):
-
-        self._wait_time = wait_time
+                    wait_time = 60,
+                    max_workers = MAX_WORKERS,
+                    platform_limits : dict = None,
+                    user_weights : dict = None,
+                    process_job_types : list = None,
+                    max_process_workers = MAX_PROCESS_WORKERS,
+                    process_initializer : Callable = None,
+                    job_source : JobSource = None):
+
+        # without a job source the scheduler polls every wait_time seconds
+        if job_source is None:
+            job_source = PollingJobSource(wait_time, wait_time)
+        self._job_source = job_source
 
         self._keep_running = True
 
-        self._atlin_session = Atlin(data_base_domain)
+        # set by SIGINT, the main loop stops and run() clears the running jobs
+        self._shutdown_requested = False
+
+        self._data_base_domain = data_base_domain
+
+        self._atlin_session = get_atlin(data_base_domain)
 
         self._job_handle_dict = {}
 
+        # job_type -> function estimating the quota a job will use, see add_job_type
+        self._cost_estimator_dict = {}
+
         self._logger = logging.getLogger('Scheduler')
 
+        # one long-lived pool of workers is shared by every poll cycle
+        self._max_workers = max_workers
+
+        if platform_limits is None:
+            platform_limits = PLATFORM_CONCURRENCY_LIMITS
+        self._platform_limits = dict(platform_limits)
+
+        self._executor = concurrent.futures.ThreadPoolExecutor( max_workers=max_workers,
+                                                                thread_name_prefix='JobWorker')
+
+        # CPU heavy job types can be run in worker processes so they are not serialized by the GIL.
+        # 'spawn' is used because forking a process which is already running threads is unsafe.
+        self._process_job_types = set(process_job_types or [])
+        self._process_executor = None
+        if len(self._process_job_types) > 0:
+            self._process_executor = concurrent.futures.ProcessPoolExecutor(
+                                                max_workers=max_process_workers,
+                                                mp_context=multiprocessing.get_context('spawn'),
+                                                initializer=process_initializer)
+
+        # job_uid -> (social_platform, token_uid) of every job currently held by the executor
+        self._running_jobs = {}
+        self._running_jobs_lock = threading.Lock()
+
+        # jobs whose last status is still in the outbox, their status in the DB is stale
+        self._undelivered_job_uids = set()
+
+        # paused jobs waiting for the quota reset, they are not submitted before it
+        self._wait_queue = WaitQueue()
+
+        # order in which the users' jobs get a worker, see FairQueue
+        self._fair_queue = FairQueue(user_weights)
+
         signal.signal(signal.SIGINT, self._handler_sig_int)
 
     #~~~~~~~~~~~~~~~~~~~~~ PRIVATE FUNCTIONS ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
@@ -44,7 +106,7 @@ class JobScheduler:
     def _submit_jobs(   self,
                         list_of_job_jsons : List[any]) -> None:
         """ This function will take in a list of dictionarys which describe a j
-        ob and creates seperate threads to run them
+        ob and hands them to the worker pool to be run
 
         Args:
             list_of_job_jsons (List[any]): list of jobs to submit
@@ -55,24 +117,253 @@ class JobScheduler:
         # TODO: it would be nice to confirm that the items in the list
         # are dictionaries with the correct key-value pairs
 
-        # Create a context manager to handle the opening/closing of processes
-        #with concurrent.futures.ProcessPoolExecutor() as executor:
-        with concurrent.futures.ThreadPoolExecutor() as executor:
-            for job_json in list_of_job_jsons:              
-                # get the data from the job dictionary
-                job_type = job_json['social_platform']
+        for job_json in list_of_job_jsons:
+            # get the data from the job dictionary
+            job_type = job_json['social_platform']
+            job_uid = job_json['job_uid']
 
-                try:
-                    # start a process that will execute the correct script
-                    executor.submit(genericInterface,
-                                    self._job_handle_dict[job_type],
-                                    job_json)
-                except KeyError as e:
-                    self._logger.error('Unknown Job Type: %s',e)
+            if job_type not in self._job_handle_dict:
+                self._logger.error('Unknown Job Type: %s', job_type)
+                continue
+
+            # the quota the job is expected to use is reserved before it starts, so the next
+            # check of the DB sees it as used
+            self._reserve_quota(job_json)
+
+            # the executors are never shut down between polls, so the scheduler
+            # is free to go back and check for other new jobs right away
+            future = self._executor_for(job_type).submit(genericInterface,
+                                                         self._job_handle_dict[job_type],
+                                                         job_json)
+
+            with self._running_jobs_lock:
+                self._running_jobs[job_uid] = (job_type, job_json['token_uid'])
+
+            self._fair_queue.charge(job_json)
 
-            # this allows the context manager to return before each process is finished
-            # which means the scheduler is free to go back and check for other new jobs
-            executor.shutdown(wait=False)
+            self._log_pickup_latency(job_json)
+
+            future.add_done_callback(functools.partial(self._job_done, job_uid))
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    def _log_pickup_latency(self,
+                            job_json : dict) -> None:
+        """Log the time between the creation of a new job and its submission to a worker
+
+        Args:
+            job_json (dict): job being submitted
+        """
+        if job_json.get('job_status') != JobStatus.created:
+            return
+
+        try:
+            create_date = parser.parse(job_json['create_date'])
+            if create_date.tzinfo is None:
+                create_date = create_date.astimezone()
+            latency = (datetime.now(timezone.utc) - create_date).total_seconds()
+            self._logger.info('Job %s picked up %.2f seconds after submission',
+                              job_json['job_uid'], latency)
+        except (KeyError, ValueError, OverflowError) as e:
+            self._logger.debug('Unable to compute pick up latency: %s', e)
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    def _executor_for(self,
+                      job_type : str) -> concurrent.futures.Executor:
+        """Returns the executor which runs jobs of type job_type
+
+        Args:
+            job_type (str): social platform of the job
+
+        Returns:
+            concurrent.futures.Executor: process pool for process job types, thread pool otherwise
+        """
+        if job_type in self._process_job_types:
+            return self._process_executor
+
+        return self._executor
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    def _job_done(self,
+                  job_uid : str,
+                  future : concurrent.futures.Future) -> None:
+        """Called by the executor when a job finishes, frees its worker slot
+
+        Args:
+            job_uid (str): uid of the finished job
+            future (concurrent.futures.Future): future the job was run on
+        """
+        with self._running_jobs_lock:
+            self._running_jobs.pop(job_uid, None)
+
+        # quota still reserved by the job (e.g. it raised before committing it) is available again
+        self._release_quota([job_uid])
+
+        if not future.cancelled():
+            if future.exception() is not None:
+                self._logger.error('Job %s raised: %s', job_uid, future.exception())
+            else:
+                self._logger.info('Job %s finished with status %s', job_uid, future.result())
+
+        # the freed worker picks up the next job now instead of after the back off
+        self._job_source.wake()
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    def _estimate_cost(self,
+                       job : dict) -> int:
+        """Quota the job is expected to use
+
+        Args:
+            job (dict): job description
+
+        Returns:
+            int: estimated units, None if the job type has no estimator or the job
+                 could not be estimated
+        """
+        estimator = self._cost_estimator_dict.get(job['social_platform'])
+        if estimator is None:
+            return None
+
+        try:
+            return estimator(job)
+        except Exception as e:
+            self._logger.warning('Unable to estimate the cost of job %s: %s', job['job_uid'], e)
+            return None
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    def _admit_job(self,
+                   job : dict,
+                   used_token_ids : set,
+                   token_budgets : dict) -> bool:
+        """Decide if a job can run next to the other jobs using its token. A job whose cost
+        can be estimated runs if it fits in the quota the token has left (token_budgets,
+        reduced by the jobs admitted before it) or if no other job uses the token. Other
+        jobs, and the jobs of platforms without a daily limit (their token's rate limit
+        is shared by its jobs), run only if no other job uses the token.
+
+        Args:
+            job (dict): job description
+            used_token_ids (set): token_uids used by running or admitted jobs
+            token_budgets (dict): (token_uid, social_platform) -> units left, updated
+
+        Returns:
+            bool: True if the job can run
+        """
+        token_uid = job['token_uid']
+        cost = self._estimate_cost(job)
+        if cost is None:
+            return token_uid not in used_token_ids
+
+        key = (token_uid, job['social_platform'])
+        if key not in token_budgets:
+            token_budgets[key] = get_quota_ledger().remaining(token_uid, job['social_platform'])
+        budget = token_budgets[key]
+        if budget is None:
+            return token_uid not in used_token_ids
+
+        if cost > budget and token_uid in used_token_ids:
+            return False
+        token_budgets[key] = max(budget - cost, 0)
+
+        return True
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    def _reserve_quota(self,
+                       job_json : dict) -> None:
+        """Reserve the estimated cost of a job in the quota ledger, the job takes the
+        reservation over when it starts
+
+        Args:
+            job_json (dict): job being submitted
+        """
+        cost = self._estimate_cost(job_json)
+        if cost is None:
+            return
+
+        try:
+            reservation = get_quota_ledger().reserve(job_json['token_uid'],
+                                                     job_json['social_platform'],
+                                                     cost,
+                                                     job_uid=job_json['job_uid'])
+            if reservation is None:
+                self._logger.info('Job %s starts without reserved quota, its token has less than %d unit(s) left',
+                                  job_json['job_uid'], cost)
+        except Exception as e:
+            self._logger.error('Unable to reserve quota for job %s: %s', job_json['job_uid'], e)
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    def _release_quota(self,
+                       job_uid_list : List[str]) -> None:
+        """Release the quota reservations held by jobs which are not running anymore
+
+        Args:
+            job_uid_list (List[str]): uids of the jobs
+        """
+        try:
+            released = get_quota_ledger().release_jobs(job_uid_list)
+            if released > 0:
+                self._logger.info('Released %d quota reservation(s)', released)
+        except Exception as e:
+            self._logger.error('Unable to release quota reservations: %s', e)
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    def _free_slots(self) -> int:
+        """Number of jobs the worker pool can accept right now
+
+        Returns:
+            int: number of idle workers
+        """
+        with self._running_jobs_lock:
+            return max(self._max_workers - len(self._running_jobs), 0)
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    def _select_jobs(self,
+                     jobs : list,
+                     free_slots : int,
+                     used_token_ids : set,
+                     platform_counts : dict) -> list:
+        """Picks at most free_slots jobs from jobs, in order, respecting the per platform
+        concurrency limits and the tokens' quota (see _admit_job). It stops once the slots
+        are full, only the jobs picked use a token or a part of its quota
+
+        Args:
+            jobs (list): created and paused jobs which are not held by the worker pool (in
+                         fair share order)
+            free_slots (int): number of idle workers
+            used_token_ids (set): token_uids used by running jobs, updated
+            platform_counts (dict): social_platform -> number of running jobs, updated
+
+        Returns:
+            list: jobs to submit
+        """
+        selected_jobs = []
+        token_budgets = {}
+
+        for job in jobs:
+            if len(selected_jobs) >= free_slots:
+                break
+
+            job_type = job['social_platform']
+            limit = self._platform_limits.get(job_type, self._max_workers)
+            if platform_counts.get(job_type, 0) >= limit:
+                continue
+
+            if not self._admit_job(job, used_token_ids, token_budgets):
+                continue
+
+            used_token_ids.add(job['token_uid'])
+            platform_counts[job_type] = platform_counts.get(job_type, 0) + 1
+            selected_jobs.append(job)
+
+        return selected_jobs
 
     #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
@@ -87,8 +378,10 @@ class JobScheduler:
         """
         if sig is not None and frame is not None:
             self._logger.info('Handling SIGINT')
-            self._clear_running_jobs()
-            sys.exit(0)
+            # no I/O in the handler, run() stops at the end of its loop and clears the running jobs.
+            # The wait is ended from another thread, the main thread may hold the event's lock
+            self._shutdown_requested = True
+            threading.Thread(target=self._job_source.wake, daemon=True).start()
 
     #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
@@ -103,10 +396,25 @@ class JobScheduler:
             _type_: _description_
         """
 
+        return self._get_jobs_with_status([job_status])
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    def _get_jobs_with_status(self,
+                              job_status_list: List[str]) -> Response:
+        """ Handle a single API request for the jobs with any of the statuses in job_status_list
+
+        Args:
+            job_status_list (List[str]): list of JobStatus values
+
+        Returns:
+            Response: response of the API
+        """
+
         response = None
 
         try:
-            response = self._atlin_session.job_get(job_status=[job_status])
+            response = self._atlin_session.job_get(job_status=job_status_list)
         except Exception as e:
             self._logger.error(e)
             raise e
@@ -115,84 +423,130 @@ class JobScheduler:
 
     #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
-    def _set_job_status(self,
-                        job_uid : str,
-                        job_status : JobStatus) -> None:
-        """
+    def _set_jobs_status(self,
+                         job_uid_list : List[str],
+                         job_status : JobStatus) -> None:
+        """ Sets the status of all the jobs in job_uid_list, trying each job once. A status
+        which could not be delivered goes to the outbox (replayed by the next run)
 
-        Args: Sets status of job with id 'job_uid' to 'status
-            job_uid (str): _description_
-            job_status (JobStatus): _description_
-
-        Raises:
-            e: _description_
+        Args:
+            job_uid_list (List[str]): uids of the jobs to update
+            job_status (JobStatus): status to set
         """
-        try:        
-            self._atlin_session.job_set_status(job_uid, job_status)
-        except Exception as e:
-            self._logger.error(e)
-            raise e
-
-        return
+        policy = RetryPolicy(deadline=0)
+        for job_uid in job_uid_list:
+            # an older status of the job waits in the outbox, the new one replaces it
+            if status_outbox.contains(job_uid):
+                status_outbox.put(job_uid, job_status)
+                continue
+            try:
+                policy.call(self._atlin_session.job_set_status, job_uid, job_status)
+            except RequestRejectedError as e:
+                self._logger.warning('The status of job %s was not set to %s (%s)', job_uid, job_status, e)
+            except RetryError as e:
+                self._logger.warning('Unable to set the status of job %s to %s (%s), saved to the outbox',
+                                     job_uid, job_status, e)
+                status_outbox.put(job_uid, job_status)
 
     #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
-    def _get_currently_used_tokens(self) -> list:
-        """
-        Helper function that returns a list of currently used token_uids
+    def _partition_jobs(self,
+                        jobs : list) -> tuple[list, set]:
+        """ Splits the jobs returned by the DB in one pass into the created and paused jobs,
+        sorted by age (oldest to youngest), and the set of token_uids used by running jobs
+
+        Args:
+            jobs (list): CREATED, PAUSED and RUNNING jobs
+
+        Returns:
+            tuple[list, set]: potentially runnable jobs, token_uids currently in use
         """
-        used_token_ids = []
+        potentially_runnable_jobs = []
+        used_token_ids = set()
 
-        try:
-            running_jobs_list = self._get_jobs(JobStatus().running).json()
+        for job in jobs:
+            if job['job_status'] == JobStatus.running:
+                used_token_ids.add(job['token_uid'])
+            elif job['job_status'] in (JobStatus.created, JobStatus.paused):
+                potentially_runnable_jobs.append(job)
 
-            for job in running_jobs_list:
-                used_token_ids.append(job['token_uid'])
+        potentially_runnable_jobs.sort(key= lambda job: job['create_date'])
 
-        except Exception as e:
-            self._logger.error(e)
-            raise e
-        return used_token_ids
+        return potentially_runnable_jobs, used_token_ids
 
     #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
-    def _get_potentially_runnable_jobs(self) -> list:
-        """ Merges the created and paused jobs and returns a list sort by age (oldest to youngest) 
+    def _quota_reset_after_pause(self,
+                                 job : dict) -> datetime:
+        """First quota reset after a job was paused (its last modification)
 
-        Raises:
-            e: _description_
+        Args:
+            job (dict): paused job
 
         Returns:
-            list: _description_
+            datetime: instant of the reset, None if the modification date is not valid
         """
-        potentially_runnable_jobs = []
-
         try:
-            created_jobs = self._get_jobs(JobStatus().created).json()
-            paused_jobs = self._get_jobs(JobStatus().paused).json()
+            modify_date = parser.parse(job['modify_date'])
+            if modify_date.tzinfo is None:
+                modify_date = modify_date.astimezone()
+            return next_quota_reset(modify_date)
+        except (KeyError, TypeError, ValueError, OverflowError) as e:
+            self._logger.debug('Unable to read the modification date of job %s: %s', job['job_uid'], e)
+            return None
 
-            potentially_runnable_jobs = created_jobs + paused_jobs
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
-            potentially_runnable_jobs.sort(key= lambda job: job['create_date'])
+    def _hold_paused_jobs(self,
+                          jobs : list) -> list:
+        """Paused jobs go to the wait queue until the first quota reset after they were paused,
+        they are only returned once it has passed (and until they run)
 
-        except Exception as e:
-            self._logger.error(e)
-            raise e
+        Args:
+            jobs (list): created and paused jobs
 
-        return potentially_runnable_jobs
+        Returns:
+            list: jobs which are not waiting for the quota reset
+        """
+        now = datetime.now(timezone.utc)
+        released = set(self._wait_queue.pop_due(now))
+        if len(released) > 0:
+            self._logger.info('%d paused job(s) released after the quota reset', len(released))
+
+        ready_jobs = []
+        for job in jobs:
+            if job['job_status'] != JobStatus.paused or job['job_uid'] in released:
+                ready_jobs.append(job)
+                continue
+
+            if job['job_uid'] in self._wait_queue:
+                continue
+
+            release_at = self._quota_reset_after_pause(job)
+            if release_at is None or release_at <= now:
+                # the quota was reset since the job was paused
+                ready_jobs.append(job)
+            else:
+                self._wait_queue.add(job['job_uid'], release_at)
+                self._logger.info('Job %s waits for the quota reset at %s', job['job_uid'], release_at.isoformat())
+
+        return ready_jobs
 
     #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
     def _clear_running_jobs(self):
         """
         Clears out all running jobs from the database and sets there status to FAILED. This
-        function is executed before the scheduler starts it's main loop and when handling SIGINT
+        function is executed before the scheduler starts it's main loop and when it stops
+        (after SIGINT)
         """
         try:
             running_jobs_list = self._get_jobs(JobStatus().running).json()
+            job_uid_list = [job['job_uid'] for job in running_jobs_list]
 
-            for job in running_jobs_list:
-                self._set_job_status(job['job_uid'], JobStatus().failed)
+            self._set_jobs_status(job_uid_list, JobStatus().failed)
+
+            self._release_quota(job_uid_list)
 
         except Exception as e:
             self._logger.error(e)
@@ -200,28 +554,56 @@ class JobScheduler:
 
     #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
-    def _get_runnable_jobs_from_db(self) -> list:
-        """This function compares rows in the jobs table with the status CREATED with those that are 
-        currently status RUNNING. If the token_uid of a CREATED job is not currenly used by a 
-        RUNNING job it is added to the returned list.
+    def _get_runnable_jobs_from_db(self,
+                                   free_slots : int) -> list:
+        """This function compares rows in the jobs table with the status CREATED or PAUSED with
+        those that are currently status RUNNING. All three statuses are fetched with a single
+        request. The jobs are taken in the order the users share the workers (see FairQueue)
+        until free_slots are filled, a job is taken if its platform is below its concurrency
+        limit and its token_uid is not currently used by a RUNNING job or, for job types with
+        a cost estimator, if its estimated cost fits in the quota its token has left (see
+        _select_jobs and _admit_job).
+
+        Args:
+            free_slots (int): number of idle workers
+
         Raises:
             e: _description_
 
         Returns:
-            list: _description_
+            list: jobs to submit
         """
         runnable_jobs = []
 
         try:
             self._logger.info('Checking for runnable jobs')
-            potentially_runnable_jobs = self._get_potentially_runnable_jobs()
-            used_token_ids = self._get_currently_used_tokens()
-
-            # for job in createdJobs:
-            for job in potentially_runnable_jobs:
-                if job['token_uid'] not in used_token_ids:
-                    runnable_jobs.append(job)   
-                    used_token_ids.append(job['token_uid'])
+            jobs = self._get_jobs_with_status([JobStatus.created,
+                                               JobStatus.paused,
+                                               JobStatus.running]).json()
+            potentially_runnable_jobs, used_token_ids = self._partition_jobs(jobs)
+            potentially_runnable_jobs = self._hold_paused_jobs(potentially_runnable_jobs)
+
+            # jobs submitted by this scheduler may not be RUNNING in the DB yet
+            with self._running_jobs_lock:
+                running_jobs = dict(self._running_jobs)
+                # read while holding the lock: a job which already left _running_jobs put its
+                # last status in the outbox before, if it could not deliver it
+                self._refresh_undelivered_job_uids()
+
+            used_token_ids.update(token_uid for _, token_uid in running_jobs.values())
+            platform_counts = {}
+            for job_type, _ in running_jobs.values():
+                platform_counts[job_type] = platform_counts.get(job_type, 0) + 1
+
+            # a job stays CREATED/PAUSED in the DB until its worker sets it to RUNNING
+            potentially_runnable_jobs = [job for job in potentially_runnable_jobs
+                                         if job['job_uid'] not in running_jobs and
+                                            job['job_uid'] not in self._undelivered_job_uids]
+
+            # the users take turns, a user who submitted many jobs does not get every worker
+            potentially_runnable_jobs = self._fair_queue.order(potentially_runnable_jobs)
+
+            runnable_jobs = self._select_jobs(potentially_runnable_jobs, free_slots, used_token_ids, platform_counts)
 
             self._logger.info('%d runnable job(s) found',len(runnable_jobs))
 
@@ -233,17 +615,24 @@ class JobScheduler:
 
     #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
-    def _get_jobs_from_db(self) -> None:
+    def _get_jobs_from_db(self,
+                          free_slots : int) -> bool:
         """This function checks the data base for any rows in the JobsTable which has a job
-        status set to CREATED
+        status set to CREATED and submits as many of them as there are free worker slots
+
+        Args:
+            free_slots (int): number of idle workers
 
         Raises:
             e: _description_
+
+        Returns:
+            bool: True if a new (CREATED) job was submitted
         """
         try:
-            runnable_jobs = self._get_runnable_jobs_from_db()
+            runnable_jobs = self._get_runnable_jobs_from_db(free_slots)
 
-            # This function will submit the jobs to be run on seperate processes
+            # This function will submit the jobs to be run on the worker pool
             if len(runnable_jobs) > 0:
                 self._submit_jobs(runnable_jobs)
 
@@ -251,6 +640,32 @@ class JobScheduler:
             self._logger.error(e)
             raise e
 
+        # paused jobs are found on every check so they do not count as new work
+        return any(job['job_status'] == JobStatus.created for job in runnable_jobs)
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    def _replay_status_outbox(self) -> None:
+        """Try once more to deliver the job statuses the workers could not deliver
+        """
+        try:
+            delivered = status_outbox.replay(self._atlin_session)
+            if delivered > 0:
+                self._logger.info('Delivered %d job status(es) from the outbox', delivered)
+        except Exception as e:
+            self._logger.error('Unable to replay the status outbox: %s', e)
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    def _refresh_undelivered_job_uids(self) -> None:
+        """Read the jobs whose last status is still in the outbox, the previous ones are
+        kept if the outbox can not be read
+        """
+        try:
+            self._undelivered_job_uids = {job_uid for job_uid, _ in status_outbox.pending()}
+        except Exception as e:
+            self._logger.error('Unable to read the status outbox: %s', e)
+
     #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
     def _check_exit(self):
@@ -258,15 +673,23 @@ class JobScheduler:
         """
         self._logger.info('Check for exit conditions')
 
-        self._keep_running = True
+        self._keep_running = not self._shutdown_requested
 
     #~~~~~~~~~~~~~~~~~~~~~~~ PUBLIC FUNCTIONS~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
     def add_job_type( self,
                     job_type : str,
-                    tool_func_point : Callable) -> None:
+                    tool_func_point : Callable,
+                    cost_estimator : Callable = None) -> None:
 
         """Add a new job type, and the ToolInterface to run it
+
+        Args:
+            job_type (str): social platform of the jobs
+            tool_func_point (Callable): ToolInterface running a job (job json -> JobStatus)
+            cost_estimator (Callable, optional): function estimating the quota a job will use
+                (job json -> units). With it several jobs of a token run at the same time while
+                their estimates fit in the token's quota, without it one job per token runs.
     
         Raises:
             TypeError: _description_
@@ -274,6 +697,8 @@ class JobScheduler:
 
         if callable(tool_func_point):
             self._job_handle_dict[job_type] = tool_func_point
+            if cost_estimator is not None:
+                self._cost_estimator_dict[job_type] = cost_estimator
             self._logger.info('Handler for job type %s added.',job_type)
         else:
             self._logger.error('AddJobType: argument \'toolFunctionPoint\' not a callable type')
@@ -282,20 +707,59 @@ class JobScheduler:
     #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
     
     def run(self):
-        """This is the main loop for the job scheduler
+        """This is the main loop for the job scheduler, it runs until SIGINT is received
         """                
         # Clear out jobs in DB which are stuck on 'running'
         self._clear_running_jobs()
 
+        try:
+            self._run_loop()
+        finally:
+            self._shutdown()
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    def _run_loop(self):
+        """Check the DB for runnable jobs until an exit condition is set
+        """
         while self._keep_running:
 
-            # This function will check the database for news and return a list of dictionaries with
-            # the row ID of the new job
-            self._get_jobs_from_db()
+            # a job finishing from now on wakes the next wait, this check may miss it
+            self._job_source.start_check()
+
+            # Deliver the statuses which failed to reach the API while it was unavailable
+            self._replay_status_outbox()
+
+            # Only go to the database when a worker is free to pick up the job
+            found_work = False
+            free_slots = self._free_slots()
+            if free_slots > 0:
+                try:
+                    found_work = self._get_jobs_from_db(free_slots)
+                except RequestException as e:
+                    # the backend is unavailable, back off and keep replaying the outbox
+                    self._logger.warning('Unable to check the DB for runnable jobs: %s', e)
+            else:
+                self._logger.info('All %d worker(s) busy', self._max_workers)
+
+            # don't spam the API, the job source decides when to check again
+            self._job_source.wait_for_jobs(found_work)
 
             # check if some type of exit condition has been set
             self._check_exit()
 
-            # don't spam the API
-            self._logger.info(f'Sleep for %d seconds...',self._wait_time)
-            time.sleep(self._wait_time)
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    def _shutdown(self):
+        """Stop the workers and set the jobs still running to FAILED, their statuses go to the
+        outbox if the API is unavailable
+        """
+        self._logger.info('Shutting down')
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        if self._process_executor is not None:
+            self._process_executor.shutdown(wait=False, cancel_futures=True)
+        self._job_source.close()
+        try:
+            self._clear_running_jobs()
+        except Exception as e:
+            self._logger.error('Unable to clear the running jobs: %s', e)
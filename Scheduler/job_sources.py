@@ -0,0 +1,183 @@
+""" Job sources decide when the JobScheduler should next check the DB for runnable jobs.
+
+PollingJobSource polls with an adaptive back off, NotifyJobSource additionally wakes up
+as soon as something pokes it on a local UDP socket (see notify_scheduler). The scheduler
+wakes its job source itself when a worker finishes a job. The backend does not call
+notify_scheduler yet, new jobs are found by polling until it does.
+"""
+from abc import ABC, abstractmethod
+import logging
+import socket
+import threading
+
+from Scheduler.utils import MIN_WAIT_TIME, MAX_WAIT_TIME, NOTIFY_HOST, NOTIFY_PORT, JOB_SOURCE
+
+NOTIFY_MESSAGE = b'job'
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+class JobSource(ABC):
+    """Base class for the objects the JobScheduler waits on between two checks of the DB
+    """
+
+    def __init__(self):
+
+        self._wake_event = threading.Event()
+
+        self._logger = logging.getLogger('JobSource')
+
+    @abstractmethod
+    def _next_wait_time(self,
+                        found_work : bool) -> float:
+        """Number of seconds to wait before the next check of the DB
+
+        Args:
+            found_work (bool): True if the last check found new jobs
+        """
+        raise NotImplementedError()
+
+    def start_check(self) -> None:
+        """Called before the DB is checked, a wake() from now on makes the next
+        wait_for_jobs return immediately (the check may have missed its cause)
+        """
+        self._wake_event.clear()
+
+    def wait_for_jobs(self,
+                      found_work : bool) -> bool:
+        """Block until the next check of the DB is due or until wake() is called. A wake()
+        received since start_check is not lost, the wait returns immediately
+
+        Args:
+            found_work (bool): True if the last check found new jobs
+
+        Returns:
+            bool: True if woken up by wake() before the wait time ran out
+        """
+        wait_time = self._next_wait_time(found_work)
+        self._logger.info('Wait up to %.1f seconds for new jobs...', wait_time)
+
+        return self._wake_event.wait(wait_time)
+
+    def wake(self) -> None:
+        """Make wait_for_jobs return immediately
+        """
+        self._wake_event.set()
+
+    def close(self) -> None:
+        """Release any resource held by the job source
+        """
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+class PollingJobSource(JobSource):
+    """Polls the DB, shortly after work was found and less and less often while idle
+    """
+
+    def __init__(self,
+                 min_wait_time : float = MIN_WAIT_TIME,
+                 max_wait_time : float = MAX_WAIT_TIME,
+                 backoff_factor : float = 2):
+
+        super().__init__()
+
+        if min_wait_time > max_wait_time:
+            raise ValueError('min_wait_time should not be greater than max_wait_time')
+
+        self._min_wait_time = min_wait_time
+        self._max_wait_time = max_wait_time
+        self._backoff_factor = backoff_factor
+
+        self._wait_time = min_wait_time
+
+    def _next_wait_time(self,
+                        found_work : bool) -> float:
+
+        if found_work:
+            self._wait_time = self._min_wait_time
+        else:
+            self._wait_time = min(self._wait_time * self._backoff_factor, self._max_wait_time)
+
+        return self._wait_time
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+class NotifyJobSource(PollingJobSource):
+    """Wakes up as soon as a datagram is received on a local UDP socket. Polling with
+    back off is kept as a fallback in case a notification is lost.
+    """
+
+    def __init__(self,
+                 host : str = NOTIFY_HOST,
+                 port : int = NOTIFY_PORT,
+                 min_wait_time : float = MIN_WAIT_TIME,
+                 max_wait_time : float = MAX_WAIT_TIME,
+                 backoff_factor : float = 2):
+
+        super().__init__(min_wait_time, max_wait_time, backoff_factor)
+
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._socket.bind((host, port))
+
+        self._listener = threading.Thread(target=self._listen,
+                                          name='JobSourceListener',
+                                          daemon=True)
+        self._listener.start()
+
+        self._logger.info('Listening for job notifications on %s:%d', host, port)
+
+    def _listen(self) -> None:
+        """Wake the scheduler every time a notification is received
+        """
+        while True:
+            try:
+                self._socket.recv(64)
+            except OSError:
+                # the socket was closed
+                return
+
+            self._logger.info('Job notification received')
+            self.wake()
+
+    def close(self) -> None:
+        self._socket.close()
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+def create_job_source(kind : str = JOB_SOURCE,
+                      min_wait_time : float = MIN_WAIT_TIME,
+                      max_wait_time : float = MAX_WAIT_TIME) -> JobSource:
+    """Job source of the kind set in JOB_SOURCE. A NotifyJobSource whose port can not be
+    bound (e.g. held by another scheduler) falls back to polling
+
+    Args:
+        kind (str): 'notify' or 'polling'
+        min_wait_time (float): shortest wait between checks
+        max_wait_time (float): longest wait between checks
+
+    Returns:
+        JobSource: the job source
+    """
+    if kind == 'notify':
+        try:
+            return NotifyJobSource(min_wait_time=min_wait_time, max_wait_time=max_wait_time)
+        except OSError as e:
+            logging.getLogger('JobSource').warning('Unable to listen for job notifications on %s:%d (%s), '
+                                                   'polling instead', NOTIFY_HOST, NOTIFY_PORT, e)
+    elif kind != 'polling':
+        raise ValueError(f'Unknown job source {kind}')
+
+    return PollingJobSource(min_wait_time, max_wait_time)
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+def notify_scheduler(host : str = NOTIFY_HOST,
+                     port : int = NOTIFY_PORT) -> None:
+    """Tell a scheduler running a NotifyJobSource that a job was submitted or changed.
+    The notification is best effort, the scheduler still polls if it is lost.
+
+    Args:
+        host (str): host the scheduler listens on
+        port (int): port the scheduler listens on
+    """
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.sendto(NOTIFY_MESSAGE, (host, port))
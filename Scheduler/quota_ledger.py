@@ -0,0 +1,531 @@
+""" Quota ledger shared by every job (and every scheduler instance on the host) using a token.
+
+The units of a token are reserved before they are spent: a job reserves a block of units,
+spends it, extends the reservation when it runs out and commits what it actually used when
+it ends, the rest is released. All changes are made in SQLite transactions, so two jobs
+using the same token can never both get its last units.
+
+Usage is counted per quota day, which starts at midnight Pacific time (when the YouTube Data
+API resets its quota), a new day starts with all the units available.
+"""
+from datetime import datetime, time, timedelta
+import logging
+import os
+import sqlite3
+import threading
+import uuid
+from zoneinfo import ZoneInfo
+
+import Config as config
+from Scheduler.utils import DAILY_QUOTA_LIMITS, QUOTA_RESET_TIMEZONE, QUOTA_RESERVATION_BLOCK
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+def quota_day(now : datetime = None) -> str:
+    """Quota day of now (default: the current time)
+
+    Args:
+        now (datetime, optional): aware datetime
+
+    Returns:
+        str: date (YYYY-MM-DD) in the quota reset time zone
+    """
+    if now is None:
+        now = datetime.now(ZoneInfo(QUOTA_RESET_TIMEZONE))
+    return now.astimezone(ZoneInfo(QUOTA_RESET_TIMEZONE)).date().isoformat()
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+def next_quota_reset(now : datetime = None) -> datetime:
+    """Instant the next quota day starts
+
+    Args:
+        now (datetime, optional): aware datetime (default: the current time)
+
+    Returns:
+        datetime: next midnight in the quota reset time zone
+    """
+    zone = ZoneInfo(QUOTA_RESET_TIMEZONE)
+    if now is None:
+        now = datetime.now(zone)
+    tomorrow = now.astimezone(zone).date() + timedelta(days=1)
+    return datetime.combine(tomorrow, time(0), tzinfo=zone)
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+class QuotaReservation:
+    """Units of a token reserved by a job in one quota day.
+
+    The job takes the units it is about to spend from the reservation, which is extended in
+    the ledger (by at least block units) when it runs out. commit() records the units taken
+    as used and gives back the rest.
+    """
+
+    def __init__(self,
+                 ledger : 'QuotaLedger',
+                 reservation_id : str,
+                 token_uid : str,
+                 platform : str,
+                 day : str,
+                 units : int,
+                 limit : int = None,
+                 block : int = QUOTA_RESERVATION_BLOCK,
+                 job_uid : str = None):
+
+        self._ledger = ledger
+        self._lock = threading.Lock()
+        self.reservation_id = reservation_id
+        self.token_uid = token_uid
+        self.platform = platform
+        self.day = day
+        self.units = units
+        self.limit = limit
+        self.block = block
+        self.job_uid = job_uid
+        self.taken = 0
+        self.closed = False
+
+    def take(self,
+             units : int,
+             force : bool = False) -> bool:
+        """Take units from the reservation before spending them
+
+        Args:
+            units (int): units about to be spent
+            force (bool, optional): take them even if the ledger has no units left (the
+                                    units are already spent)
+
+        Returns:
+            bool: False if the token has not enough units left, nothing is taken then
+        """
+        with self._lock:
+            if self.closed or not self._ensure(units, force):
+                return False
+
+            self.taken = self.taken + units
+            return True
+
+    def ensure(self,
+               units : int) -> bool:
+        """Extend the reservation, if needed, so at least units are left in it (e.g. before
+        a sequence of requests which must not be interrupted)
+
+        Args:
+            units (int): units needed
+
+        Returns:
+            bool: False if the token has not enough units left
+        """
+        with self._lock:
+            return not self.closed and self._ensure(units)
+
+    def _ensure(self,
+                units : int,
+                force : bool = False) -> bool:
+        missing = self.taken + units - self.units
+        if missing <= 0:
+            return True
+
+        # a whole block avoids going to the ledger for every request, near the
+        # limit only what is missing is asked for
+        return (self._ledger.extend(self, max(missing, self.block)) or
+                self._ledger.extend(self, missing, force=force))
+
+    def remaining(self) -> int:
+        """Units reserved which were not taken yet
+
+        Returns:
+            int: units left in the reservation
+        """
+        with self._lock:
+            return max(self.units - self.taken, 0)
+
+    def commit(self) -> None:
+        """Record the units taken as used and release the rest
+        """
+        with self._lock:
+            if not self.closed:
+                self._ledger.commit(self.reservation_id, self.taken)
+                self.closed = True
+
+    def release(self) -> None:
+        """Release the reservation without recording any use
+        """
+        with self._lock:
+            if not self.closed:
+                self._ledger.release(self.reservation_id)
+                self.closed = True
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+class QuotaLedger:
+    """Durable (SQLite) ledger of the units used and reserved by every token, per quota day.
+
+    The units available to a token in a day are its limit minus the units committed and
+    the units still reserved by running jobs.
+    """
+
+    def __init__(self,
+                 path : str,
+                 daily_limits : dict = None):
+
+        self._path = path
+        self._daily_limits = dict(DAILY_QUOTA_LIMITS if daily_limits is None else daily_limits)
+        self._logger = logging.getLogger('QuotaLedger')
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        with self._transaction() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS quota_usage ("
+                "token_uid TEXT NOT NULL, platform TEXT NOT NULL, day TEXT NOT NULL, "
+                "used INTEGER NOT NULL, PRIMARY KEY (token_uid, platform, day))"
+            )
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS quota_reservations ("
+                "reservation_id TEXT PRIMARY KEY, token_uid TEXT NOT NULL, platform TEXT NOT NULL, "
+                "day TEXT NOT NULL, units INTEGER NOT NULL, job_uid TEXT, created TEXT NOT NULL)"
+            )
+            # reservations of past days do not count against any limit anymore
+            connection.execute("DELETE FROM quota_reservations WHERE day < ?", (quota_day(),))
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    def _transaction(self) -> '_Transaction':
+        return _Transaction(self._path)
+
+    def _committed(self,
+                   connection : sqlite3.Connection,
+                   token_uid : str,
+                   platform : str,
+                   day : str) -> int:
+        committed = connection.execute(
+            "SELECT used FROM quota_usage WHERE token_uid = ? AND platform = ? AND day = ?",
+            (token_uid, platform, day)).fetchone()
+        return committed[0] if committed else 0
+
+    def _used(self,
+              connection : sqlite3.Connection,
+              token_uid : str,
+              platform : str,
+              day : str) -> int:
+        reserved = connection.execute(
+            "SELECT SUM(units) FROM quota_reservations WHERE token_uid = ? AND platform = ? AND day = ?",
+            (token_uid, platform, day)).fetchone()
+        return self._committed(connection, token_uid, platform, day) + (reserved[0] or 0)
+
+    def _fits(self,
+              used : int,
+              units : int,
+              limit : int) -> bool:
+        return limit is None or used + units <= limit
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    def limit(self,
+              platform : str) -> int:
+        """Units a token of platform can use in a day
+
+        Args:
+            platform (str): social platform
+
+        Returns:
+            int: daily limit, None if the platform has none
+        """
+        return self._daily_limits.get(platform)
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    def used(self,
+             token_uid : str,
+             platform : str,
+             day : str = None) -> int:
+        """Units of the token committed or reserved in a quota day
+
+        Args:
+            token_uid (str): uid of the token
+            platform (str): social platform of the token
+            day (str, optional): quota day (default: today)
+
+        Returns:
+            int: units used or reserved
+        """
+        with self._transaction() as connection:
+            return self._used(connection, token_uid, platform, day or quota_day())
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    def committed(self,
+                  token_uid : str,
+                  platform : str,
+                  day : str = None) -> int:
+        """Units of the token committed in a quota day, without the units still reserved by
+        running jobs (the units to report to the backend as the token's quota)
+
+        Args:
+            token_uid (str): uid of the token
+            platform (str): social platform of the token
+            day (str, optional): quota day (default: today)
+
+        Returns:
+            int: units committed
+        """
+        with self._transaction() as connection:
+            return self._committed(connection, token_uid, platform, day or quota_day())
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    def remaining(self,
+                  token_uid : str,
+                  platform : str,
+                  limit : int = None) -> int:
+        """Units of the token which can still be reserved today
+
+        Args:
+            token_uid (str): uid of the token
+            platform (str): social platform of the token
+            limit (int, optional): daily limit (default: the limit of the platform)
+
+        Returns:
+            int: units left, None if there is no limit
+        """
+        if limit is None:
+            limit = self.limit(platform)
+        if limit is None:
+            return None
+        return max(limit - self.used(token_uid, platform), 0)
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    def reserve(self,
+                token_uid : str,
+                platform : str,
+                units : int,
+                job_uid : str = None,
+                limit : int = None,
+                block : int = QUOTA_RESERVATION_BLOCK) -> QuotaReservation:
+        """Atomically reserve units of the token for today
+
+        Args:
+            token_uid (str): uid of the token
+            platform (str): social platform of the token
+            units (int): units to reserve
+            job_uid (str, optional): job holding the reservation
+            limit (int, optional): daily limit (default: the limit of the platform)
+            block (int, optional): minimum extension of the reservation
+
+        Returns:
+            QuotaReservation: the reservation, None if the token has not enough units left
+        """
+        if limit is None:
+            limit = self.limit(platform)
+        day = quota_day()
+        reservation_id = uuid.uuid4().hex
+
+        with self._transaction() as connection:
+            if not self._fits(self._used(connection, token_uid, platform, day), units, limit):
+                return None
+            connection.execute(
+                "INSERT INTO quota_reservations (reservation_id, token_uid, platform, day, units, job_uid, created) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (reservation_id, token_uid, platform, day, units, job_uid, datetime.now().isoformat()))
+
+        return QuotaReservation(self, reservation_id, token_uid, platform, day, units, limit, block, job_uid)
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    def adopt(self,
+              job_uid : str,
+              limit : int = None,
+              block : int = QUOTA_RESERVATION_BLOCK) -> QuotaReservation:
+        """Reservation made today for job_uid by someone else (e.g. the scheduler when it
+        submitted the job), so the job can take units from it
+
+        Args:
+            job_uid (str): uid of the job
+            limit (int, optional): daily limit (default: the limit of the platform)
+            block (int, optional): minimum extension of the reservation
+
+        Returns:
+            QuotaReservation: the reservation, None if there is none
+        """
+        with self._transaction() as connection:
+            row = connection.execute(
+                "SELECT reservation_id, token_uid, platform, day, units FROM quota_reservations "
+                "WHERE job_uid = ? AND day = ? ORDER BY created DESC LIMIT 1",
+                (job_uid, quota_day())).fetchone()
+        if row is None:
+            return None
+
+        reservation_id, token_uid, platform, day, units = row
+        if limit is None:
+            limit = self.limit(platform)
+        return QuotaReservation(self, reservation_id, token_uid, platform, day, units, limit, block, job_uid)
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    def sync_used(self,
+                  token_uid : str,
+                  platform : str,
+                  units : int,
+                  day : str = None) -> int:
+        """Atomically raise the units committed for the token in a quota day to at least
+        units, e.g. the quota reported by the backend (see committed) for units spent on
+        another host or before the ledger was used. The reservations are kept and do not
+        count, the backend only knows the units committed
+
+        Args:
+            token_uid (str): uid of the token
+            platform (str): social platform of the token
+            units (int): units known to be used
+            day (str, optional): quota day (default: today)
+
+        Returns:
+            int: units committed after the sync
+        """
+        day = day or quota_day()
+        with self._transaction() as connection:
+            committed = self._committed(connection, token_uid, platform, day)
+            if units > committed:
+                connection.execute(
+                    "INSERT INTO quota_usage (token_uid, platform, day, used) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (token_uid, platform, day) DO UPDATE SET used = excluded.used",
+                    (token_uid, platform, day, units))
+                committed = units
+        return committed
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    def extend(self,
+               reservation : QuotaReservation,
+               units : int,
+               force : bool = False) -> bool:
+        """Atomically add units to a reservation, in the quota day it was made
+
+        Args:
+            reservation (QuotaReservation): reservation to extend
+            units (int): units to add
+            force (bool, optional): add them even if it goes over the limit
+
+        Returns:
+            bool: False if the token has not enough units left
+        """
+        with self._transaction() as connection:
+            used = self._used(connection, reservation.token_uid, reservation.platform, reservation.day)
+            if not force and not self._fits(used, units, reservation.limit):
+                return False
+            updated = connection.execute(
+                "UPDATE quota_reservations SET units = units + ? WHERE reservation_id = ?",
+                (units, reservation.reservation_id)).rowcount
+            if updated == 0:
+                # released meanwhile (e.g. the scheduler restarted), reserve it again for
+                # the same job so release_jobs still finds it
+                connection.execute(
+                    "INSERT INTO quota_reservations (reservation_id, token_uid, platform, day, units, job_uid, created) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (reservation.reservation_id, reservation.token_uid, reservation.platform,
+                     reservation.day, reservation.units + units, reservation.job_uid, datetime.now().isoformat()))
+
+        reservation.units = reservation.units + units
+        return True
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    def commit(self,
+               reservation_id : str,
+               units_used : int) -> None:
+        """Record units_used as used by the token and delete the reservation (the units which
+        were not used are available again)
+
+        Args:
+            reservation_id (str): id of the reservation
+            units_used (int): units actually spent
+        """
+        with self._transaction() as connection:
+            row = connection.execute(
+                "SELECT token_uid, platform, day FROM quota_reservations WHERE reservation_id = ?",
+                (reservation_id,)).fetchone()
+            if row is None:
+                self._logger.warning('Unknown quota reservation %s, %d unit(s) not recorded',
+                                     reservation_id, units_used)
+                return
+            connection.execute("DELETE FROM quota_reservations WHERE reservation_id = ?", (reservation_id,))
+            connection.execute(
+                "INSERT INTO quota_usage (token_uid, platform, day, used) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (token_uid, platform, day) DO UPDATE SET used = used + excluded.used",
+                (row[0], row[1], row[2], units_used))
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    def release(self,
+                reservation_id : str) -> None:
+        """Delete a reservation without recording any use
+
+        Args:
+            reservation_id (str): id of the reservation
+        """
+        with self._transaction() as connection:
+            connection.execute("DELETE FROM quota_reservations WHERE reservation_id = ?", (reservation_id,))
+
+    #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    def release_jobs(self,
+                     job_uids : list) -> int:
+        """Delete the reservations held by jobs which are no longer running (e.g. left by a
+        worker which died)
+
+        Args:
+            job_uids (list): uids of the jobs
+
+        Returns:
+            int: number of reservations deleted
+        """
+        job_uids = list(job_uids)
+        deleted = 0
+        with self._transaction() as connection:
+            # SQLite limits the number of parameters of a query
+            for start in range(0, len(job_uids), 500):
+                uids = job_uids[start:start + 500]
+                deleted = deleted + connection.execute(
+                    "DELETE FROM quota_reservations WHERE job_uid IN ({})".format(",".join("?" * len(uids))),
+                    uids).rowcount
+        return deleted
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+class _Transaction:
+    """Connection to the ledger holding SQLite's write lock (BEGIN IMMEDIATE) until the
+    end of the with block, so reads and writes in it are atomic across processes
+    """
+
+    def __init__(self, path : str):
+        self._connection = sqlite3.connect(path, timeout=30, isolation_level=None)
+
+    def __enter__(self) -> sqlite3.Connection:
+        self._connection.execute("BEGIN IMMEDIATE")
+        return self._connection
+
+    def __exit__(self, exc_type, exc, traceback) -> None:
+        try:
+            self._connection.execute("ROLLBACK" if exc_type else "COMMIT")
+        finally:
+            self._connection.close()
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+_quota_ledger = None
+_quota_ledger_lock = threading.Lock()
+
+def get_quota_ledger() -> QuotaLedger:
+    """Ledger shared by all the jobs of the process (stored in config.QUOTA_LEDGER_PATH)
+
+    Returns:
+        QuotaLedger: the ledger
+    """
+    global _quota_ledger
+    with _quota_ledger_lock:
+        if _quota_ledger is None:
+            _quota_ledger = QuotaLedger(config.QUOTA_LEDGER_PATH)
+        return _quota_ledger
@@ -6,27 +6,37 @@ BASE_DIR = Path(__file__).resolve().parent.parent.as_posix()
 sys.path.insert(0, BASE_DIR)
 
 import Config as config
-from Scheduler.utils import  WAIT_TIME
+from Scheduler.utils import  WAIT_TIME, PROCESS_JOB_TYPES
+from Scheduler.job_sources import create_job_source
 from job_scheduler import JobScheduler           
 
 from Scheduler.ToolInterfaces.reddit_api_interface import reddit_interface
 from ToolInterfaces.CrawlerInterface import CrawlerInterface
-from ToolInterfaces.YouTubeInterface import YouTubeInterface
+from ToolInterfaces.YouTubeInterface import YouTubeInterface, estimate_job_cost as estimate_youtube_job_cost
 
-def main():
+def initialize_logging():
     """
-    Setup and run the job scheduler
+    Configure logging, also used to set up logging in the scheduler's worker processes
     """
-    # Initialize logging
     rcs.utils.configure_logging(level=config.LOGGER_LEVEL,
                                 output_directory=config.LOGGER_DIR_PATH,
                                 output_filename_prefix=config.LOGGER_FILE_PREFIX,
                                 n_log_files=config.N_LOG_FILES)
 
-    js = JobScheduler(wait_time=WAIT_TIME)
+def main():
+    """
+    Setup and run the job scheduler
+    """
+    # Initialize logging
+    initialize_logging()
+
+    js = JobScheduler(wait_time=WAIT_TIME,
+                      process_job_types=PROCESS_JOB_TYPES,
+                      process_initializer=initialize_logging,
+                      job_source=create_job_source())
 
     js.add_job_type('REDDIT', reddit_interface)
-    js.add_job_type('YOUTUBE', YouTubeInterface)
+    js.add_job_type('YOUTUBE', YouTubeInterface, estimate_youtube_job_cost)
     js.add_job_type('CRAWL', CrawlerInterface)
 
     js.run()
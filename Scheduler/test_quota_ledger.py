@@ -0,0 +1,158 @@
+""" Tests of the quota ledger against a temporary SQLite file.
+
+Run with: python -m pytest Scheduler/test_quota_ledger.py
+"""
+import pytest
+
+import Scheduler.quota_ledger as quota_ledger
+from Scheduler.quota_ledger import QuotaLedger
+
+TOKEN = 'token-1'
+PLATFORM = 'YOUTUBE'
+LIMIT = 1000
+TODAY = '2024-01-02'
+YESTERDAY = '2024-01-01'
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+@pytest.fixture
+def day(monkeypatch):
+    """Current quota day, set days['today'] to change it"""
+    days = {'today' : TODAY}
+    monkeypatch.setattr(quota_ledger, 'quota_day', lambda now=None: days['today'])
+    return days
+
+@pytest.fixture
+def ledger(tmp_path, day):
+    return QuotaLedger(str(tmp_path / 'quota_ledger.sqlite3'), daily_limits={PLATFORM : LIMIT})
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+def test_reserve_within_limit(ledger):
+    assert ledger.reserve(TOKEN, PLATFORM, 600) is not None
+    assert ledger.reserve(TOKEN, PLATFORM, 600) is None
+    assert ledger.reserve(TOKEN, PLATFORM, 400) is not None
+    assert ledger.remaining(TOKEN, PLATFORM) == 0
+
+def test_take_extends_by_blocks_then_by_what_is_missing(ledger):
+    reservation = ledger.reserve(TOKEN, PLATFORM, 0, block=300)
+
+    assert reservation.take(100)
+    assert reservation.units == 300
+    # more than a block is missing
+    assert reservation.take(750)
+    assert reservation.units == 850
+    # no whole block left, only the missing units are reserved
+    assert reservation.take(100)
+    assert reservation.units == 950
+    assert reservation.take(50)
+    assert reservation.units == 1000
+    assert not reservation.take(1)
+    assert reservation.take(1, force=True)
+    assert ledger.used(TOKEN, PLATFORM) == 1001
+
+def test_commit_records_taken_units_and_releases_the_rest(ledger):
+    reservation = ledger.reserve(TOKEN, PLATFORM, 500)
+    reservation.take(120)
+    reservation.commit()
+
+    assert ledger.used(TOKEN, PLATFORM) == 120
+    assert not reservation.take(1)
+    # a closed reservation is not committed twice
+    reservation.commit()
+    assert ledger.used(TOKEN, PLATFORM) == 120
+
+def test_release_records_nothing(ledger):
+    reservation = ledger.reserve(TOKEN, PLATFORM, 500)
+    reservation.take(120)
+    reservation.release()
+
+    assert ledger.used(TOKEN, PLATFORM) == 0
+
+def test_adopt_returns_the_reservation_of_the_job(ledger):
+    ledger.reserve(TOKEN, PLATFORM, 300, job_uid='job-1')
+
+    reservation = ledger.adopt('job-1')
+    assert reservation.units == 300
+    assert reservation.token_uid == TOKEN
+    assert reservation.job_uid == 'job-1'
+    assert ledger.adopt('job-2') is None
+
+    reservation.take(50)
+    reservation.commit()
+    assert ledger.used(TOKEN, PLATFORM) == 50
+
+def test_extend_after_release_keeps_the_job(ledger):
+    reservation = ledger.reserve(TOKEN, PLATFORM, 100, job_uid='job-1')
+    assert ledger.release_jobs(['job-1']) == 1
+
+    # the job did not stop, its next extension reserves the units again
+    assert reservation.take(200)
+    assert ledger.used(TOKEN, PLATFORM) == reservation.units
+    assert ledger.release_jobs(['job-1']) == 1
+    assert ledger.used(TOKEN, PLATFORM) == 0
+
+def test_release_jobs_only_releases_their_reservations(ledger):
+    ledger.reserve(TOKEN, PLATFORM, 100, job_uid='job-1')
+    ledger.reserve(TOKEN, PLATFORM, 200, job_uid='job-2')
+
+    assert ledger.release_jobs(['job-1', 'job-3']) == 1
+    assert ledger.used(TOKEN, PLATFORM) == 200
+
+def test_reservation_stays_in_the_day_it_was_made(ledger, day):
+    reservation = ledger.reserve(TOKEN, PLATFORM, 0)
+    reservation.take(900)
+
+    day['today'] = '2024-01-03'
+    assert ledger.used(TOKEN, PLATFORM) == 0
+    # the extension counts against the limit of the day of the reservation
+    assert not reservation.take(200)
+    reservation.commit()
+
+    assert ledger.used(TOKEN, PLATFORM) == 0
+    assert ledger.used(TOKEN, PLATFORM, day=TODAY) == 900
+
+def test_reservations_of_past_days_are_deleted(tmp_path, day):
+    path = str(tmp_path / 'quota_ledger.sqlite3')
+    day['today'] = YESTERDAY
+    QuotaLedger(path, daily_limits={PLATFORM : LIMIT}).reserve(TOKEN, PLATFORM, 300, job_uid='job-1')
+
+    day['today'] = TODAY
+    ledger = QuotaLedger(path, daily_limits={PLATFORM : LIMIT})
+    assert ledger.used(TOKEN, PLATFORM, day=YESTERDAY) == 0
+    assert ledger.adopt('job-1') is None
+
+def test_sync_used_raises_the_units_committed(ledger):
+    reservation = ledger.reserve(TOKEN, PLATFORM, 300, job_uid='job-1')
+
+    assert ledger.sync_used(TOKEN, PLATFORM, 500) == 500
+    assert ledger.committed(TOKEN, PLATFORM) == 500
+    # the reservations still count against the limit
+    assert ledger.remaining(TOKEN, PLATFORM) == 200
+    # units already committed are not added again
+    assert ledger.sync_used(TOKEN, PLATFORM, 400) == 500
+
+    reservation.take(100)
+    reservation.commit()
+    assert ledger.committed(TOKEN, PLATFORM) == 600
+    assert ledger.used(TOKEN, PLATFORM) == 600
+
+def test_reservations_released_unspent_are_not_synced_as_used(ledger):
+    ledger.reserve(TOKEN, PLATFORM, 400, job_uid='job-1')
+    reservation = ledger.reserve(TOKEN, PLATFORM, 300, job_uid='job-2')
+    reservation.take(100)
+    reservation.commit()
+
+    # job-2 reports what the token committed, job-1's reservation is not in it
+    reported = ledger.committed(TOKEN, PLATFORM)
+    assert reported == 100
+
+    # the next job syncs the report while job-1 still holds its reservation
+    assert ledger.sync_used(TOKEN, PLATFORM, reported) == 100
+    assert ledger.release_jobs(['job-1']) == 1
+    # and once job-1 released it unspent
+    assert ledger.sync_used(TOKEN, PLATFORM, reported) == 100
+
+    assert ledger.committed(TOKEN, PLATFORM) == 100
+    assert ledger.used(TOKEN, PLATFORM) == 100
+    assert ledger.remaining(TOKEN, PLATFORM) == LIMIT - 100
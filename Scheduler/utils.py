@@ -2,6 +2,16 @@ import os
 from pathlib import Path
 
 WAIT_TIME = 5 # Amount of time to sleep before checking the data base for new jobs
+MIN_WAIT_TIME = 1 # Shortest wait between checks, used right after new jobs were found
+MAX_WAIT_TIME = 60 # Longest wait between checks, reached by backing off while idle
+
+# How the scheduler waits between checks of the DB: 'polling' or 'notify' (polling, woken up
+# early through the socket below, see job_sources.py)
+JOB_SOURCE = 'notify'
+
+# Local socket the backend can poke (e.g. echo job > /dev/udp/127.0.0.1/6011) to wake the scheduler
+NOTIFY_HOST = '127.0.0.1'
+NOTIFY_PORT = 6011
 BASE_DIR = BASE_DIR = Path(__file__).resolve().parent.parent
 SCHEDULER_DIR = os.path.join(BASE_DIR, 'Scheduler')
 
@@ -13,4 +23,47 @@ TWITTER_JOB = 'TWITTER'
 JOB_TYPE_LIST = [REDDIT_JOB,
                  CRAWL_JOB,
                  YOUTUBE_JOB,
-                 TWITTER_JOB]
\ No newline at end of file
+                 TWITTER_JOB]
+
+MAX_WORKERS = 8 # Maximum number of jobs the scheduler runs at the same time
+
+# Maximum number of jobs of each type that can run at the same time
+PLATFORM_CONCURRENCY_LIMITS = {REDDIT_JOB : 2,
+                               CRAWL_JOB : 2,
+                               YOUTUBE_JOB : 4}
+
+
+MAX_PROCESS_WORKERS = 4 # Maximum number of worker processes used for PROCESS_JOB_TYPES
+
+# Job types run in worker processes instead of threads, e.g. [YOUTUBE_JOB]
+PROCESS_JOB_TYPES = []
+
+# Retry policy used to deliver job status updates to the API
+# A tool which delivered the final status of its job itself (e.g. with the job's other changes) sets
+# job_json[STATUS_DELIVERED_KEY] to it, genericInterface does not send it again
+STATUS_DELIVERED_KEY = 'delivered_job_status'
+STATUS_UPDATE_DEADLINE = 30 # Seconds before an undelivered status goes to the outbox
+STATUS_UPDATE_BASE_DELAY = 0.5 # First retry delay in seconds, doubled on every retry
+STATUS_UPDATE_MAX_DELAY = 8 # Longest delay between two retries
+CIRCUIT_FAILURE_THRESHOLD = 5 # Consecutive failures before requests stop being sent
+CIRCUIT_RESET_TIMEOUT = 30 # Seconds before a trial request is sent again
+STATUS_OUTBOX_MAX_ATTEMPTS = 1000 # Failed replays before an undelivered status is dropped (dead letter)
+STATUS_OUTBOX_MAX_AGE = 3 * 24 * 60 * 60 # Seconds before an undelivered status is dropped (dead letter)
+
+# Quota ledger (see quota_ledger.py)
+QUOTA_RESET_TIMEZONE = 'America/Los_Angeles' # The YouTube Data API quota resets at midnight Pacific time
+QUOTA_RESERVATION_BLOCK = 500 # Minimum number of units a job adds to its reservation at once
+
+# Units a token can use per quota day, platforms not listed (or None) are only accounted.
+# YouTube: the 10000 units of the API minus the safety backup kept by the YouTube tool
+DAILY_QUOTA_LIMITS = {YOUTUBE_JOB : 9900,
+                      REDDIT_JOB : None}
+
+# Fair share of the workers between users (see fair_queue.py)
+USER_WEIGHTS = {} # user_uid -> weight, a user with weight 2 gets twice the workers of a user with weight 1
+DEFAULT_USER_WEIGHT = 1 # Weight of the users not in USER_WEIGHTS
+
+# Priority of the jobs whose job_tag contains the word, it orders the jobs of a user
+JOB_TAG_PRIORITIES = {'priority:high' : 1,
+                      'priority:low' : -1}
+JOB_AGING_INTERVAL = 3600 # Seconds a job waits to gain one priority level
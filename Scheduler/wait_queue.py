@@ -0,0 +1,89 @@
+""" Paused jobs wait in the WaitQueue until the quota of their token is reset.
+
+Jobs are indexed by the instant they can run again (the first quota reset after they were
+paused, see quota_ledger.next_quota_reset) and each one is released once, when it passes.
+"""
+from datetime import datetime
+import heapq
+import threading
+from typing import List
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+class WaitQueue:
+    """Time indexed queue (a heap ordered by release instant) of waiting jobs
+    """
+
+    def __init__(self):
+
+        self._heap = []
+
+        # job_uid -> release instant of the jobs waiting, entries of the heap which do not
+        # match it are stale (the job was discarded or added again)
+        self._release_at = {}
+
+        self._lock = threading.Lock()
+
+    def add(self,
+            job_uid : str,
+            release_at : datetime) -> None:
+        """Make job_uid wait until release_at
+
+        Args:
+            job_uid (str): uid of the job
+            release_at (datetime): aware datetime the job is released at
+        """
+        with self._lock:
+            if self._release_at.get(job_uid) == release_at:
+                return
+            self._release_at[job_uid] = release_at
+            heapq.heappush(self._heap, (release_at, job_uid))
+
+    def discard(self,
+                job_uid : str) -> None:
+        """Stop waiting for job_uid
+
+        Args:
+            job_uid (str): uid of the job
+        """
+        with self._lock:
+            self._release_at.pop(job_uid, None)
+
+    def pop_due(self,
+                now : datetime) -> List[str]:
+        """Remove and return the jobs whose release instant has passed
+
+        Args:
+            now (datetime): aware datetime
+
+        Returns:
+            List[str]: uids of the released jobs, in release order
+        """
+        released = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                release_at, job_uid = heapq.heappop(self._heap)
+                if self._release_at.get(job_uid) == release_at:
+                    del self._release_at[job_uid]
+                    released.append(job_uid)
+        return released
+
+    def next_release(self) -> datetime:
+        """Instant the next job is released
+
+        Returns:
+            datetime: release instant, None if no job is waiting
+        """
+        with self._lock:
+            while self._heap and self._release_at.get(self._heap[0][1]) != self._heap[0][0]:
+                heapq.heappop(self._heap)
+            return self._heap[0][0] if self._heap else None
+
+    def __contains__(self,
+                     job_uid : str) -> bool:
+        with self._lock:
+            return job_uid in self._release_at
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._release_at)
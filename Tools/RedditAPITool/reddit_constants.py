@@ -117,6 +117,12 @@ class RedditConstants:
 
     RESPONSE_BREAK = '============================================================================='
 
+    # job_submit output formats, TEXT is the plain text dump separated by RESPONSE_BREAK
+    OUTPUT_FORMAT_TEXT = 'TEXT'
+    OUTPUT_FORMAT_PARQUET = 'PARQUET'
+    PARQUET_ROW_GROUP_SIZE = 50000
+    PARQUET_COMPRESSION = 'zstd'
+
     # Command line arguement strings
     CL_ARG_SORT_BY_KEY = 'sortBy'
     CL_ARG_SORT_BY_HELP = 'options: top, hot, new'
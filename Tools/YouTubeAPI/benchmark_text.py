@@ -0,0 +1,80 @@
+from Tools.YouTubeAPI.youtube.comments import Comments
+import Tools.YouTubeAPI.youtube.config as config
+import Tools.YouTubeAPI.youtube.text as text
+import random
+import sys
+import time
+
+#*****************************************************************************************************
+#Compares the normalization of the comments' text in text.py with the BeautifulSoup + emoji functions
+#of Comments (soupify_comment and demojize_comment) on a synthetic set of textDisplay values.
+#Usage: python -m Tools.YouTubeAPI.benchmark_text [number of comments] [processes]
+#*****************************************************************************************************
+
+WORDS = ["great", "video", "thanks", "for", "sharing", "this", "I", "think", "the", "part", "about", "was",
+         "really", "interesting", "lol", "agree", "music", "at", "love", "it", "first", "time", "watching"]
+EMOJIS = ["\U0001F602", "❤️", "\U0001F44D", "\U0001F525", "\U0001F60D", "\U0001F64F"]
+
+
+#*****************************************************************************************************
+#Generates a comment like the textDisplay of the API: mostly plain text, some with links, bold text,
+#line breaks, escaped characters or emojis
+#*****************************************************************************************************
+def generate_comment(rand):
+    comment = " ".join(rand.choice(WORDS) for _ in range(rand.randint(3, 40)))
+    kind = rand.random()
+    if kind < 0.55:
+        return comment
+    if kind < 0.65:
+        return comment + ' <a href="https://www.youtube.com/watch?v=abc&amp;t=42">0:42</a> ' + comment
+    if kind < 0.72:
+        return "<b>" + comment + "</b><br>" + comment
+    if kind < 0.80:
+        return comment + " &quot;quoted&quot; &lt;3 &amp; &#39;more&#39;"
+    return comment + " " + "".join(rand.choice(EMOJIS) for _ in range(rand.randint(1, 5)))
+
+
+def current_normalization(comments_object, comments):
+    normalized = []
+    for comment in comments:
+        if len(comment) > 0:
+            comment = comments_object.soupify_comment(comment)
+            comment = comments_object.demojize_comment(comment)
+        normalized.append(comment)
+    return normalized
+
+
+def measure(name, function, count):
+    start = time.perf_counter()
+    result = function()
+    elapsed = time.perf_counter() - start
+    print(f"{name:<30} {elapsed:8.3f} s  {count / elapsed:12,.0f} comments/s")
+    return result, elapsed
+
+
+##########################################################################################################
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    processes = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+
+    rand = random.Random(0)
+    comments = [generate_comment(rand) for _ in range(count)]
+    comments_object = Comments(None)
+
+    print(f"{count} comments")
+    expected, current_time = measure("BeautifulSoup + emoji", lambda: current_normalization(comments_object, comments), count)
+    single, single_time = measure("text.normalize_comment", lambda: [text.normalize_comment(c) for c in comments], count)
+    batch, batch_time = measure("text.normalize_comments", lambda: text.normalize_comments(comments), count)
+
+    config.TEXT_NORMALIZATION_PROCESSES = processes
+    config.TEXT_NORMALIZATION_MIN_POOL_BATCH = 1
+    #The first call starts the processes
+    text.normalize_comments(comments[:processes])
+    pool, pool_time = measure(f"text.normalize_comments ({processes} p.)", lambda: text.normalize_comments(comments), count)
+
+    print()
+    for name, result in [("normalize_comment", single), ("normalize_comments", batch), ("pool", pool)]:
+        differences = sum(1 for a, b in zip(expected, result) if a != b)
+        print(f"{name}: {differences} differences with the current functions")
+    print(f"Speed-up: {current_time / single_time:.1f}x (single), {current_time / batch_time:.1f}x (batch), "
+          f"{current_time / pool_time:.1f}x (pool)")
@@ -0,0 +1,154 @@
+from Tools.YouTubeAPI.youtube.comments import Comments
+from Tools.YouTubeAPI.youtube.state import State
+import Tools.YouTubeAPI.youtube.config as config
+import copy
+import json
+import os
+import sys
+import time
+
+#*****************************************************************************************************
+#Regression check of the comments' text format (job option text_format).
+#The fixture has the same plain comments (no formatting, one line) as returned by commentThreads with
+#textFormat=html and textFormat=plainText. The records created from both by Comments (with a stubbed
+#service returning the fixture) must be identical.
+#Then it measures the CPU time used to create the records of 10k comments in each format.
+#Usage: python -m Tools.YouTubeAPI.check_text_format [number of comments]
+#*****************************************************************************************************
+
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "comment_threads_text_format.json")
+
+
+#*****************************************************************************************************
+#Stub of the YouTube service: commentThreads().list returns the pages of the requested textFormat, one
+#page per request (the page token is the index of the page)
+#*****************************************************************************************************
+class FixtureRequest:
+    def __init__(self, response):
+        self._response = response
+
+    def execute(self, http=None):
+        return self._response
+
+
+class FixtureResource:
+    def __init__(self, pages):
+        self._pages = pages
+
+    def list(self, textFormat=None, pageToken=None, **kwargs):
+        pages = self._pages.get(textFormat, [])
+        page = int(pageToken or 0)
+        response = {"items": pages[page] if page < len(pages) else []}
+        if page + 1 < len(pages):
+            response["nextPageToken"] = str(page + 1)
+        return FixtureRequest(response)
+
+
+class FixtureService:
+    def __init__(self, pages):
+        self._pages = pages
+
+    def commentThreads(self):
+        return FixtureResource(self._pages)
+
+    def comments(self):
+        #The replies are all in the fixture's threads, a request for more returns none
+        return FixtureResource({})
+
+
+class FixtureYoutube:
+    def __init__(self, pages):
+        self.service = FixtureService(pages)
+        self.state = State(self, 0)
+
+
+#*****************************************************************************************************
+#Creates the records of the comments of video_id in the pages (lists of commentThreads items) of text_format with
+#Comments._get_single_video_comments_and_commenters. With html_reference the text is normalized with
+#BeautifulSoup and emoji (Comments.soupify_comment and demojize_comment, the functions used before text.py)
+#*****************************************************************************************************
+def create_records(video_id, text_format, pages, html_reference=False):
+    comments = Comments(FixtureYoutube({text_format: pages}))
+    comments.text_format = text_format
+    if html_reference:
+        comments.normalize_response_comments = lambda items: {}
+        comments.normalize_comment = lambda comment, normalized=None: comments.demojize_comment(comments.soupify_comment(comment)) if comment else comment
+
+    total = sum(1 + len(item.get("replies", {}).get("comments", [])) for page in pages for item in page)
+    records, _, fully_retrieved = comments._get_single_video_comments_and_commenters(video_id, total, {}, [])
+    if not fully_retrieved:
+        raise RuntimeError(f"The {text_format} comments were not fully retrieved")
+
+    records = comments.export_records(records, {})
+    for record in records.values():
+        record.pop("scrappedAt", None)
+    return records
+
+
+#*****************************************************************************************************
+#Returns pages of 100 items with at least count comments, the texts are made unique so they are not
+#normalized only once
+#*****************************************************************************************************
+def generate_pages(items, count):
+    pages = []
+    page = []
+    total = 0
+    while total < count:
+        for item in items:
+            item = copy.deepcopy(item)
+            for snippet in [item["snippet"]["topLevelComment"]["snippet"]] + [reply["snippet"] for reply in item.get("replies", {}).get("comments", [])]:
+                snippet["textDisplay"] = snippet["textDisplay"] + f" #{total}"
+                snippet["textOriginal"] = snippet["textOriginal"] + f" #{total}"
+                total = total + 1
+            page.append(item)
+            if len(page) == config.MAX_COMMENTS_PER_REQUEST:
+                pages.append(page)
+                page = []
+    if page:
+        pages.append(page)
+    return pages, total
+
+
+def cpu_time(video_id, text_format, pages, html_reference=False):
+    start = time.process_time()
+    create_records(video_id, text_format, pages, html_reference)
+    return time.process_time() - start
+
+
+##########################################################################################################
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+
+    with open(FIXTURE, encoding="utf-8") as fixture_file:
+        fixture = json.load(fixture_file)
+
+    video_id = fixture["video_id"]
+    html = config.TEXT_FORMAT_HTML
+    plain = config.TEXT_FORMAT_PLAIN_TEXT
+
+    html_records = create_records(video_id, html, [fixture["items"]["html"]])
+    plain_records = create_records(video_id, plain, [fixture["items"]["plainText"]])
+    reference_records = create_records(video_id, html, [fixture["items"]["html"]], html_reference=True)
+
+    differences = [key for key in reference_records if html_records.get(key) != reference_records[key] or plain_records.get(key) != reference_records[key]]
+    print(f"{len(reference_records)} records in the fixture, {len(differences)} differences between html, plainText and BeautifulSoup")
+    for key in differences:
+        print(f"  {key}: html={html_records.get(key, {}).get('comment')!r} plainText={plain_records.get(key, {}).get('comment')!r} "
+              f"BeautifulSoup={reference_records[key]['comment']!r}")
+
+    html_pages, total = generate_pages(fixture["items"]["html"], count)
+    plain_pages, _ = generate_pages(fixture["items"]["plainText"], count)
+
+    reference_time = cpu_time(video_id, html, html_pages, html_reference=True)
+    html_time = cpu_time(video_id, html, html_pages)
+    plain_time = cpu_time(video_id, plain, plain_pages)
+
+    per_10k = 10000 / total
+    print(f"\nCPU time per 10k comments ({total} comments):")
+    print(f"  html with BeautifulSoup  {reference_time * per_10k:8.3f} s")
+    print(f"  html                     {html_time * per_10k:8.3f} s")
+    print(f"  plainText                {plain_time * per_10k:8.3f} s")
+    print(f"  saved by plainText       {(html_time - plain_time) * per_10k:8.3f} s "
+          f"({(reference_time - plain_time) * per_10k:.3f} s compared with BeautifulSoup)")
+
+    sys.exit(1 if differences else 0)
@@ -0,0 +1,53 @@
+import logging
+import Tools.YouTubeAPI.youtube.config as config
+from Tools.YouTubeAPI.youtube.utils import log_format
+
+logger = logging.getLogger('youtube.batch')
+
+
+class Batch:
+    def __init__(self, youtube) -> None:
+        logger.debug("Initializing Batch object.")
+        self._youtube = youtube
+
+    # *****************************************************************************************************
+    # This function sends a list of requests (e.g. videos().list, channels().list) in multipart batches of
+    # config.MAX_REQUESTS_PER_BATCH requests, one HTTP round trip per batch instead of one per request.
+    # YouTube charges every request of a batch, units are reserved for each request before it is added.
+    # Returns a list with (response, error) for each request, in the order of requests. error is the
+    # HttpError of the request, or None. Requests which did not fit in the quota are not sent, both
+    # response and error are None (and state.quota_exceeded is set)
+    # *****************************************************************************************************
+    def execute(self, requests, units_per_request):
+
+        results = [(None, None)] * len(requests)
+
+        def callback(request_id, response, exception):
+            results[int(request_id)] = (response, exception)
+
+        start = 0
+        while start < len(requests):
+            end = min(start + config.MAX_REQUESTS_PER_BATCH, len(requests))
+
+            batch = self._youtube.service.new_batch_http_request(callback=callback)
+            added = 0
+            for index in range(start, end):
+                if not self._youtube.state.reserve_quota(units_per_request):
+                    self._youtube.state.quota_exceeded = True
+                    break
+                batch.add(requests[index], request_id=str(index))
+                added = added + 1
+
+            if added == 0:
+                break
+
+            msg = f"Sending {added} requests in one batch."
+            st = log_format("execute", msg)
+            logger.debug(st)
+            batch.execute()
+
+            if added < end - start:
+                break
+            start = end
+
+        return results
@@ -0,0 +1,129 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+import Tools.YouTubeAPI.youtube.config as config
+
+logger = logging.getLogger('youtube.channel_cache')
+
+
+class ChannelCache:
+    # *****************************************************************************************************
+    # Channels' metadata shared by all the jobs of the process, so popular creators and commenters are not
+    # requested (and charged) again by every job.
+    # Records expire after ttl seconds. In memory at most max_size channels are kept, the least recently used
+    # are evicted first. If path is given the records are also stored in a SQLite file, which survives restarts
+    # and is consulted when a channel is not in memory.
+    # *****************************************************************************************************
+    def __init__(self, ttl=config.CHANNEL_CACHE_TTL, max_size=config.CHANNEL_CACHE_MAX_SIZE, path=None) -> None:
+        logger.debug("Initializing ChannelCache object.")
+        self._ttl = ttl
+        self._max_size = max_size
+        self._path = path
+        self._records = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        if self._path:
+            directory = os.path.dirname(self._path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with self._connect() as connection:
+                connection.execute("CREATE TABLE IF NOT EXISTS channels ("
+                                   "channel_id TEXT PRIMARY KEY, record TEXT NOT NULL, stored_at REAL NOT NULL)")
+                connection.execute("DELETE FROM channels WHERE stored_at < ?", (time.time() - self._ttl,))
+
+    def _connect(self):
+        return sqlite3.connect(self._path, timeout=30)
+
+    def _expired(self, stored_at):
+        return time.time() - stored_at > self._ttl
+
+    def _store(self, channel_id, record, stored_at):
+        self._records[channel_id] = (record, stored_at)
+        self._records.move_to_end(channel_id)
+        while len(self._records) > self._max_size:
+            self._records.popitem(last=False)
+
+    # *****************************************************************************************************
+    # Returns the records found for channel_ids (a dictionary keyed by channel id) and the list of ids which
+    # are not in the cache
+    # *****************************************************************************************************
+    def get_many(self, channel_ids):
+        found = {}
+        missing = []
+        with self._lock:
+            for channel_id in channel_ids:
+                entry = self._records.get(channel_id)
+                if entry is not None and self._expired(entry[1]):
+                    del self._records[channel_id]
+                    entry = None
+                if entry is None:
+                    missing.append(channel_id)
+                else:
+                    self._records.move_to_end(channel_id)
+                    found[channel_id] = dict(entry[0])
+
+            if missing and self._path:
+                missing = self._get_many_from_file(missing, found)
+
+            self.hits = self.hits + len(found)
+            self.misses = self.misses + len(missing)
+
+        return found, missing
+
+    def _get_many_from_file(self, channel_ids, found):
+        rows = {}
+        with self._connect() as connection:
+            #SQLite limits the number of parameters of a query
+            for start in range(0, len(channel_ids), 500):
+                ids = channel_ids[start:start + 500]
+                query = "SELECT channel_id, record, stored_at FROM channels WHERE channel_id IN ({})".format(
+                    ",".join("?" * len(ids)))
+                for channel_id, record, stored_at in connection.execute(query, ids):
+                    rows[channel_id] = (record, stored_at)
+
+        missing = []
+        for channel_id in channel_ids:
+            row = rows.get(channel_id)
+            if row is None or self._expired(row[1]):
+                missing.append(channel_id)
+            else:
+                record = json.loads(row[0])
+                self._store(channel_id, record, row[1])
+                found[channel_id] = dict(record)
+        return missing
+
+    # *****************************************************************************************************
+    # Adds the records (a dictionary keyed by channel id) to the cache
+    # *****************************************************************************************************
+    def put_many(self, records):
+        if not records:
+            return
+        stored_at = time.time()
+        with self._lock:
+            for channel_id, record in records.items():
+                self._store(channel_id, dict(record), stored_at)
+
+            if self._path:
+                with self._connect() as connection:
+                    connection.executemany("INSERT OR REPLACE INTO channels (channel_id, record, stored_at) VALUES (?, ?, ?)",
+                                           [(channel_id, json.dumps(record), stored_at) for channel_id, record in records.items()])
+
+
+_channel_cache = None
+_channel_cache_lock = threading.Lock()
+
+# *****************************************************************************************************
+# Returns the cache shared by all the jobs of the process (configured in config.py)
+# *****************************************************************************************************
+def get_channel_cache():
+    global _channel_cache
+    with _channel_cache_lock:
+        if _channel_cache is None:
+            _channel_cache = ChannelCache(config.CHANNEL_CACHE_TTL, config.CHANNEL_CACHE_MAX_SIZE, config.CHANNEL_CACHE_PATH)
+        return _channel_cache
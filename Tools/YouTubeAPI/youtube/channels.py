@@ -1,6 +1,7 @@
 import logging
 import Tools.YouTubeAPI.youtube.config as config
 import traceback
+from Tools.YouTubeAPI.youtube.channel_cache import get_channel_cache
 from Tools.YouTubeAPI.youtube.utils import is_quota_exceeded
 from Tools.YouTubeAPI.youtube.utils import preprocess_string
 from Tools.YouTubeAPI.youtube.utils import get_HTTP_error_msg
@@ -9,11 +10,19 @@ from googleapiclient.errors import HttpError
 
 logger = logging.getLogger('youtube.channels')
 
+#Columns of the records created by create_channel_dict
+CHANNEL_COLUMNS = ["channelId", "channel_title", "channel_description", "channel_url", "channel_JoinDate",
+                   "channel_country", "channel_viewCount", "channel_subscriberCount", "channel_videoCount"]
+
 class Channels:
     def __init__(self, youtube) -> None:
         logger.debug("Initializing Channels object")
         self._youtube = youtube
         self.channel_records = {}
+        self._cache = get_channel_cache()
+        #Channels found in the cache and requests (units) not sent because of it
+        self.cache_hits = 0
+        self.cache_units_saved = 0
 
     # *****************************************************************************************************
     # This function retrieves the channels' metadata for each channel in channel_ids
@@ -26,6 +35,12 @@ class Channels:
 
         channel_records = {}
         try:
+            # Reserve the quota before sending the request
+            if not self._youtube.state.reserve_quota(config.UNITS_CHANNELS_LIST):
+                self._youtube.state.quota_exceeded = True
+                self.channel_records = channel_records
+                return channel_records
+
             # Request all channels
             channels_request = self._youtube.service.channels().list(
                 part="contentDetails,id,snippet,statistics,status,topicDetails",
@@ -33,8 +48,6 @@ class Channels:
                 maxResults=config.MAX_CHANNELS_PER_REQUEST,
             )
 
-            # Update quote usage
-            self._youtube.state.update_quota_usage(config.UNITS_CHANNELS_LIST)
             channels_response = channels_request.execute()
             channel_records = self.channel_response_to_dict(channels_response)
         except HttpError as error:
@@ -55,6 +68,75 @@ class Channels:
         self.channel_records = channel_records
         return channel_records
 
+    # *****************************************************************************************************
+    # This function looks up channel_ids in the shared cache, it returns the records found (a dictionary of
+    # dictionaries) and the list of ids which have to be requested
+    # *****************************************************************************************************
+    def get_cached_channels(self, channel_ids):
+
+        channel_records, missing_ids = self._cache.get_many(channel_ids)
+
+        if channel_records:
+            units_saved = (self._youtube.state.total_requests_cost(len(channel_ids), config.MAX_CHANNELS_PER_REQUEST, config.UNITS_CHANNELS_LIST)
+                           - self._youtube.state.total_requests_cost(len(missing_ids), config.MAX_CHANNELS_PER_REQUEST, config.UNITS_CHANNELS_LIST))
+            self.cache_hits = self.cache_hits + len(channel_records)
+            self.cache_units_saved = self.cache_units_saved + units_saved
+            msg = f"Channel cache: {len(channel_records)} hits, {len(missing_ids)} misses, {units_saved} units saved " \
+                  f"({self.cache_hits} hits, {self.cache_units_saved} units saved by this job)."
+            st = log_format("get_cached_channels", msg)
+            logger.info(st)
+
+        return channel_records, missing_ids
+
+    # *****************************************************************************************************
+    # This function retrieves the channels' metadata for several groups of at most
+    # config.MAX_CHANNELS_PER_REQUEST channels, all the requests are sent in batches (see Batch)
+    # Channels in the shared cache (see ChannelCache) are not requested again, unless use_cache is False
+    # (the caller already looked them up with get_cached_channels)
+    # The metadata is returned as a dictionary of dictionaries
+    # *****************************************************************************************************
+    def get_channels_metadata_batch(self, channel_ids_groups, use_cache=True):
+
+        channel_ids_groups = [channel_ids for channel_ids in channel_ids_groups if len(channel_ids) > 0]
+        channel_records = {}
+
+        if use_cache:
+            channel_ids = list(dict.fromkeys(channel_id for channel_ids in channel_ids_groups for channel_id in channel_ids))
+            channel_records, missing_ids = self.get_cached_channels(channel_ids)
+            if channel_records:
+                channel_ids_groups = [missing_ids[start:start + config.MAX_CHANNELS_PER_REQUEST]
+                                      for start in range(0, len(missing_ids), config.MAX_CHANNELS_PER_REQUEST)]
+
+        try:
+            requests = [self._youtube.service.channels().list(
+                part="contentDetails,id,snippet,statistics,status,topicDetails",
+                id=','.join(channel_ids),
+                maxResults=config.MAX_CHANNELS_PER_REQUEST,
+            ) for channel_ids in channel_ids_groups]
+
+            for channels_response, error in self._youtube.batch.execute(requests, config.UNITS_CHANNELS_LIST):
+                if error is not None:
+                    self._youtube.state.quota_exceeded = is_quota_exceeded(error)
+
+                    msg = get_HTTP_error_msg(error)
+                    st = log_format("get_channels_metadata_batch", msg)
+                    logger.error(st)
+                    self._youtube.state.set_error_description(True, msg)
+                elif channels_response is not None:
+                    retrieved_records = self.channel_response_to_dict(channels_response)
+                    self._cache.put_many(retrieved_records)
+                    channel_records.update(retrieved_records)
+
+        except:
+            ex = traceback.format_exc()
+            st = log_format("get_channels_metadata_batch", ex)
+            logger.error(st)
+            st = "Error on getting channel's metadata."
+            self._youtube.state.set_error_description(True, st)
+
+        self.channel_records = channel_records
+        return channel_records
+
     # *****************************************************************************************************
     # This function creates a dictionary with a channel's metadata (send it as parameter).
     # This dictionary will be used to create a record on the output excel file
@@ -1,23 +1,126 @@
 import logging
 import traceback
 import datetime
+import os
+import pickle
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import emoji
 from bs4 import BeautifulSoup
 from googleapiclient.errors import HttpError
+from googleapiclient.http import build_http
 import Tools.YouTubeAPI.youtube.config as config
 from Tools.YouTubeAPI.youtube.utils import is_quota_exceeded
 from Tools.YouTubeAPI.youtube.utils import preprocess_string
 from Tools.YouTubeAPI.youtube.utils import remove_prefix_url
 from Tools.YouTubeAPI.youtube.utils import log_format
 from Tools.YouTubeAPI.youtube.utils import get_HTTP_error_msg
+from Tools.YouTubeAPI.youtube.channels import CHANNEL_COLUMNS
+from Tools.YouTubeAPI.youtube.text import normalize_comment, normalize_comments
+import Tools.YouTubeAPI.youtube.planner as planner
 
 logger = logging.getLogger('youtube.comments')
 
+#Column of each attribute of CommentRow
+COMMENT_FIELDS = [("id", "id"), ("type", "type"), ("Recipient (video or comment)", "recipient"), ("video url", "video_url"),
+                  ("comment", "comment"), ("likeCount", "likeCount"), ("publishedAt", "publishedAt"),
+                  ("scrappedAt", "scrappedAt"), ("totalReplyCount", "totalReplyCount"),
+                  ("authorDisplayName", "authorDisplayName"), ("authorProfileImageUrl", "authorProfileImageUrl"),
+                  ("authorChannelId", "authorChannelId"), ("authorChannelUrl", "authorChannelUrl"),
+                  ("totalComments", "totalComments"), ("comment #", "comment_number")]
+
+#Columns of the comments records (comment and commenter's channel)
+COMMENT_COLUMNS = [column for column, _ in COMMENT_FIELDS] + CHANNEL_COLUMNS
+
+# The http object of a service is not thread safe, each thread retrieving comments has its own
+_worker = threading.local()
+
+def _init_worker():
+    _worker.http = build_http()
+
+
+# *****************************************************************************************************
+# Commenters (channel ids) of a job. Every commenter is added once (an insertion ordered set, O(1) per
+# commenter) and waits in a queue until its channel's metadata is requested
+# *****************************************************************************************************
+class Commenters(object):
+    def __init__(self) -> None:
+        self._seen = {}
+        self._pending = deque()
+
+    def add(self, channel_ids):
+        for channel_id in channel_ids:
+            if channel_id and channel_id not in self._seen:
+                self._seen[channel_id] = None
+                self._pending.append(channel_id)
+
+    def pending_count(self):
+        return len(self._pending)
+
+    def is_pending(self, channel_id):
+        #The queue is small (less than a group after each lookup)
+        return channel_id in self._pending
+
+    # Removes all the commenters from the queue
+    def take_all(self):
+        channel_ids = list(self._pending)
+        self._pending.clear()
+        return channel_ids
+
+    # Puts back commenters at the front of the queue (keeping their order)
+    def put_back(self, channel_ids):
+        self._pending.extendleft(reversed(channel_ids))
+
+
+# *****************************************************************************************************
+# A comment or reply kept in memory until it is written. The commenter's channel is not copied into the
+# row, the channels are kept once in a separate table (channel_records) and joined when the row is
+# exported with to_dict. Slots instead of a dictionary per row use several times less memory
+# *****************************************************************************************************
+class CommentRow(object):
+    __slots__ = [attribute for _, attribute in COMMENT_FIELDS]
+
+    def __init__(self, totalComments="", comment_number="") -> None:
+        for attribute in self.__slots__:
+            setattr(self, attribute, "")
+        self.totalComments = totalComments
+        self.comment_number = comment_number
+
+    # Returns the record of the comment (columns of COMMENT_COLUMNS), joined with the commenter's channel
+    def to_dict(self, channel_records=None):
+        record = {column: getattr(self, attribute) for column, attribute in COMMENT_FIELDS}
+        if channel_records and self.authorChannelId in channel_records:
+            record.update(channel_records[self.authorChannelId])
+        return record
+
+
 class Comments(object):
     def __init__(self, youtube) -> None:
         logger.debug("Initializing Comments object.")
         self._youtube = youtube
         self.comments_records = {}
+        self._max_concurrent_videos = config.MAX_CONCURRENT_VIDEOS
+        self._executor = None
+        self.text_format = config.COMMENTS_TEXT_FORMAT
+        #If set, the comments retrieval is checkpointed to this file (see save_checkpoint) and on_checkpoint
+        #(if set) is called with the state after each checkpoint
+        self.checkpoint_path = None
+        self.on_checkpoint = None
+        #Page token and comment number where the retrieval of each video stopped (see update_video_progress)
+        self._progress = {}
+        #Videos which the quota plan retrieves over several days
+        self._split_videos = set()
+
+    # *****************************************************************************************************
+    # Executes a request with the http object of the current thread (if it is a comments worker)
+    # *****************************************************************************************************
+    def _execute(self, request):
+        http = getattr(_worker, "http", None)
+        if http is None:
+            return request.execute()
+        return request.execute(http=http)
 
     # *****************************************************************************************************
     # This function gets a comment (a string) which contains html tags and/or html characters and
@@ -34,6 +137,36 @@ class Comments(object):
     def demojize_comment(self, comment):
         return emoji.demojize(comment, delimiters=(" emoji_", " "))
 
+    # *****************************************************************************************************
+    # This function returns the text of a comment (snippet of a comment resource) in the requested format:
+    # textOriginal for plain text, textDisplay (html) otherwise
+    # *****************************************************************************************************
+    def get_comment_text(self, snippet):
+        if self.text_format == config.TEXT_FORMAT_PLAIN_TEXT:
+            return snippet.get("textOriginal", snippet.get("textDisplay", ""))
+        return snippet.get("textDisplay", "")
+
+    # *****************************************************************************************************
+    # This function returns the comment without html and with the emojis' names (same text as soupify_comment
+    # followed by demojize_comment, see text.py). normalized has the texts already normalized in a batch
+    # *****************************************************************************************************
+    def normalize_comment(self, comment, normalized=None):
+        if normalized is not None and comment in normalized:
+            return normalized[comment]
+        return normalize_comment(comment, self.text_format != config.TEXT_FORMAT_PLAIN_TEXT)
+
+    # *****************************************************************************************************
+    # This function normalizes in one batch the text of the comments and replies of a commentThreads response
+    # Returns a dictionary with the normalized text of each original text
+    # *****************************************************************************************************
+    def normalize_response_comments(self, items):
+        comments = []
+        for item in items:
+            comments.append(self.get_comment_text(item.get("snippet", {}).get("topLevelComment", {}).get("snippet", {})))
+            for reply in item.get("replies", {}).get("comments", []):
+                comments.append(self.get_comment_text(reply["snippet"]))
+        return dict(zip(comments, normalize_comments(comments, self.text_format != config.TEXT_FORMAT_PLAIN_TEXT)))
+
 
     # *****************************************************************************************************
     # *****************************************************************************************************
@@ -51,11 +184,12 @@ class Comments(object):
                     part='id,snippet',
                     parentId=parent_id,
                     maxResults=config.MAX_REPLIES_PER_REQUEST,
-                    # textFormat='plainText',
+                    textFormat=self.text_format,
                     pageToken=nextPageToken
                 )
-                self._youtube.state.update_quota_usage(config.UNITS_COMMENTS_LIST)
-                responseCommentsList = requestCommentsList.execute()
+                if not self._youtube.state.reserve_quota(config.UNITS_COMMENTS_LIST):
+                    break
+                responseCommentsList = self._execute(requestCommentsList)
                 list.extend(responseCommentsList['items'])
                 nextPageToken = responseCommentsList.get('nextPageToken')
                 if not nextPageToken:
@@ -71,57 +205,38 @@ class Comments(object):
 
     # *****************************************************************************************************
     # *****************************************************************************************************
-    def create_comment_and_commenter_dict(self, records, item, commentsCount, comment_number, channelId_commenters):
+    def create_comment_and_commenter_dict(self, records, item, commentsCount, comment_number, channelId_commenters, normalized=None):
         now = datetime.datetime.now()
         current_datetime_str = now.strftime("%Y-%m-%d, %H:%M:%S")
 
         count = len(records) + 1
 
-        metadata = {
-            "id": "",
-            "type": "",
-            "Recipient (video or comment)": "",
-            "video url": "",
-            "comment": "",
-            "likeCount": "",
-            "publishedAt": "",
-            "scrappedAt": "",
-            "totalReplyCount": "",
-            "authorDisplayName": "",
-            "authorProfileImageUrl": "",
-            "authorChannelId": "",
-            "authorChannelUrl": "",
-            "totalComments": commentsCount,
-            "comment #": comment_number,
-        }
+        metadata = CommentRow(commentsCount, comment_number)
 
         if "snippet" in item:
             try:
-                metadata["id"] = item["id"]
-                metadata["type"] = "Comment"
-                metadata["Recipient (video or comment)"] = item["snippet"].get("videoId", "")
+                metadata.id = item["id"]
+                metadata.type = "Comment"
+                metadata.recipient = item["snippet"].get("videoId", "")
                 # url = "https://youtu.be/" + item["snippet"].get("videoId","")
                 url = "youtu.be/" + item["snippet"].get("videoId", "")
-                metadata["video url"] = url
-                # metadata["original_comment"] = item["snippet"]["topLevelComment"]["snippet"].get("textDisplay","") #debug only
-                comment = item["snippet"]["topLevelComment"]["snippet"].get("textDisplay", "")
-                if len(comment) > 0:
-                    comment = self.soupify_comment(comment)
-                    comment = self.demojize_comment(comment)
-                metadata["comment"] = preprocess_string(comment)
-                metadata["authorDisplayName"] = preprocess_string(
+                metadata.video_url = url
+                comment = self.get_comment_text(item["snippet"]["topLevelComment"]["snippet"])
+                comment = self.normalize_comment(comment, normalized)
+                metadata.comment = preprocess_string(comment)
+                metadata.authorDisplayName = preprocess_string(
                     item["snippet"]["topLevelComment"]["snippet"].get("authorDisplayName", ""))
-                metadata["authorProfileImageUrl"] = remove_prefix_url(
+                metadata.authorProfileImageUrl = remove_prefix_url(
                     item["snippet"]["topLevelComment"]["snippet"].get("authorProfileImageUrl", ""))
                 commenter_channel_id = item["snippet"]["topLevelComment"]["snippet"]["authorChannelId"].get("value", "")
-                metadata["authorChannelId"] = commenter_channel_id
-                metadata["authorChannelUrl"] = remove_prefix_url(
+                metadata.authorChannelId = commenter_channel_id
+                metadata.authorChannelUrl = remove_prefix_url(
                     item["snippet"]["topLevelComment"]["snippet"].get("authorChannelUrl", ""))
-                metadata["likeCount"] = item["snippet"]["topLevelComment"]["snippet"].get("likeCount", "")
-                metadata["publishedAt"] = item["snippet"]["topLevelComment"]["snippet"].get("publishedAt", "")
-                metadata["scrappedAt"] = current_datetime_str
+                metadata.likeCount = item["snippet"]["topLevelComment"]["snippet"].get("likeCount", "")
+                metadata.publishedAt = item["snippet"]["topLevelComment"]["snippet"].get("publishedAt", "")
+                metadata.scrappedAt = current_datetime_str
                 totalReplies = item["snippet"].get("totalReplyCount", "0")
-                metadata["totalReplyCount"] = totalReplies
+                metadata.totalReplyCount = totalReplies
                 records[count] = metadata
 
                 if commenter_channel_id != "":
@@ -147,30 +262,24 @@ class Comments(object):
 
                     for reply in replies:
                         comment_number = comment_number + 1
-                        metadata = {}
                         count = count + 1
-                        metadata["id"] = reply["id"]
-                        metadata["type"] = "Reply"
-                        metadata["Recipient (video or comment)"] = reply["snippet"].get("parentId", "")
-                        # metadata["original_comment"] = reply["snippet"].get("textDisplay", "")  #debug only
-                        comment = reply["snippet"].get("textDisplay", "")
-                        if len(comment) > 0:
-                            comment = self.soupify_comment(comment)
-                            comment = self.demojize_comment(comment)
-                        metadata["comment"] = preprocess_string(comment)
+                        metadata = CommentRow(commentsCount, comment_number)
+                        metadata.id = reply["id"]
+                        metadata.type = "Reply"
+                        metadata.recipient = reply["snippet"].get("parentId", "")
+                        comment = self.get_comment_text(reply["snippet"])
+                        comment = self.normalize_comment(comment, normalized)
+                        metadata.comment = preprocess_string(comment)
                         commenter_channel_id = reply["snippet"]["authorChannelId"].get("value", "")
-                        metadata["authorChannelId"] = commenter_channel_id
-                        metadata["authorChannelUrl"] = remove_prefix_url(reply["snippet"].get("authorChannelUrl", ""))
-                        metadata["authorDisplayName"] = preprocess_string(reply["snippet"].get("authorDisplayName", ""))
-                        metadata["authorProfileImageUrl"] = remove_prefix_url(
+                        metadata.authorChannelId = commenter_channel_id
+                        metadata.authorChannelUrl = remove_prefix_url(reply["snippet"].get("authorChannelUrl", ""))
+                        metadata.authorDisplayName = preprocess_string(reply["snippet"].get("authorDisplayName", ""))
+                        metadata.authorProfileImageUrl = remove_prefix_url(
                             reply["snippet"].get("authorProfileImageUrl", ""))
-                        metadata["likeCount"] = reply["snippet"].get("likeCount", "")
-                        metadata["publishedAt"] = reply["snippet"].get("publishedAt", "")
-                        metadata["scrappedAt"] = current_datetime_str
-                        metadata["totalReplyCount"] = "N/A"
-                        metadata["video url"] = ""
-                        metadata["totalComments"] = commentsCount
-                        metadata["comment #"] = comment_number
+                        metadata.likeCount = reply["snippet"].get("likeCount", "")
+                        metadata.publishedAt = reply["snippet"].get("publishedAt", "")
+                        metadata.scrappedAt = current_datetime_str
+                        metadata.totalReplyCount = "N/A"
 
                         if commenter_channel_id != "":
                             channelId_commenters.append(commenter_channel_id)
@@ -196,39 +305,40 @@ class Comments(object):
             records = {}
 
         if commentsCount == 0 or commentsCount == 'N/A':
-            return records, commenters_ids
+            return records, commenters_ids, True
 
-        nextPageToken = None
-        count = 0
+        #Continue where a previous retrieval of the video stopped
+        progress = self._youtube.state.videos_progress.get(video_id, {})
+        nextPageToken = progress.get("page_token")
+        count = progress.get("comment_number", 0)
 
         try:
             fully_retrieved = True
             while True:
-                #Check to see if we have quota to retrieve video's comments
-                if not self._youtube.state.under_quota_limit(config.UNITS_COMMENTS_THREADS_LIST):
-                    fully_retrieved = False
-                    break
-
                 # List maxResults videos in a playlist
                 requestCommentsList = self._youtube.service.commentThreads().list(
                     part='id,snippet,replies',
                     videoId=video_id,
                     maxResults=config.MAX_COMMENTS_PER_REQUEST,
-                    # textFormat='plainText',
+                    textFormat=self.text_format,
                     pageToken=nextPageToken
                 )
 
-                self._youtube.state.update_quota_usage(config.UNITS_COMMENTS_THREADS_LIST)
-                responseCommentsList = requestCommentsList.execute()
+                #Reserve the quota before sending the request, stop if we don't have enough
+                if not self._youtube.state.reserve_quota(config.UNITS_COMMENTS_THREADS_LIST):
+                    fully_retrieved = False
+                    break
 
+                responseCommentsList = self._execute(requestCommentsList)
 
+                normalized = self.normalize_response_comments(responseCommentsList['items'])
                 for item in responseCommentsList['items']:
                     count = count + 1
                     before = len(records)
-                    records, commenters_ids = self.create_comment_and_commenter_dict(records, item, commentsCount, count, commenters_ids)
+                    records, commenters_ids = self.create_comment_and_commenter_dict(records, item, commentsCount, count, commenters_ids, normalized)
                     replies = len(records) - before - 1
                     count = count + replies
-                    nextPageToken = responseCommentsList.get('nextPageToken')
+                nextPageToken = responseCommentsList.get('nextPageToken')
 
                 if not nextPageToken:
                     break;
@@ -248,6 +358,9 @@ class Comments(object):
             #self._youtube.state.set_error_description(True, st)
             fully_retrieved = False
 
+        if not fully_retrieved:
+            self._progress[video_id] = {"page_token": nextPageToken, "comment_number": count}
+
         return records, commenters_ids, fully_retrieved
 
     # ***********************************************************************************************************************
@@ -258,18 +371,21 @@ class Comments(object):
     def get_single_video_comments_and_commenters(self, video_id, video_id_comments_count, records=None, commenters_ids=None):
 
         #Estimate the cost of retrieving all comments and the commenters information for a single video
-        comments_cost = self._youtube.state.total_requests_cost(video_id_comments_count,
+        #(only the comments not retrieved yet if the video was partially retrieved)
+        remaining_comments = max(video_id_comments_count - self._youtube.state.videos_progress.get(video_id, {}).get("comment_number", 0), 0)
+        comments_cost = self._youtube.state.total_requests_cost(remaining_comments,
                                                                 config.MAX_COMMENTS_PER_REQUEST,
                                                                 config.UNITS_COMMENTS_LIST)
 
-        commenters_cost = self._youtube.state.total_requests_cost(video_id_comments_count,
+        commenters_cost = self._youtube.state.total_requests_cost(remaining_comments,
                                                                   config.MAX_CHANNELS_PER_REQUEST,
                                                                   config.UNITS_CHANNELS_LIST)
 
         fully_retrieved = False
 
         # We do not have enough quote to retrieve the comments for this video along with its commenter's info
-        if self._youtube.state.under_quota_limit(comments_cost + commenters_cost):
+        # (unless the plan splits the video across several days, then it is retrieved with the quota left)
+        if self._youtube.state.under_quota_limit(comments_cost + commenters_cost) or video_id in self._split_videos:
             ex = "Fetching comments for video: " + video_id
             st = log_format("get_single_video_comments_and_commenters", ex)
             logger.debug(st)
@@ -283,56 +399,81 @@ class Comments(object):
 
 
     # *****************************************************************************************************
+    # Retrieves the comments of a group of videos, at most self._max_concurrent_videos at the same time.
+    # Returns a list with (records, commenters_ids, fully_retrieved) for each video, in the order of videos_ids
     # *****************************************************************************************************
-    def get_commenters_info(self, commenters_ids, channel_records):
+    def get_videos_comments_and_commenters(self, videos_ids):
 
+        def retrieve(video_id):
+            video_id_comments_count = self._youtube.state.comments_count[video_id]
+            return self.get_single_video_comments_and_commenters(video_id, video_id_comments_count, {}, [])
 
-        #Remove ids for which info has already been retrieved
-        id_list = commenters_ids
-        for id in id_list:
-            if id in channel_records.keys():
-                commenters_ids.remove(id)
+        if self._max_concurrent_videos <= 1 or len(videos_ids) <= 1:
+            return [retrieve(video_id) for video_id in videos_ids]
 
-        # Retrieving commenter's info
-        slicing = True
-        start = 0
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self._max_concurrent_videos,
+                                                thread_name_prefix='YouTubeComments',
+                                                initializer=_init_worker)
 
+        #map returns the results in the order of videos_ids, whichever video finishes first
+        return list(self._executor.map(retrieve, videos_ids))
 
-        while (slicing):
-            end = start + config.MAX_CHANNELS_PER_REQUEST
-            if end > len(commenters_ids):
-                end = len(commenters_ids)
-                slicing = False
+    # *****************************************************************************************************
+    # Retrieves the channels' metadata of the pending commenters (see Commenters).
+    # Commenters in the channel cache are taken from it, the others are requested in groups of exactly
+    # config.MAX_CHANNELS_PER_REQUEST, the rest stays pending unless flush_all is True
+    # *****************************************************************************************************
+    def get_commenters_info(self, commenters, channel_records, flush_all=False):
+
+        cached_records, missing_ids = self._youtube.channels.get_cached_channels(commenters.take_all())
+        channel_records.update(cached_records)
 
-            channels_ids = set(commenters_ids[start:end])
-            r = self._youtube.channels.get_channels_metadata(channels_ids)
-            if self._youtube.state.quota_exceeded:
-                break
-            channel_records.update(r)
-            start = end
+        channels_ids_groups = [missing_ids[start:start + config.MAX_CHANNELS_PER_REQUEST]
+                               for start in range(0, len(missing_ids), config.MAX_CHANNELS_PER_REQUEST)]
+        if channels_ids_groups and len(channels_ids_groups[-1]) < config.MAX_CHANNELS_PER_REQUEST and not flush_all:
+            commenters.put_back(channels_ids_groups.pop())
+
+        # Retrieving commenter's info, all the groups are sent in batches
+        r = self._youtube.channels.get_channels_metadata_batch(channels_ids_groups, use_cache=False)
+        channel_records.update(r)
+
+        #The commenters which were not looked up because the quota ran out stay pending
+        if self._youtube.state.quota_exceeded:
+            commenters.put_back([channel_id for group in channels_ids_groups for channel_id in group if channel_id not in r])
 
         return channel_records
 
     # *****************************************************************************************************
-    # This function removes from a list the videos form whom the cost of retrieving all its comments
-    # superpases the available quote
-    # It also removes videos with zero or N/A comments
+    # Splits the records in the ones whose commenter's channel info is available (they can be exported, see
+    # CommentRow.to_dict) and, from the first one whose commenter is still pending, the records to complete
+    # later (so the order is kept)
+    # *****************************************************************************************************
+    def join_commenters_info(self, records, channel_records, commenters):
+        joined = {}
+        waiting = {}
+        for key, item in records.items():
+            channel_id_commenter = item.authorChannelId
+            if waiting or (channel_id_commenter not in channel_records and commenters.is_pending(channel_id_commenter)):
+                waiting[key] = item
+                continue
+            if channel_id_commenter not in channel_records:
+                msg = 'Error getting commenters metadata: ' + channel_id_commenter
+                st = log_format("get_comments_and_commenters", msg)
+                logger.warning(st)
+            joined[key] = item
+        return joined, waiting
+
+    # *****************************************************************************************************
+    # This function removes from a list the videos with zero or N/A comments
+    # Videos whose comments cost more than a day of quota are kept, the quota plan splits them across
+    # several days (see planner.py)
     # *****************************************************************************************************
     def filter_videos_by_comments_count(self, comments_count_original):
         comments_count = {}
         for video_id, total_comments in comments_count_original.items():
             if not (total_comments == '0' or total_comments == 'N/A'):
-                cost = self._youtube.state.total_requests_cost(int(total_comments), config.MAX_COMMENTS_PER_REQUEST,
-                                                 config.UNITS_COMMENTS_LIST)
-                # if cost < 10000:
-                if cost <  config.UNITS_QUOTA_LIMIT:
-                    comments_count[video_id] = int(total_comments)
-                else:
-                    msg  = "Video {} has {} comments. It cannot be retrieved with current quota. ".format(video_id,total_comments)
-                    st = log_format("filter_videos_by_comments_count", msg)
-                    logger.warning(st)
-
-                    # Save to file to notify user - TO DO
+                comments_count[video_id] = int(total_comments)
         return comments_count
 
     # *****************************************************************************************************
@@ -341,23 +482,20 @@ class Comments(object):
     def _get_comments_count(self, videos_ids):
 
         comments_count = {}
-        slice = True
-        start = 0
-        while (slice):
-            end = start + config.MAX_JOIN_VIDEOS_IDS
-            if end > len(videos_ids):
-                end = len(videos_ids)
-                slice = False
-
-            ids = videos_ids[start:end]
-            try:
-                videos_request = self._youtube.service.videos().list(
-                    part="statistics",
-                    id=','.join(ids)
-                )
+        try:
+            # One request per slice of ids, all sent in batches
+            videos_requests = [self._youtube.service.videos().list(
+                part="statistics",
+                id=','.join(videos_ids[start:start + config.MAX_JOIN_VIDEOS_IDS])
+            ) for start in range(0, len(videos_ids), config.MAX_JOIN_VIDEOS_IDS)]
+
+            for videos_response, error in self._youtube.batch.execute(videos_requests, config.UNITS_VIDEOS_LIST):
+                if error is not None:
+                    self._youtube.state.quota_exceeded = is_quota_exceeded(error)
+                    continue
+                if videos_response is None:
+                    continue
 
-                self._youtube.state.update_quota_usage(config.UNITS_VIDEOS_LIST)
-                videos_response = videos_request.execute()
                 r = {}
                 for item in videos_response['items']:
                     if "statistics" in item:
@@ -366,22 +504,18 @@ class Comments(object):
                         r[id] = commentsCount
 
                 comments_count.update(r)
-            except HttpError as error:
-                self._youtube.state.quota_exceeded = is_quota_exceeded(error)
-            except:
-                ex = traceback.format_exc()
-                st = log_format("_get_comments_count", ex)
-                logger.error(st)
-                #self._youtube.state.set_error_description(True, st)
-
-            start = end
+        except:
+            ex = traceback.format_exc()
+            st = log_format("_get_comments_count", ex)
+            logger.error(st)
+            #self._youtube.state.set_error_description(True, st)
 
         return comments_count
 
     # *****************************************************************************************************
     # This funtion retrieves the # of comments for a list of videos ids
     # Returns a dictionary list where the key is the video id.
-    # Sorts the list (by default) from min to max number of comments
+    # The videos are ordered and assigned to quota days by the quota plan (see planner.plan_comments)
     # *****************************************************************************************************
     def get_comments_count(self, videos_ids):
 
@@ -398,13 +532,18 @@ class Comments(object):
             # Obtain the total comments per video_id
             videos_comments_count_original = self._get_comments_count(videos_ids)
 
-            # Remove the un-retrievable videos, i.e., videos for we cannot retrieve their comments with the
-            # full available quota (the cost of retrieving the comments overpasses the 10,000 units)
-            # It also removes videos with zero or N/A comments
+            # Remove the videos with zero or N/A comments
             videos_comments_count = self.filter_videos_by_comments_count(videos_comments_count_original)
 
-            #Update the videos_id only with the videos that we can actually retrieve
-            videos_ids = list(videos_comments_count.keys())
+            # Plan the retrieval of the comments, the videos are retrieved in the order of the plan
+            if not self._youtube.state.plan:
+                self._youtube.state.plan = planner.create_plan()
+            videos_ids = planner.plan_comments(self._youtube.state.plan, videos_comments_count,
+                                               self._youtube.state.current_quota, self._youtube.state.videos_progress)
+
+            msg = f"Quota plan: {self._youtube.state.plan['total']} units over {self._youtube.state.plan['days']} day(s) for {len(videos_ids)} videos."
+            st = log_format("get_comments_count", msg)
+            logger.info(st)
 
 
             self._youtube.state.videos_ids = videos_ids
@@ -437,16 +576,124 @@ class Comments(object):
 
         return new_dict
 
+    # *****************************************************************************************************
+    # Writes the records, joined with their commenter's channel, to writer (if given) and returns the
+    # records still to be kept in memory
+    # *****************************************************************************************************
+    def write_records(self, records, writer, channel_records):
+        if writer is None:
+            return records
+        for key, item in records.items():
+            writer.write(item.to_dict(channel_records), key)
+        return {}
+
+    # *****************************************************************************************************
+    # Returns the records (CommentRow) as dictionaries joined with their commenter's channel
+    # *****************************************************************************************************
+    def export_records(self, records, channel_records):
+        return {key: item.to_dict(channel_records) for key, item in records.items()}
+
+    # *****************************************************************************************************
+    # Moves the page token where the retrieval of a video stopped to the state (it is removed once the video
+    # is fully retrieved)
+    # *****************************************************************************************************
+    def update_video_progress(self, video_id, fully_retrieved):
+        progress = self._progress.pop(video_id, None)
+        if fully_retrieved:
+            self._youtube.state.videos_progress.pop(video_id, None)
+        elif progress is not None:
+            self._youtube.state.videos_progress[video_id] = progress
+
+    # *****************************************************************************************************
+    # Saves a checkpoint of the comments retrieval: the rows written so far are flushed (see RecordWriter.flush),
+    # and the rows still waiting for their commenter's info are saved to self.checkpoint_path with the pending
+    # commenters (and the channels already retrieved for them). Together with the state (videos left, page
+    # tokens) a resumed job continues from here
+    # *****************************************************************************************************
+    def save_checkpoint(self, records, commenters, record_number, writer, channel_records):
+        try:
+            if writer is not None:
+                writer.flush()
+
+            checkpoint = {
+                "records": records,
+                "pending_commenters": commenters.take_all(),
+                "record_number": record_number,
+                "channel_records": {item.authorChannelId: channel_records[item.authorChannelId]
+                                    for item in records.values() if item.authorChannelId in channel_records},
+            }
+            commenters.put_back(checkpoint["pending_commenters"])
+
+            #Written to a temporary file first, a checkpoint is never left half written
+            temporary_path = self.checkpoint_path + ".tmp"
+            with open(temporary_path, 'wb') as file:
+                pickle.dump(checkpoint, file)
+            os.replace(temporary_path, self.checkpoint_path)
+
+            msg = f"Checkpoint: {len(records)} comments waiting, {len(self._youtube.state.videos_ids)} videos left."
+            st = log_format("save_checkpoint", msg)
+            logger.debug(st)
+
+            if self.on_checkpoint is not None:
+                self.on_checkpoint(self._youtube.state)
+        except:
+            ex = traceback.format_exc()
+            st = log_format("save_checkpoint", ex)
+            logger.error(st)
+
+    # *****************************************************************************************************
+    # Returns the records, pending commenters, record number and channel records of the last checkpoint
+    # (if any)
+    # *****************************************************************************************************
+    def load_checkpoint(self):
+        if self.checkpoint_path and os.path.exists(self.checkpoint_path):
+            try:
+                with open(self.checkpoint_path, 'rb') as file:
+                    checkpoint = pickle.load(file)
+                return checkpoint["records"], checkpoint["pending_commenters"], checkpoint["record_number"], checkpoint["channel_records"]
+            except:
+                ex = traceback.format_exc()
+                st = log_format("load_checkpoint", ex)
+                logger.error(st)
+        return {}, [], 0, {}
+
+    def remove_checkpoint(self):
+        if self.checkpoint_path and os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
+
     # *****************************************************************************************************
     # This function retrieves all comments, its replies and its commenters ids (channel id) for a list of
     # videos given as a parameter (videos_id)
+    # If a writer (see utils.open_record_writer) is given, the comments are written to it after each
+    # group of videos instead of being kept in memory, and an empty dictionary is returned
+    # If self.checkpoint_path is set the retrieval is checkpointed every config.COMMENTS_CHECKPOINT_INTERVAL
+    # seconds and when it stops before the end (e.g. quota exceeded), and continues from the last checkpoint
+    # *****************************************************************************************************
+    def get_comments_and_commenters(self, videos_ids, writer=None):
+        try:
+            return self._get_comments_and_commenters(videos_ids, writer)
+        finally:
+            #The threads retrieving the videos (and their http objects) are not kept after the job
+            self.shutdown_executor()
+
+    # *****************************************************************************************************
+    # Stops the threads retrieving the comments of several videos at the same time, if any
     # *****************************************************************************************************
-    def get_comments_and_commenters(self, videos_ids):
+    def shutdown_executor(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
 
-        channel_records = {}
-        records = {}
+    def _get_comments_and_commenters(self, videos_ids, writer=None):
+
+        commenters = Commenters()
         start = 0
 
+        #Comments retrieved by a previous run of the job which were waiting for their commenter's info
+        records, pending_commenters, record_number, channel_records = self.load_checkpoint()
+        commenters.add(pending_commenters)
+        last_checkpoint = time.monotonic()
+
         self._youtube.state.add_action(config.ACTION_RETRIEVE_COMMENTS)
         self._youtube.state.all_comments_retrieved= False
         self._youtube.state.videos_ids = videos_ids
@@ -464,24 +711,39 @@ class Comments(object):
                 self._youtube.state.quota_exceeded=True
                 return records
 
-        #Update the videos ids to retrieve after removing videos with too many comments that cannot be retrieved
+        #Update the videos ids to retrieve after removing videos without comments, in the order of the quota plan
         #The variable self._youtube.state.videos_ids got updated in self.get_comments_count
         videos_ids = self._youtube.state.videos_ids
+        self._split_videos = planner.split_videos(self._youtube.state.plan)
 
         while (start < len(videos_ids)):
             try:
-                commenters_ids = []
                 inc = 0
 
-                #Loop to retrieve comments for at most 50 videos at the time
-                #We are requesting channel info (commenters_ids) after and the limit is config.MAX_CHANNELS_PER_REQUEST
+                #Loop to retrieve comments until there are at least 50 new commenters to look up
+                #We are requesting channel info (commenters) after and the limit is config.MAX_CHANNELS_PER_REQUEST
+                #The videos are retrieved in groups of up to self._max_concurrent_videos at the same time, their
+                #comments are added in the order of videos_ids
                 fully_retrieved = True
-                while (len(commenters_ids) < config.MAX_CHANNELS_PER_REQUEST) and (start + inc < len(videos_ids)) and fully_retrieved:
-                    video_id = videos_ids[start + inc]
-                    video_id_comments_count = self._youtube.state.comments_count[video_id]
-                    records, commenters_ids, fully_retrieved = self.get_single_video_comments_and_commenters(video_id, video_id_comments_count, records, commenters_ids)
-                    commenters_ids = list(set(commenters_ids))
-                    inc = inc + 1
+                while (commenters.pending_count() < config.MAX_CHANNELS_PER_REQUEST) and (start + inc < len(videos_ids)) and fully_retrieved:
+                    group = videos_ids[start + inc:start + inc + self._max_concurrent_videos]
+                    unfinished = []
+                    for video_id, (video_records, video_commenters_ids, video_fully_retrieved) in zip(group, self.get_videos_comments_and_commenters(group)):
+                        for item in video_records.values():
+                            record_number = record_number + 1
+                            records[record_number] = item
+                        commenters.add(video_commenters_ids)
+                        self.update_video_progress(video_id, video_fully_retrieved)
+                        if not video_fully_retrieved:
+                            unfinished.append(video_id)
+                    #The quota of the videos fully retrieved was already spent, they are kept even if a video before
+                    #them was not fully retrieved. The unfinished videos are moved after them and continue later
+                    #from their page token
+                    if unfinished:
+                        finished = [video_id for video_id in group if video_id not in unfinished]
+                        videos_ids = videos_ids[:start + inc] + finished + unfinished + videos_ids[start + inc + len(group):]
+                        fully_retrieved = False
+                    inc = inc + len(group) - len(unfinished)
 
 
                 #Stop if there is not enough quota to continue retrieving comments
@@ -491,44 +753,47 @@ class Comments(object):
                     st = log_format("get_comments_and_commenters", ex)
                     logger.warning(st)
                     self._youtube.state.quota_exceeded = True
+                    #The comments retrieved are kept, the videos which were not fully retrieved continue from their page token
+                    start = start + inc
+                    self._youtube.state.videos_ids = videos_ids[start:len(videos_ids)]
                     break
 
                 #REVISIT THIS CONDITION!!!
-                if len(records) == 0 or len(commenters_ids) == 0:
-                    return records
+                if len(records) == 0 and (writer is None or writer.rows == 0):
+                    return self.write_records(records, writer, channel_records)
 
                 # Check that we have quota to retrieve commenters
-                commenters_cost = self._youtube.state.total_requests_cost(len(commenters_ids), config.MAX_CHANNELS_PER_REQUEST, config.UNITS_CHANNELS_LIST)
+                commenters_cost = self._youtube.state.total_requests_cost(commenters.pending_count(), config.MAX_CHANNELS_PER_REQUEST, config.UNITS_CHANNELS_LIST)
                 if not self._youtube.state.under_quota_limit(commenters_cost):
                     ex = "There is not enough quota to continue retrieving comments."
                     st = log_format("get_comments_and_commenters", ex)
                     logger.warning(st)
                     self._youtube.state.quota_exceeded = True
+                    start = start + inc
+                    self._youtube.state.videos_ids = videos_ids[start:len(videos_ids)]
                     break
 
-                # Retrieving commenter's info
-                channel_records = self.get_commenters_info(commenters_ids, channel_records)
+                # Retrieving commenter's info (the last commenters of the job don't have to fill a whole group)
+                channel_records = self.get_commenters_info(commenters, channel_records, flush_all=(start + inc >= len(videos_ids)))
 
-                #Check if we didn't run out of quota while retrieving channel's commenters
-                if self._youtube.state.quota_exceeded:
-                    break
-
-                #Update comments with commenter info
-                for key, item in records.items():
-                    try:
-                        channel_id_commenter = item["authorChannelId"]
-                        channel_info = channel_records[channel_id_commenter]
-                        item.update(channel_info)
-                    except:
-                        ex1 = traceback.format_exc()
-                        ex2 = 'Error getting commenters metadata: ' + channel_id_commenter
-                        st = log_format("get_comments_and_commenters", ex1 + ex2)
-                        logger.warning(st)
+                #Update comments with commenter info, the comments whose commenter is still pending wait for the next group
+                joined, records = self.join_commenters_info(records, channel_records, commenters)
+                joined = self.write_records(joined, writer, channel_records)
+                joined.update(records)
+                records = joined
 
                 start = start + inc
                 #Keep in the state only the videos ids missing to process
                 #In case we run out of quota
                 self._youtube.state.videos_ids = videos_ids[start:len(videos_ids)]
+
+                #Check if we didn't run out of quota while retrieving channel's commenters
+                if self._youtube.state.quota_exceeded:
+                    break
+
+                if self.checkpoint_path and time.monotonic() - last_checkpoint >= config.COMMENTS_CHECKPOINT_INTERVAL:
+                    self.save_checkpoint(records, commenters, record_number, writer, channel_records)
+                    last_checkpoint = time.monotonic()
             except:
                 ex = traceback.format_exc()
                 st = log_format("get_comments_and_commenters", ex)
@@ -543,6 +808,25 @@ class Comments(object):
             if new_dict != None or len(new_dict)>0:
                 self._youtube.state.comments_count = new_dict
 
+        #Comments waiting for their commenter's info when the loop stopped
+        if commenters.pending_count() > 0 and not self._youtube.state.quota_exceeded:
+            commenters_cost = self._youtube.state.total_requests_cost(commenters.pending_count(), config.MAX_CHANNELS_PER_REQUEST, config.UNITS_CHANNELS_LIST)
+            if self._youtube.state.under_quota_limit(commenters_cost):
+                channel_records = self.get_commenters_info(commenters, channel_records, flush_all=True)
+                joined, waiting = self.join_commenters_info(records, channel_records, commenters)
+                joined.update(waiting)
+                records = joined
+
+        if self.checkpoint_path and start < len(videos_ids):
+            #The job will be resumed, the comments still waiting for their commenter's info are kept in the checkpoint
+            joined, records = self.join_commenters_info(records, channel_records, commenters)
+            self.write_records(joined, writer, channel_records)
+            self.save_checkpoint(records, commenters, record_number, writer, channel_records)
+            records = {}
+        else:
+            self.remove_checkpoint()
+
+        records = self.export_records(self.write_records(records, writer, channel_records), channel_records)
         self.comments_records = records
 
         return records
@@ -34,6 +34,7 @@ MAX_SEARCH_RESULTS_PER_REQUEST = 50
 DEFAULT_VIDEOS_TO_RETRIEVE = 200
 MAX_VIDEOS_TO_RETRIEVE = 500
 MAX_PAGES_SEARCHES = 10   #Each page of 50 results (500 units at most)
+MAX_REQUESTS_PER_BATCH = 50   #List requests sent in one batch HTTP request (see batch.py)
 
 ACTION_QUERY_SEARCH = "query_search"
 ACTION_RETRIEVE_VIDEOS = "retrieve_videos"
@@ -50,4 +51,57 @@ TEST_VIDEO_ID = "ZU_wbPigVRI"
 #TEST_VIDEO_ID = "hola"
 
 SAFETY_BACKUP = 100
-RETRY_REQUESTS_ATTEMPT = 3
\ No newline at end of file
+
+#Estimated comments().list requests (replies of threads with more replies than the ones included) per
+#commentThreads page, used to plan the quota of a job (see planner.py)
+PLAN_REPLIES_REQUESTS_PER_PAGE = 1
+
+#Comments per video assumed to estimate the cost of a job before its videos are known (see
+#planner.estimate_job_cost), the scheduler runs several jobs of a token while their estimates fit its quota
+PLAN_COMMENTS_PER_VIDEO = 500
+
+#A job using a pool of API keys (job option token_pool) only switches to a key with at least these units left
+KEY_POOL_MIN_UNITS = 100
+
+#Number of videos whose comments are retrieved at the same time (1 retrieves them one after the other)
+MAX_CONCURRENT_VIDEOS = 4
+
+#Seconds between checkpoints of the comments retrieved (rows written to disk, rows waiting for their
+#commenter's info and page tokens are saved so a resumed job continues where it stopped)
+COMMENTS_CHECKPOINT_INTERVAL = 10 * 60
+CHECKPOINT_EXTENSION = ".checkpoint"
+
+#Processes used to normalize the comments' text (see text.py), only for batches of at least
+#TEXT_NORMALIZATION_MIN_POOL_BATCH comments. 1 normalizes them in the job's process
+TEXT_NORMALIZATION_PROCESSES = 1
+TEXT_NORMALIZATION_MIN_POOL_BATCH = 5000
+
+#Format of the comments' text requested to the API. With plainText the comments are read from textOriginal
+#and no html has to be removed (only the emojis are replaced). Keys are the values of the job's text_format
+TEXT_FORMAT_HTML = "html"
+TEXT_FORMAT_PLAIN_TEXT = "plainText"
+TEXT_FORMATS = {"HTML": TEXT_FORMAT_HTML, "PLAIN_TEXT": TEXT_FORMAT_PLAIN_TEXT}
+COMMENTS_TEXT_FORMAT = TEXT_FORMAT_HTML
+
+RETRY_REQUESTS_ATTEMPT = 3
+
+#Channels' metadata shared by the jobs of a process (see channel_cache.py): seconds before a channel is requested
+#again, channels kept in memory and SQLite file backing the cache (None keeps it only in memory)
+CHANNEL_CACHE_TTL = 24 * 60 * 60
+CHANNEL_CACHE_MAX_SIZE = 100000
+CHANNEL_CACHE_PATH = None
+
+#Local copy of the discovery document of the YouTube Data API v3, None uses the copy shipped with
+#google-api-python-client
+DISCOVERY_DOCUMENT_PATH = None
+
+#Service objects (one per API key) each thread keeps, the least recently used one is dropped beyond that
+SERVICE_CACHE_MAX_SIZE = 8
+
+#Parquet output: rows per row group, compression and columns written with a type other than string
+PARQUET_ROW_GROUP_SIZE = 50000
+PARQUET_COMPRESSION = "zstd"
+OUTPUT_INT_COLUMNS = ["likeCount", "totalReplyCount", "totalComments", "comment #",
+                      "channel_viewCount", "channel_subscriberCount", "channel_videoCount",
+                      "video_views", "video_likes", "video_favoriteCount", "video_commentsCount"]
+OUTPUT_TIMESTAMP_COLUMNS = ["publishedAt", "scrappedAt", "channel_JoinDate", "video_publishedAt", "video_scrappedAt"]
@@ -0,0 +1,157 @@
+import logging
+import math
+import Tools.YouTubeAPI.youtube.config as config
+
+logger = logging.getLogger('youtube.planner')
+
+# *****************************************************************************************************
+# Quota plan of a job: the estimated cost (units) of each part of the job and, for the comments, the
+# order in which the videos are retrieved and the quota day in which each one is retrieved.
+# The plan is a dictionary (it is saved in the job's job_resume):
+#   {"daily_quota": ..., "search": ..., "videos": ..., "comments": [video plan, ...], "total": ..., "days": ...}
+# where each video plan is
+#   {"video_id": ..., "comments": ..., "threads": ..., "replies": ..., "channels": ..., "total": ...,
+#    "day": first quota day (0 is today), "days": number of quota days it spans}
+# *****************************************************************************************************
+
+
+# *****************************************************************************************************
+# Units available in a quota day
+# *****************************************************************************************************
+def daily_quota():
+    return config.UNITS_QUOTA_LIMIT - config.SAFETY_BACKUP
+
+
+def requests_cost(total_items, items_per_request, units_per_request):
+    return math.ceil(total_items / items_per_request) * units_per_request
+
+
+# *****************************************************************************************************
+# Cost of searching number_of_videos videos by a query (see Search.get_videos_id_by_query)
+# *****************************************************************************************************
+def search_cost(number_of_videos):
+    if (not number_of_videos) or (number_of_videos < 0) or (number_of_videos > config.MAX_VIDEOS_TO_RETRIEVE):
+        number_of_videos = config.DEFAULT_VIDEOS_TO_RETRIEVE
+    pages = min(math.ceil(number_of_videos / config.MAX_SEARCH_RESULTS_PER_REQUEST), config.MAX_PAGES_SEARCHES)
+    return pages * config.UNITS_SEARCH_LIST
+
+
+# *****************************************************************************************************
+# Cost of retrieving the metadata of number_of_videos videos and their creators' channels
+# *****************************************************************************************************
+def videos_cost(number_of_videos):
+    return (requests_cost(number_of_videos, config.MAX_VIDEOS_PER_REQUEST, config.UNITS_VIDEOS_LIST) +
+            requests_cost(number_of_videos, config.MAX_CHANNELS_PER_REQUEST, config.UNITS_CHANNELS_LIST))
+
+
+# *****************************************************************************************************
+# Estimated cost of retrieving the comments of a video (comments is its total of comments and replies)
+# of which comments_retrieved were already retrieved. Replies requests can't be known in advance, they
+# are estimated with config.PLAN_REPLIES_REQUESTS_PER_PAGE. Channels are an upper bound (every commenter
+# looked up, none in the channel cache)
+# *****************************************************************************************************
+def comments_cost(comments, comments_retrieved=0):
+    comments = max(comments - comments_retrieved, 0)
+    threads = requests_cost(comments, config.MAX_COMMENTS_PER_REQUEST, config.UNITS_COMMENTS_THREADS_LIST)
+    replies = math.ceil(threads * config.PLAN_REPLIES_REQUESTS_PER_PAGE) * config.UNITS_COMMENTS_LIST
+    channels = requests_cost(comments, config.MAX_CHANNELS_PER_REQUEST, config.UNITS_CHANNELS_LIST)
+    return {"comments": comments, "threads": threads, "replies": replies, "channels": channels,
+            "total": threads + replies + channels}
+
+
+# *****************************************************************************************************
+# Creates the plan of a job retrieving number_of_videos videos, searched by a query (search) and/or with
+# their metadata (metadata). The comments are added by plan_comments once their count is known
+# *****************************************************************************************************
+def create_plan(number_of_videos=0, search=False, metadata=False):
+    plan = {
+        "daily_quota": daily_quota(),
+        "search": search_cost(number_of_videos) if search else 0,
+        "videos": videos_cost(number_of_videos) if metadata else 0,
+        "comments": [],
+    }
+    _update_totals(plan)
+    return plan
+
+
+def _update_totals(plan):
+    plan["total"] = plan["search"] + plan["videos"] + sum(video["total"] for video in plan["comments"])
+    plan["days"] = max([video["day"] + video["days"] for video in plan["comments"]], default=1)
+
+
+# *****************************************************************************************************
+# Plans the retrieval of the comments of the videos in comments_count ({video_id: comments}):
+# - The videos are ordered from the cheapest to the most expensive, which completes the most videos with
+#   the quota of every day.
+# - Each video is assigned to the first quota day with enough units left, starting today with the units
+#   left after current_quota.
+# - A video which costs more than a whole day is not dropped: it starts with the units left in its day
+#   and continues on the next days (its retrieval resumes from the page where it stopped).
+# videos_progress has the comments already retrieved of partially retrieved videos (see State).
+# Returns the ids of the videos in the order they are retrieved
+# *****************************************************************************************************
+def plan_comments(plan, comments_count, current_quota=0, videos_progress=None):
+    videos_progress = videos_progress or {}
+    quota = plan.get("daily_quota", daily_quota())
+
+    videos = []
+    for video_id, comments in comments_count.items():
+        video = {"video_id": video_id}
+        video.update(comments_cost(int(comments), videos_progress.get(video_id, {}).get("comment_number", 0)))
+        videos.append(video)
+    #sorted is stable, videos with the same cost keep their order
+    videos = sorted(videos, key=lambda video: video["total"])
+
+    day = 0
+    available = max(quota - current_quota, 0)
+    for video in videos:
+        cost = video["total"]
+        if available == 0 or available < cost <= quota:
+            #It fits in a whole day, it waits for the next one
+            day = day + 1
+            available = quota
+        video["day"] = day
+        if cost <= available:
+            video["days"] = 1
+            available = available - cost
+        else:
+            #Split across days: the units left today and as many whole days as needed
+            extra_days = math.ceil((cost - available) / quota)
+            video["days"] = 1 + extra_days
+            day = day + extra_days
+            available = quota * extra_days - (cost - available)
+            msg = f"Video {video['video_id']} costs {cost} units, its comments are retrieved over {video['days']} quota days."
+            logger.info(msg)
+
+    plan["comments"] = videos
+    _update_totals(plan)
+    return [video["video_id"] for video in videos]
+
+
+# *****************************************************************************************************
+# Ids of the videos which the plan splits across several quota days
+# *****************************************************************************************************
+def split_videos(plan):
+    if not plan:
+        return set()
+    return {video["video_id"] for video in plan.get("comments", []) if video.get("days", 1) > 1}
+
+
+# *****************************************************************************************************
+# Estimated cost (units) of running a job, used to decide how many jobs of a token can run at the same
+# time. A new job (or one restarted from the beginning) is estimated from what was submitted, with
+# config.PLAN_COMMENTS_PER_VIDEO comments per video. A paused job is estimated with its plan: the
+# videos still to retrieve. The estimate is at most a quota day
+# *****************************************************************************************************
+def estimate_job_cost(option_type, actions, video_count, plan=None, videos_ids=None, pending_actions=None):
+    if plan and videos_ids is not None and "NEW" not in videos_ids:
+        remaining = set(videos_ids)
+        cost = sum(video["total"] for video in plan.get("comments", []) if video["video_id"] in remaining)
+        if config.ACTION_RETRIEVE_VIDEOS in (pending_actions or []):
+            cost = cost + videos_cost(len(videos_ids))
+    else:
+        number_of_videos = 1 if option_type == "VIDEO" else video_count
+        cost = create_plan(number_of_videos, search=(option_type == "QUERY"), metadata=("METADATA" in actions))["total"]
+        if "COMMENT" in actions:
+            cost = cost + number_of_videos * comments_cost(config.PLAN_COMMENTS_PER_VIDEO)["total"]
+    return min(cost, daily_quota())
@@ -100,7 +100,8 @@ class Playlist(object):
         videos_ids = []
         try:
             while True:
-                if self._youtube.state.under_quota_limit(config.UNITS_PLAYLIST_ITEMS_LIST):
+                #Reserve the quota before sending the request
+                if self._youtube.state.reserve_quota(config.UNITS_PLAYLIST_ITEMS_LIST):
                     # List maxResults videos in a playlist
                     requestVideosList = self._youtube.service.playlistItems().list(
                         part='contentDetails,snippet',
@@ -108,7 +109,6 @@ class Playlist(object):
                         maxResults=config.MAX_PLAYLISTITEMS_PER_REQUEST,  # max is 50
                         pageToken=nextPageToken
                     )
-                    self._youtube.state.update_quota_usage(config.UNITS_PLAYLIST_ITEMS_LIST)
                     responseVideosList = requestVideosList.execute()
                     nextPageToken = responseVideosList.get('nextPageToken')
 
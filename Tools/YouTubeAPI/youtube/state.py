@@ -4,6 +4,7 @@ import math
 import Tools.YouTubeAPI.youtube.config as config
 import pickle
 import os
+import threading
 from Tools.YouTubeAPI.youtube.utils import get_fullpath
 from Tools.YouTubeAPI.youtube.utils import log_format
 
@@ -14,11 +15,26 @@ class State(object):
     def __init__(self, youtube, current_quota) -> None:
         logger.debug("Initializing State object.")
         self._youtube = youtube
+        #The comments of several videos can be retrieved at the same time (see Comments), the quota is
+        #updated under this lock
+        self._quota_lock = threading.Lock()
         self.current_quota = current_quota
+        #Units of the token reserved in the scheduler's quota ledger, None if the job doesn't use it. The units
+        #are taken from it before they are spent, so jobs sharing the token can't spend the same units
+        self.quota_reservation = None
+        #Quota of the other API keys of the job's key pool: {api_key: (current_quota, quota_reservation)}. The
+        #quota of the key in use is in current_quota and quota_reservation (see Youtube.rotate_key)
+        self.keys_quota = {}
         self.quota_exceeded = False
         self.api_key_valid = True
         self.videos_ids = []
         self.comments_count = {}
+        #Videos whose comments were partially retrieved: {video_id: {"page_token": ..., "comment_number": ...}}
+        self.videos_progress = {}
+        #File where the comments are written, a resumed job appends to it
+        self.comments_filename = ""
+        #Quota plan of the job (see planner.py)
+        self.plan = {}
         #self.query = ""
         #self.num_videos = 0
         self.actions = []
@@ -51,7 +67,35 @@ class State(object):
         return under
 
     def update_quota_usage(self, value):
-        self.current_quota = self.current_quota + value
+        with self._quota_lock:
+            if self.quota_reservation is not None:
+                self.quota_reservation.take(value, force=True)
+            self.current_quota = self.current_quota + value
+
+    #Charges cost before a request is sent, if it fits under the quota limit (and in the token's quota ledger).
+    #Returns False (and charges nothing) if it doesn't
+    def reserve_quota(self, cost):
+        with self._quota_lock:
+            if not self.under_quota_limit(cost):
+                return False
+            if self.quota_reservation is not None and not self.quota_reservation.take(cost):
+                return False
+            self.current_quota = self.current_quota + cost
+            return True
+
+    #Checks that cost fits under the quota limit and keeps it reserved in the token's quota ledger, without
+    #charging it (the requests are charged when they are sent)
+    def ensure_quota(self, cost):
+        with self._quota_lock:
+            if not self.under_quota_limit(cost):
+                return False
+            return self.quota_reservation is None or self.quota_reservation.ensure(cost)
+
+    #Keeps the quota of the key in use (api_key) and takes the quota of new_api_key
+    def switch_key_quota(self, api_key, new_api_key):
+        with self._quota_lock:
+            self.keys_quota[api_key] = (self.current_quota, self.quota_reservation)
+            self.current_quota, self.quota_reservation = self.keys_quota.pop(new_api_key)
 
     def set_all_retrieved(self, field, value):
         if field == config.ALL_VIDEOS_RETRIEVED:
@@ -80,6 +124,9 @@ class State(object):
         state_dict["api_key_valid"] = self.api_key_valid
         state_dict["videos_ids"] = self.videos_ids
         state_dict["comments_count"] = self.comments_count
+        state_dict["videos_progress"] = self.videos_progress
+        state_dict["comments_filename"] = self.comments_filename
+        state_dict["plan"] = self.plan
         #state_dict["query"] = self.query
         #state_dict["num_videos"] = self.num_videos
         state_dict["actions"] = self.actions
@@ -98,6 +145,9 @@ class State(object):
             self.api_key_valid = state_dict.get("api_key_valid",True)
             self.videos_ids = state_dict.get("videos_ids",[])
             self.comments_count = state_dict.get("comments_count",{})
+            self.videos_progress = state_dict.get("videos_progress",{})
+            self.comments_filename = state_dict.get("comments_filename","")
+            self.plan = state_dict.get("plan",{})
             #self.query = state_dict.get("query","")
             #self.num_videos = state_dict.get("num_videos", 0)
             self.actions = state_dict.get("actions", [])
@@ -0,0 +1,92 @@
+import html
+import logging
+import multiprocessing
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor
+import emoji
+import Tools.YouTubeAPI.youtube.config as config
+
+logger = logging.getLogger('youtube.text')
+
+# *****************************************************************************************************
+# Normalization of the comments' text: html tags are removed, html characters are unescaped and emojis
+# are replaced by their name with the prefix "emoji_".
+#
+# textDisplay only contains a few simple tags (<a>, <b>, <i>, <s>, <br>) and escapes every "<", "&" of the
+# text, so a regular expression and html.unescape give the same text as BeautifulSoup(...).get_text().
+# Most comments have no markup and no emojis at all, they are returned without any parsing.
+# *****************************************************************************************************
+
+_TAG = re.compile(r'<[^>]*>')
+_EMOJI_DELIMITERS = (" emoji_", " ")
+
+
+# *****************************************************************************************************
+# Removes the html tags and html characters of a comment
+# *****************************************************************************************************
+def strip_html(comment):
+    if '<' not in comment and '&' not in comment:
+        return comment
+    if '<' in comment:
+        comment = _TAG.sub('', comment)
+    if '&' in comment:
+        comment = html.unescape(comment)
+    return comment
+
+
+# *****************************************************************************************************
+# Replaces the emojis of a comment with the emoji name and the prefix "emoji_"
+# *****************************************************************************************************
+def demojize(comment):
+    # Emojis are never ASCII
+    if comment.isascii():
+        return comment
+    return emoji.demojize(comment, delimiters=_EMOJI_DELIMITERS)
+
+
+# *****************************************************************************************************
+# Returns the normalized text of a comment (see above). If html is False the comment is plain text
+# (textOriginal) and only the emojis are replaced
+# *****************************************************************************************************
+def normalize_comment(comment, html=True):
+    if len(comment) > 0:
+        if html:
+            comment = strip_html(comment)
+        comment = demojize(comment)
+    return comment
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=config.TEXT_NORMALIZATION_PROCESSES,
+                                        mp_context=multiprocessing.get_context('spawn'))
+        return _pool
+
+
+def _normalize_chunk(comments, html=True):
+    return [normalize_comment(comment, html) for comment in comments]
+
+
+# *****************************************************************************************************
+# Normalizes a list of comments, returns the list of normalized texts (in the same order).
+# Identical texts are normalized once. Large batches (at least config.TEXT_NORMALIZATION_MIN_POOL_BATCH
+# texts) are split across a pool of config.TEXT_NORMALIZATION_PROCESSES processes, if it is greater than 1
+# *****************************************************************************************************
+def normalize_comments(comments, html=True):
+    unique = list(dict.fromkeys(comments))
+
+    if config.TEXT_NORMALIZATION_PROCESSES > 1 and len(unique) >= config.TEXT_NORMALIZATION_MIN_POOL_BATCH:
+        chunk_size = -(-len(unique) // config.TEXT_NORMALIZATION_PROCESSES)
+        chunks = [unique[start:start + chunk_size] for start in range(0, len(unique), chunk_size)]
+        normalized = [text for chunk in _get_pool().map(_normalize_chunk, chunks, [html] * len(chunks)) for text in chunk]
+    else:
+        normalized = _normalize_chunk(unique, html)
+
+    texts = dict(zip(unique, normalized))
+    return [texts[comment] for comment in comments]
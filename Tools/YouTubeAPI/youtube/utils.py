@@ -1,11 +1,24 @@
 from dateutil import parser
+import csv
+import json
+import logging
+import re
 import sys
 import traceback
 import pandas as pd
+import xlsxwriter
+import openpyxl
 import pathlib
 import os
 from werkzeug.utils import secure_filename
-from datetime import datetime
+from datetime import datetime, timezone
+import Tools.YouTubeAPI.youtube.config as config
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
 
 
 
@@ -131,27 +144,378 @@ def read_excel_file_to_data_frame(filename, columns=None):
 
 
 
+#*****************************************************************************************************
+#Record writers stream records (dictionaries) to a file one row at a time, so the whole dataset never
+#has to be in memory. The file is only created when the first record is written.
+#The columns are given by fieldnames or, if not given, by the keys of the first record. Keys which are
+#not a column are dropped (JSONL keeps all the keys of every record).
+#With append the records are added to the existing file (CSV, JSONL) or, for formats which cannot be
+#appended (XLSX, PARQUET), to a new part next to it (see get_part_path), merged when the job ends (see
+#merge_parts).
+#*****************************************************************************************************
+class RecordWriter:
+    extension = None
+    appendable = False
+
+    def __init__(self, filename_path, fieldnames=None, append=False):
+        self.filename_path = filename_path
+        self.fieldnames = list(fieldnames) if fieldnames else None
+        self.append = append
+        self.rows = 0
+        self._file_rows = 0
+        self._opened = False
+        self._dropped_keys = set()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _open(self, record):
+        if self.fieldnames is None:
+            self.fieldnames = list(record.keys())
+        if self.append and not self.appendable:
+            self.filename_path = get_part_path(self.filename_path)
+        self._file_rows = 0
+        self._open_file()
+        self._opened = True
+
+    #True if the rows are added at the end of an existing file
+    def _appending(self):
+        return self.append and os.path.exists(self.filename_path) and os.path.getsize(self.filename_path) > 0
+
+    def _open_file(self):
+        raise NotImplementedError()
+
+    def _write_row(self, index, record):
+        raise NotImplementedError()
+
+    def _close_file(self):
+        raise NotImplementedError()
+
+    def _row_values(self, record):
+        dropped = record.keys() - set(self.fieldnames) - self._dropped_keys
+        if dropped:
+            self._dropped_keys.update(dropped)
+            logging.getLogger('youtube.utils').warning(f"Columns {sorted(dropped)} are not written to {self.filename_path}")
+        return [to_cell_value(record.get(column, "")) for column in self.fieldnames]
+
+    def write(self, record, index=None):
+        if not self._opened:
+            self._open(record)
+        self.rows = self.rows + 1
+        self._file_rows = self._file_rows + 1
+        if index is None:
+            index = self.rows
+        self._write_row(index, record)
+
+    def write_records(self, records):
+        #records is a dictionary of records (the keys are used as index) or an iterable of records
+        if isinstance(records, dict):
+            for index, record in records.items():
+                self.write(record, index)
+        else:
+            for record in records:
+                self.write(record)
+
+    #Makes the rows written so far durable in the formats which can be appended (the file is flushed to
+    #disk). The others stay open, they are only complete once closed: a new part is only started when the
+    #job is resumed (see append), not at every flush
+    def flush(self):
+        if self._opened:
+            self._flush_file()
+
+    def _flush_file(self):
+        if self.appendable:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        if self._opened:
+            self._close_file()
+            self._opened = False
+
+
+class XlsxRecordWriter(RecordWriter):
+    extension = "xlsx"
+
+    def _open_file(self):
+        #In constant memory mode each row is flushed to disk as soon as the next one is started.
+        #Text is never written as a formula (comments may start with "=")
+        self._workbook = xlsxwriter.Workbook(self.filename_path, {'constant_memory': True, 'strings_to_formulas': False})
+        self._worksheet = self._workbook.add_worksheet()
+        header_format = self._workbook.add_format({'bold': True, 'border': 1, 'align': 'center'})
+        self._worksheet.write_row(0, 1, self.fieldnames, header_format)
+
+    def _write_row(self, index, record):
+        self._worksheet.write(self._file_rows, 0, to_cell_value(index))
+        self._worksheet.write_row(self._file_rows, 1, self._row_values(record))
+
+    def _close_file(self):
+        self._workbook.close()
+
+
+class CsvRecordWriter(RecordWriter):
+    extension = "csv"
+    appendable = True
+
+    def _open_file(self):
+        appending = self._appending()
+        self._file = open(self.filename_path, 'a' if appending else 'w', newline='', encoding='utf-8')
+        self._writer = csv.writer(self._file)
+        if not appending:
+            self._writer.writerow([""] + self.fieldnames)
+
+    def _write_row(self, index, record):
+        self._writer.writerow([index] + self._row_values(record))
+
+    def _close_file(self):
+        self._file.close()
+
+
+class JsonlRecordWriter(RecordWriter):
+    extension = "jsonl"
+    appendable = True
+
+    def _open_file(self):
+        self._file = open(self.filename_path, 'a' if self._appending() else 'w', encoding='utf-8')
+
+    def _write_row(self, index, record):
+        self._file.write(json.dumps(record, ensure_ascii=False, default=str))
+        self._file.write("\n")
+
+    def _close_file(self):
+        self._file.close()
+
+
+class ParquetRecordWriter(RecordWriter):
+    #Columns are typed (see config.OUTPUT_INT_COLUMNS and config.OUTPUT_TIMESTAMP_COLUMNS, the rest are strings),
+    #rows are compressed and written in row groups of config.PARQUET_ROW_GROUP_SIZE rows
+    extension = "parquet"
+
+    def _open_file(self):
+        if pa is None:
+            raise ImportError("The parquet output format requires the pyarrow package.")
+        fields = []
+        for column in self.fieldnames:
+            if column in config.OUTPUT_INT_COLUMNS:
+                fields.append(pa.field(column, pa.int64()))
+            elif column in config.OUTPUT_TIMESTAMP_COLUMNS:
+                fields.append(pa.field(column, pa.timestamp('us', tz='UTC')))
+            else:
+                fields.append(pa.field(column, pa.string()))
+        self._schema = pa.schema(fields)
+        self._writer = pq.ParquetWriter(self.filename_path, self._schema, compression=config.PARQUET_COMPRESSION)
+        self._columns = {column: [] for column in self.fieldnames}
+        self._buffered = 0
+
+    def _row_values(self, record):
+        values = super()._row_values(record)
+        converted = []
+        for column, value in zip(self.fieldnames, values):
+            if column in config.OUTPUT_INT_COLUMNS:
+                converted.append(to_int(value))
+            elif column in config.OUTPUT_TIMESTAMP_COLUMNS:
+                converted.append(to_timestamp(value))
+            else:
+                converted.append(None if value is None else str(value))
+        return converted
+
+    def _write_row(self, index, record):
+        for column, value in zip(self.fieldnames, self._row_values(record)):
+            self._columns[column].append(value)
+        self._buffered = self._buffered + 1
+        if self._buffered >= config.PARQUET_ROW_GROUP_SIZE:
+            self._write_row_group()
+
+    def _write_row_group(self):
+        if self._buffered > 0:
+            table = pa.Table.from_pydict(self._columns, schema=self._schema)
+            self._writer.write_table(table, row_group_size=self._buffered)
+            self._columns = {column: [] for column in self.fieldnames}
+            self._buffered = 0
+
+    def _flush_file(self):
+        self._write_row_group()
+
+    def _close_file(self):
+        self._write_row_group()
+        self._writer.close()
+
+
+RECORD_WRITERS = {writer.extension: writer for writer in [XlsxRecordWriter, CsvRecordWriter, JsonlRecordWriter, ParquetRecordWriter]}
+
+
+#*****************************************************************************************************
+#Counts are strings in the API responses, values such as "N/A" or "" become None
+#*****************************************************************************************************
+def to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+#*****************************************************************************************************
+#Dates are either ISO 8601 (UTC) or "%Y-%m-%d, %H:%M:%S" in the local zone (see convert_to_local_zone)
+#*****************************************************************************************************
+def to_timestamp(value):
+    if not value or not isinstance(value, str):
+        return None
+    try:
+        dt = datetime.fromisoformat(value)
+    except ValueError:
+        try:
+            dt = datetime.strptime(value, "%Y-%m-%d, %H:%M:%S")
+        except ValueError:
+            return None
+    #Naive dates are in the local zone
+    return dt.astimezone(timezone.utc)
+
+
+#*****************************************************************************************************
+#Values which are not numbers or strings (e.g. lists, dictionaries) are written as strings
+#*****************************************************************************************************
+def to_cell_value(value):
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return str(value)
+
+
+#*****************************************************************************************************
+#Returns a writer for the file directory/name, the format is given by the extension of name.
+#With append the records are added to the file if it already exists (see RecordWriter)
+#*****************************************************************************************************
+def open_record_writer(directory, name, fieldnames=None, append=False):
+    filename_path = get_fullpath(directory, name)
+    extension = os.path.splitext(filename_path)[1].lstrip('.').lower()
+    if extension not in RECORD_WRITERS:
+        raise ValueError(f"Output format '{extension}' is not supported. Valid formats are: {', '.join(RECORD_WRITERS)}")
+    return RECORD_WRITERS[extension](filename_path, fieldnames, append)
+
+
+#*****************************************************************************************************
+#Returns the first path among name.ext, name.part2.ext, name.part3.ext, ... which doesn't exist
+#*****************************************************************************************************
+def get_part_path(filename_path):
+    base, extension = os.path.splitext(filename_path)
+    base = re.sub(r'\.part\d+$', '', base)
+    path = base + extension
+    part = 1
+    while os.path.exists(path):
+        part = part + 1
+        path = f"{base}.part{part}{extension}"
+    return path
+
+
+#Parts written when a job is resumed (see get_part_path)
+PART_PATTERN = re.compile(r'^(?P<base>.+)\.part(?P<part>\d+)\.(?P<extension>xlsx|parquet)$', re.IGNORECASE)
+
+
+#*****************************************************************************************************
+#Merges the parts of every file of directory (name.part2.ext, name.part3.ext, ...) into name.ext, in
+#order, so the output of a job is the same however many times it was paused. A file whose parts can't
+#be merged (e.g. different columns) keeps them
+#*****************************************************************************************************
+def merge_parts(directory):
+    parts = {}
+    for filename in os.listdir(directory):
+        match = PART_PATTERN.match(filename)
+        if match:
+            first_path = os.path.join(directory, f"{match['base']}.{match['extension']}")
+            parts.setdefault(first_path, []).append((int(match['part']), os.path.join(directory, filename)))
+
+    for first_path, numbered_paths in parts.items():
+        paths = [path for path in [first_path] + [path for _, path in sorted(numbered_paths)] if os.path.exists(path)]
+        base, extension = os.path.splitext(first_path)
+        merged_path = f"{base}.merged{extension}"
+        try:
+            if extension.lower() == ".xlsx":
+                merge_xlsx_files(paths, merged_path)
+            else:
+                merge_parquet_files(paths, merged_path)
+            os.replace(merged_path, first_path)
+            for path in paths[1:]:
+                os.remove(path)
+        except:
+            ex = traceback.format_exc()
+            logging.getLogger('youtube.utils').error(log_format("merge_parts", ex))
+            if os.path.exists(merged_path):
+                os.remove(merged_path)
+
+
+#*****************************************************************************************************
+#Writes the rows of the XLSX files (written by XlsxRecordWriter) one after the other to filename_path
+#*****************************************************************************************************
+def merge_xlsx_files(paths, filename_path):
+    with XlsxRecordWriter(filename_path) as writer:
+        for path in paths:
+            workbook = openpyxl.load_workbook(path, read_only=True)
+            try:
+                rows = workbook.active.iter_rows(values_only=True)
+                header = next(rows, None)
+                if header is None:
+                    continue
+                columns = list(header[1:])
+                if writer.fieldnames is None:
+                    writer.fieldnames = columns
+                elif columns != writer.fieldnames:
+                    raise ValueError(f"The columns of {path} are not the ones of {paths[0]}")
+                for row in rows:
+                    writer.write(dict(zip(columns, row[1:])), row[0])
+            finally:
+                workbook.close()
+
+
+#*****************************************************************************************************
+#Writes the row groups of the Parquet files one after the other to filename_path
+#*****************************************************************************************************
+def merge_parquet_files(paths, filename_path):
+    if pa is None:
+        raise ImportError("The parquet output format requires the pyarrow package.")
+    schema = pq.read_schema(paths[0])
+    with pq.ParquetWriter(filename_path, schema, compression=config.PARQUET_COMPRESSION) as writer:
+        for path in paths:
+            parquet_file = pq.ParquetFile(path)
+            if not parquet_file.schema_arrow.equals(schema):
+                raise ValueError(f"The columns of {path} are not the ones of {paths[0]}")
+            for index in range(parquet_file.num_row_groups):
+                writer.write_table(parquet_file.read_row_group(index))
+
+
 #*****************************************************************************************************
 #This functions exports a dictionary to a excel file with filename given as a parameter
 #*****************************************************************************************************
 def export_dict_to_excel(records, directory, name):
-    abs_path = pathlib.Path().resolve()
-    full_path = os.path.join(abs_path, directory)
-    filename = secure_filename(name)
-    filename_path = os.path.join(full_path, filename)
-    df = pd.DataFrame(records).T
-    df.to_excel(filename_path, engine='xlsxwriter')
-    df.to_excel(filename_path)
-    return filename_path
+    with open_record_writer(directory, name, get_columns(records)) as writer:
+        writer.write_records(records)
+    return writer.filename_path
+
+
+#*****************************************************************************************************
+#Columns of a dictionary of records, in the order they first appear
+#*****************************************************************************************************
+def get_columns(records):
+    if not isinstance(records, dict):
+        return None
+    columns = {}
+    for record in records.values():
+        columns.update(dict.fromkeys(record))
+    return list(columns)
 
 
 # ***********************************************************************************************************************
+# records is a dictionary of records or an iterable of records (e.g. a generator), which is written as it is consumed
+# The output format is given by the extension of filename (xlsx, csv, jsonl or parquet)
 # ***********************************************************************************************************************
-def save_file(records, directory, filename):
-    # Export info to excel
-    if records and len(records)>0:
-        filename_path = export_dict_to_excel(records, directory, filename)
-        print("Output: " + filename_path)
+def save_file(records, directory, filename, fieldnames=None):
+    if not records:
+        return
+    with open_record_writer(directory, filename, fieldnames or get_columns(records)) as writer:
+        writer.write_records(records)
+    if writer.rows > 0:
+        print("Output: " + writer.filename_path)
 
 
 #***********************************************************************************************************************
@@ -62,6 +62,42 @@ class Videos:
 
         return videos_response
 
+    # *****************************************************************************************************
+    # This function retrieves videos metadata for several lists of (at most config.MAX_VIDEOS_PER_REQUEST) ids,
+    # all the requests are sent in batches (see Batch).
+    # Returns the response for each list of ids, None if it couldn't be retrieved
+    # *****************************************************************************************************
+    def get_videos_metadata_batch(self, videos_ids_lists):
+
+        videos_responses = [None] * len(videos_ids_lists)
+        try:
+            requests = [self._youtube.service.videos().list(
+                part="contentDetails,snippet,statistics",
+                maxResults=config.MAX_VIDEOS_PER_REQUEST,
+                id=','.join(videos_ids)
+            ) for videos_ids in videos_ids_lists]
+
+            results = self._youtube.batch.execute(requests, config.UNITS_VIDEOS_LIST)
+            for index, (videos_response, error) in enumerate(results):
+                if error is not None:
+                    self._youtube.state.quota_exceeded = is_quota_exceeded(error)
+                    self._youtube.state.api_key_valid = is_api_key_valid(error)
+
+                    msg = get_HTTP_error_msg(error)
+                    st = log_format("get_videos_metadata_batch", msg)
+                    logger.error(st)
+                    self._youtube.state.set_error_description(True, msg)
+                else:
+                    videos_responses[index] = videos_response
+
+        except:
+            ex = traceback.format_exc()
+            st = log_format("get_videos_metadata_batch", ex)
+            logger.error(st)
+            self._youtube.state.set_error_description(True, "An error occurred getting the videos' metadata.")
+
+        return videos_responses
+
     # *****************************************************************************************************
     # *****************************************************************************************************
     def get_videos_and_videocreators(self, ids):
@@ -89,42 +125,58 @@ class Videos:
 
                 # Check if there is available quote
                 if self._youtube.state.under_quota_limit(retrieving_cost):
-                    end = start + config.MAX_VIDEOS_PER_REQUEST
+                    # Slices of videos sent in one batch, as many as the quota allows
+                    available_quota = (config.UNITS_QUOTA_LIMIT - config.SAFETY_BACKUP) - self._youtube.state.current_quota
+                    number_of_slices = min(config.MAX_REQUESTS_PER_BATCH, max(1, available_quota // retrieving_cost))
+                    end = start + number_of_slices * config.MAX_VIDEOS_PER_REQUEST
                     if end >= len(original_videos_ids):
                         end = len(original_videos_ids)
                         slicing = False
 
-                    videos_ids = original_videos_ids[start:end]
-                    videos_response = self.get_videos_metadata(videos_ids)
-
-                    if not videos_response:
+                    videos_ids_lists = [original_videos_ids[i:min(i + config.MAX_VIDEOS_PER_REQUEST, end)]
+                                        for i in range(start, end, config.MAX_VIDEOS_PER_REQUEST)]
+                    videos_responses = self.get_videos_metadata_batch(videos_ids_lists)
+
+                    # Keep the responses up to the first one which failed or came empty
+                    retrieved_responses = []
+                    for videos_response in videos_responses:
+                        if not videos_response:
+                            break
+
+                        if (len(videos_response['items'])==0):
+                            #The API key is valid but the response came empty from the server.
+                            #Probably a invalid input (id, url etc)
+                            if self._youtube.state.api_key_valid:
+                                st = log_format("get_videos_and_videocreators", "Response from YouTube server was empty. Check input request (e.g., IDs, url, etc)")
+                                logger.error(st)
+                                st = "Response from YouTube server was empty. Check input request (e.g., IDs, url, etc)"
+                                self._youtube.state.set_error_description(True, st)
+                            break
+
+                        retrieved_responses.append(videos_response)
+
+                    # Get ids from channels (videos' creators), one group per slice of videos
+                    channels_ids_groups = []
+                    for videos_response in retrieved_responses:
+                        channels_ids = []
+                        for item in videos_response['items']:
+                            id = item["snippet"].get("channelId", None)
+                            if id!=None:
+                                channels_ids.append(id)
+                        channels_ids_groups.append(set(channels_ids))
+
+                    self._youtube.channels.get_channels_metadata_batch(channels_ids_groups)
+
+                    for videos_ids, videos_response in zip(videos_ids_lists, retrieved_responses):
+                        self.join_videos_creators(videos_response,self._youtube.channels.channel_records)
+
+                        start = start + len(videos_ids)
+
+                        #Save videos ids of videos missing to retrievd
+                        self._youtube.state.videos_ids = original_videos_ids[start:len(original_videos_ids)]
+
+                    if len(retrieved_responses) < len(videos_ids_lists):
                         break
-
-                    if (len(videos_response['items'])==0):
-                        #The API key is valid but the response came empty from the server.
-                        #Probably a invalid input (id, url etc)
-                        if self._youtube.state.api_key_valid:
-                            st = log_format("get_videos_and_videocreators", "Response from YouTube server was empty. Check input request (e.g., IDs, url, etc)")
-                            logger.error(st)
-                            st = "Response from YouTube server was empty. Check input request (e.g., IDs, url, etc)"
-                            self._youtube.state.set_error_description(True, st)
-                        break
-
-                    # Get ids from channels (videos' creators)
-                    channels_ids = []
-                    for item in videos_response['items']:
-                        id = item["snippet"].get("channelId", None)
-                        if id!=None:
-                            channels_ids.append(id)
-
-                    channels_ids = set(channels_ids)
-                    self._youtube.channels.get_channels_metadata(channels_ids)
-                    self.join_videos_creators(videos_response,self._youtube.channels.channel_records)
-
-                    start = end
-
-                    #Save videos ids of videos missing to retrievd
-                    self._youtube.state.videos_ids = original_videos_ids[start:len(original_videos_ids)]
                 else:
                     slicing = False
                     self._youtube.state.quota_exceeded = True
@@ -1,4 +1,5 @@
-from googleapiclient.discovery import build
+from googleapiclient.discovery import build_from_document
+from googleapiclient.discovery_cache import get_static_doc
 from .setup_logger import logger
 from .comments import Comments
 from .videos import Videos
@@ -6,14 +7,53 @@ from .channels import Channels
 from .state import State
 from .playlist import Playlist
 from .search import Search
+from .batch import Batch
 from .utils import get_ids_from_file
 from .utils import log_format
 import Tools.YouTubeAPI.youtube.config as config
 import sys
 import traceback
+import json
+import threading
+from collections import OrderedDict
 
 import logging
 
+# *****************************************************************************************************
+# The discovery document of the YouTube API is loaded once per process from a local copy (the one shipped
+# with google-api-python-client, or config.DISCOVERY_DOCUMENT_PATH), no network access is needed.
+# Service objects are cached by API key. The http object of a service is not thread safe, so every thread
+# (e.g. each scheduler worker) keeps its own cache, of at most config.SERVICE_CACHE_MAX_SIZE services (the
+# least recently used one is dropped, jobs rotating through a key pool use a new key now and then).
+# *****************************************************************************************************
+_discovery_document = None
+_discovery_document_lock = threading.Lock()
+_services = threading.local()
+
+def get_discovery_document():
+    global _discovery_document
+    with _discovery_document_lock:
+        if _discovery_document is None:
+            if config.DISCOVERY_DOCUMENT_PATH:
+                with open(config.DISCOVERY_DOCUMENT_PATH, encoding='utf-8') as file:
+                    _discovery_document = json.load(file)
+            else:
+                _discovery_document = json.loads(get_static_doc('youtube', 'v3'))
+        return _discovery_document
+
+def get_service(api_key):
+    if not hasattr(_services, "by_key"):
+        _services.by_key = OrderedDict()
+    service = _services.by_key.get(api_key)
+    if service is None:
+        service = build_from_document(get_discovery_document(), developerKey=api_key)
+        _services.by_key[api_key] = service
+        while len(_services.by_key) > config.SERVICE_CACHE_MAX_SIZE:
+            _services.by_key.popitem(last=False)
+    else:
+        _services.by_key.move_to_end(api_key)
+    return service
+
 class Youtube:
     def __init__(self, api_key, current_quota=None) -> None:
         logger.debug("Initializing YouTube object.")
@@ -26,12 +66,16 @@ class Youtube:
         self.channels = Channels(self)
         self.playlist = Playlist(self)
         self.search = Search(self)
+        self.batch = Batch(self)
 
         if not current_quota:
             current_quota = 0
 
         self.state = State(self,current_quota)
 
+        #Other API keys the job can use when the quota of the key in use runs out, in the order they are used
+        self._pool_keys = []
+
         #self.__test_service()
 
     def login(self):
@@ -47,12 +91,50 @@ class Youtube:
         try:
             if self._apikey:
                 # Builds a service object. In this case, the service is youtube api, version v3, with the api_key
-                service= build('youtube', 'v3', developerKey=self._apikey)
+                # (reused if this thread already built one for the api_key)
+                service= get_service(self._apikey)
                 logger.debug(f"YouTube Service Initialized")
         except:
             logger.critical("YouTube Service couldn't be created.")
         return service
 
+    # *****************************************************************************************************
+    # Adds an API key to the job's key pool, with the units it already used today and its reservation in the
+    # quota ledger (if any)
+    # *****************************************************************************************************
+    def add_pool_key(self, api_key, current_quota=0, quota_reservation=None):
+        if api_key and api_key != self._apikey and api_key not in self._pool_keys:
+            self._pool_keys.append(api_key)
+            self.state.keys_quota[api_key] = (current_quota, quota_reservation)
+
+    # *****************************************************************************************************
+    # Switches to the next key of the pool with at least config.KEY_POOL_MIN_UNITS left, after the quota of
+    # the key in use was exceeded. The quota of each key is kept by the state. Keys are used once, in order.
+    # Returns False if no key is left
+    # *****************************************************************************************************
+    def rotate_key(self):
+        while self._pool_keys:
+            api_key = self._pool_keys.pop(0)
+            self.state.switch_key_quota(self._apikey, api_key)
+            self._apikey = api_key
+            if self.state.under_quota_limit(config.KEY_POOL_MIN_UNITS):
+                service = self.__build_service_api_key()
+                if service:
+                    self.service = service
+                    msg = f"Quota of the API key exceeded, continuing with the next key of the pool ({len(self._pool_keys)} left)."
+                    logger.info(log_format("rotate_key", msg))
+                    return True
+            logger.debug(log_format("rotate_key", "A key of the pool was skipped, it doesn't have enough quota left."))
+        return False
+
+    # *****************************************************************************************************
+    # Quota (current_quota, quota_reservation) of every key used by the job, including the key in use
+    # *****************************************************************************************************
+    def keys_quota(self):
+        quotas = dict(self.state.keys_quota)
+        quotas[self._apikey] = (self.state.current_quota, self.state.quota_reservation)
+        return quotas
+
     # *****************************************************************************************************
     # *****************************************************************************************************
     def __test_service(self):
@@ -84,7 +166,7 @@ class Youtube:
     # *****************************************************************************************************
     # This function retrieves the metadata for a video and its creator (a channel)
     # *****************************************************************************************************
-    def get_video_comments_for_url(self, url):
+    def get_video_comments_for_url(self, url, writer=None):
 
         response = None
         msg = f"{url}"
@@ -93,7 +175,7 @@ class Youtube:
 
         video_id = self.videos.get_video_id_from_url(url)
         if len(video_id) > 0:
-            response = self.comments.get_comments_and_commenters([video_id])
+            response = self.comments.get_comments_and_commenters([video_id], writer)
         else:
             self.state.set_error_description(True, f"{url} is not a valid url.")
 
@@ -143,13 +225,13 @@ class Youtube:
     # Once extracted this list, the function then calls the function get_videos_and_videocreators to retrieve
     # the videos and its creators' metadata.
     # ***********************************************************************************************************
-    def get_videos_comments_from_file(self, filename):
+    def get_videos_comments_from_file(self, filename, writer=None):
         try:
             # Load file
             videos_ids = get_ids_from_file(filename, "videoId")
             if videos_ids:
                 # Get data from YouTube API
-                response = self.comments.get_comments_and_commenters(videos_ids)
+                response = self.comments.get_comments_and_commenters(videos_ids, writer)
             else:
                 logger.debug("Video's ids couldn't be retrieved. Check input file.")
         except:
@@ -162,11 +244,11 @@ class Youtube:
     # *****************************************************************************************************
     # This function retrieves the videos' comments and commenters for all the videos on the playlist given as argument
     # *****************************************************************************************************
-    def get_videos_comments_from_playlist(self, url):
+    def get_videos_comments_from_playlist(self, url, writer=None):
         response = None
         self.playlist.get_playlist_videos_ids(url)
         if len(self.playlist.videos_ids) > 0:  # Need to report the error in case we didn't get the data
-            response = self.comments.get_comments_and_commenters(self.playlist.videos_ids)
+            response = self.comments.get_comments_and_commenters(self.playlist.videos_ids, writer)
         return response
 
     # *****************************************************************************************************
@@ -182,11 +264,11 @@ class Youtube:
     # *****************************************************************************************************
     # This function retrieves the videos' metadata and creators for all the videos on the playlist given as argument
     # *****************************************************************************************************
-    def get_videos_comments_from_query(self, query, maxNumberVideos=None):
+    def get_videos_comments_from_query(self, query, maxNumberVideos=None, writer=None):
         response = None
         self.search.get_videos_id_by_query(query, maxNumberVideos)
         if self.search.videos_ids and len(self.search.videos_ids) > 0:
-            response = self.comments.get_comments_and_commenters(self.search.videos_ids)
+            response = self.comments.get_comments_and_commenters(self.search.videos_ids, writer)
         return response
 
 
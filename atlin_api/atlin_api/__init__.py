@@ -1,5 +1,8 @@
 '''Atlin module'''
-from .atlin import Atlin, JobPlatform, JobStatus
+from .atlin import Atlin, JobPlatform, JobStatus, get_atlin
+from .async_atlin import AsyncAtlin
+from .retry import RetryPolicy, RetryError, CircuitBreaker, CircuitOpenError, RequestRejectedError, StatusOutbox
+from .job_update_buffer import JobUpdateBuffer
 from .youtube import YoutubeJobDetails
 from .reddit import RedditJobDetails
 from .token import YoutubeToken, RedditToken, token_filter_by_keyword
@@ -0,0 +1,154 @@
+"""Asyncio counterpart of the Atlin class."""
+import asyncio
+import json
+import logging
+from datetime import datetime
+
+import requests
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+from .atlin import AtlinBase, JobStatus
+
+
+class AsyncResponse:
+    """The parts of requests.Response used by the callers of Atlin.
+
+    The body is read before the connection goes back to the pool, so json()
+    and text can be used like on a requests.Response.
+    """
+
+    def __init__(self, status_code: int, content: bytes, url: str, headers: dict):
+        self.status_code = status_code
+        self.content = content
+        self.url = url
+        self.headers = headers
+
+    def __bool__(self):
+        return self.ok
+
+    @property
+    def ok(self):
+        """True if status_code is less than 400"""
+        return self.status_code < 400
+
+    @property
+    def text(self):
+        """body of the response decoded as utf-8"""
+        return self.content.decode("utf-8", errors="replace")
+
+    def json(self):
+        """body of the response decoded as json"""
+        return json.loads(self.content)
+
+    def raise_for_status(self):
+        """Raise requests.HTTPError for 4xx and 5xx responses"""
+        if not self.ok:
+            raise requests.exceptions.HTTPError(
+                f"{self.status_code} Error for url: {self.url}", response=self
+            )
+
+
+class AsyncAtlin(AtlinBase):
+    """Atlin with the same methods as Atlin, which have to be awaited.
+
+    All requests of an object go through a single aiohttp connection pool, so many
+    status and quota updates can be sent at once with asyncio.gather. Errors are
+    raised as the matching requests exceptions so existing error handling still applies.
+
+    Example:
+        async with AsyncAtlin(domain) as atlin:
+            responses = await asyncio.gather(*(atlin.job_set_status(uid, status) for uid in uids))
+    """
+
+    _pool_maxsize_async = AtlinBase._pool_maxsize
+
+    def _create_session(self, pool_maxsize: int):
+        if aiohttp is None:
+            raise ImportError("AsyncAtlin requires the aiohttp package.")
+        # an aiohttp session has to be created inside the running event loop
+        self._pool_maxsize_async = pool_maxsize
+        return None
+
+    def _get_session(self):
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self._pool_maxsize_async),
+                timeout=aiohttp.ClientTimeout(total=self._timeout),
+            )
+        return self._session
+
+    async def close(self):
+        """Close the connections of the session"""
+        if self._session is not None:
+            await self._session.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def _request(self, method, url, headers, params, body=None):
+        logging.debug(
+            "Making a %s request.\nurl: %s\nheaders: %s\nparams: %s\ndata: %s",
+            method,
+            url,
+            headers,
+            params,
+            body,
+        )
+        try:
+            async with self._get_session().request(
+                method, url, headers=headers, params=params, json=body
+            ) as response:
+                content = await response.read()
+                return AsyncResponse(
+                    response.status, content, str(response.url), dict(response.headers)
+                )
+        except asyncio.TimeoutError as exception:
+            logging.error("%s %s: %s", __file__, __name__, exception)
+            raise requests.exceptions.Timeout(exception) from exception
+        except aiohttp.ClientConnectionError as exception:
+            logging.error("%s %s: %s", __file__, __name__, exception)
+            raise requests.exceptions.ConnectionError(exception) from exception
+        except aiohttp.ClientError as exception:
+            logging.error("%s %s: %s", __file__, __name__, exception)
+            raise requests.exceptions.RequestException(exception) from exception
+
+    async def _request_delete(self, url, headers, params, body):
+        return await self._request("DELETE", url, headers, params, body)
+
+    async def _request_get(self, url, headers, params):
+        return await self._request("GET", url, headers, params)
+
+    async def _request_put(self, url, headers, params, body):
+        return await self._request("PUT", url, headers, params, body)
+
+    async def _request_post(self, url, headers, params, body):
+        return await self._request("POST", url, headers, params, body)
+
+    async def job_set_status(self, job_uid, job_status, update_complete_date=True):
+        """Set job status, see Atlin.job_set_status"""
+        if job_status not in self._job_status.valid_values:
+            raise ValueError(
+                f"Invalid status: {job_status}. Valid status are: {JobStatus.valid_values}"
+            )
+        encoded_url = f"{self.url_api}job/status/{job_uid}"
+        body = dict(job_status=job_status)
+        response = await self._request_put(encoded_url, None, None, body)
+        if update_complete_date and (
+            job_status == JobStatus.failed or job_status == JobStatus.success
+        ):
+            if response.ok:
+                if not (
+                    await self.job_update(
+                        job_uid=job_uid,
+                        data={"complete_date": datetime.now().isoformat()},
+                    )
+                ).ok:
+                    logging.warning("Failed to update complete_date")
+        return response
@@ -3,10 +3,13 @@ from abc import ABC
 from inspect import currentframe, getframeinfo
 import logging
 import json
+import os
+import threading
 from datetime import datetime
 
 # from uuid import uuid4, UUID
 import requests
+from requests.adapters import HTTPAdapter
 
 
 class JobStatus:
@@ -28,23 +31,50 @@ class JobPlatform:
     
     valid_values = [youtube, reddit]
 
+def create_session(pool_maxsize: int = 10) -> requests.Session:
+    """Create a session which keeps up to pool_maxsize connections alive per host."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_maxsize, pool_maxsize=pool_maxsize)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
 class AtlinBase(ABC):
     """Atlin Base used by Youtube and Reddit."""
 
     _timeout = 5
+    _pool_maxsize = 10
 
-    def __init__(self, domain: str):
+    def __init__(
+        self, domain: str, session: requests.Session = None, pool_maxsize: int = None
+    ):
         self._domain = domain if domain[-1] == "/" else f"{domain}/"
         self._apipath = "api/v1/"
         self._job_status = JobStatus()
         self._job_platforms = JobPlatform()
         self._header_json = {"Content-Type": "application/json"}
+        if session is None:
+            session = self._create_session(pool_maxsize or self._pool_maxsize)
+        self._session = session
+
+    def _create_session(self, pool_maxsize: int):
+        return create_session(pool_maxsize)
 
     @property
     def url_api(self):
         """The url of the api"""
         return f"{self._domain}{self._apipath}"
 
+    @property
+    def session(self):
+        """The requests session (and connection pool) used by this object"""
+        return self._session
+
+    def close(self):
+        """Close the connections of the session"""
+        self._session.close()
+
     def _request_delete(self, url, headers, params, body):
         try:
             logging.debug(
@@ -53,7 +83,7 @@ class AtlinBase(ABC):
                 headers,
                 params,
             )
-            response = requests.delete(
+            response = self._session.delete(
                 url, params=params, headers=headers, json=body, timeout=self._timeout
             )
             return response
@@ -67,7 +97,7 @@ class AtlinBase(ABC):
                 f"Making a get request.\nurl: {url}\nheaders:"
                 + f" {headers}\nparams: {params}"
             )
-            response = requests.get(
+            response = self._session.get(
                 url=url, headers=headers, params=params, timeout=self._timeout
             )
             return response
@@ -81,7 +111,7 @@ class AtlinBase(ABC):
                 f"Making a put request.\nurl: {url}\nheaders: "
                 + f"{headers}\nparams: {params}\ndata: {body}"
             )
-            response = requests.put(
+            response = self._session.put(
                 url=url,
                 headers=headers,
                 params=params,
@@ -108,7 +138,7 @@ class AtlinBase(ABC):
                 params,
                 body,
             )
-            response = requests.post(
+            response = self._session.post(
                 url=url,
                 headers=headers,
                 params=params,
@@ -224,8 +254,9 @@ class AtlinBase(ABC):
         encoded_url = f"{self.url_api}job/{job_uid}"
         return self._request_get(encoded_url, None, None)
 
-    def job_set_status(self, job_uid, job_status):
-        """Set job status"""
+    def job_set_status(self, job_uid, job_status, update_complete_date=True):
+        """Set job status, complete_date is also set for final statuses unless
+        update_complete_date is False (e.g. when the caller sends it with other fields)"""
         if job_status not in self._job_status.valid_values:
             raise ValueError(
                 f"Invalid status: {job_status}. Valid status are: {JobStatus.valid_values}"
@@ -233,7 +264,9 @@ class AtlinBase(ABC):
         encoded_url = f"{self.url_api}job/status/{job_uid}"
         body = dict(job_status=job_status)
         response = self._request_put(encoded_url, None, None, body)
-        if job_status == JobStatus.failed or job_status == JobStatus.success:
+        if update_complete_date and (
+            job_status == JobStatus.failed or job_status == JobStatus.success
+        ):
             if response.ok:
                 if not self.job_update(
                     job_uid=job_uid, data={"complete_date": datetime.now().isoformat()}
@@ -300,3 +333,24 @@ class AtlinYoutube(AtlinBase):
 
 class AtlinReddit(AtlinBase):
     """Atlin Reddit"""
+
+
+_SHARED_POOL_MAXSIZE = 20
+_shared_clients = {}
+_shared_clients_lock = threading.Lock()
+
+
+def get_atlin(domain: str) -> Atlin:
+    """Process-wide Atlin object for domain.
+
+    Every caller gets the same object, so the scheduler and the tool interfaces
+    reuse the connections of a single pool instead of opening one per request.
+    Forked or spawned processes get their own object.
+    """
+    key = (os.getpid(), domain)
+    with _shared_clients_lock:
+        client = _shared_clients.get(key)
+        if client is None:
+            client = Atlin(domain, pool_maxsize=_SHARED_POOL_MAXSIZE)
+            _shared_clients[key] = client
+    return client
@@ -0,0 +1,84 @@
+"""Write-behind buffer for job updates."""
+import copy
+import logging
+import time
+
+logger = logging.getLogger("atlin_api:job_update_buffer")
+
+_MISSING = object()
+
+
+class JobUpdateBuffer:
+    """Collects the changes made to the fields of a job and sends them with a single
+    job_update call.
+
+    Only the fields whose value differs from the last value sent are included. The
+    buffer is flushed explicitly (e.g. on state transitions) or, when flush_interval
+    is set, by the first update made after flush_interval seconds.
+
+    The interval is lazy, no timer is running: a change made before a long stretch
+    without updates stays pending until the next update() after the interval or the
+    next explicit flush() (the YouTube jobs flush at every comments checkpoint and
+    when they end).
+    """
+
+    def __init__(
+        self, atlin, job_uid: str, current: dict = None, flush_interval: float = None
+    ):
+        """
+        Args:
+            atlin: Atlin object used to send the updates
+            job_uid: job to update
+            current: fields of the job as stored by the backend, they are not resent
+            flush_interval: seconds after which update() flushes the buffer
+        """
+        self._atlin = atlin
+        self._job_uid = job_uid
+        self._flush_interval = flush_interval
+        self._sent = copy.deepcopy(current) if current else {}
+        self._pending = {}
+        self._last_flush = time.monotonic()
+
+    @property
+    def pending(self) -> dict:
+        """fields waiting to be sent"""
+        return dict(self._pending)
+
+    def update(self, **fields):
+        """Record new values for fields of the job"""
+        for key, value in fields.items():
+            if self._sent.get(key, _MISSING) == value:
+                # back to the value the backend already has
+                self._pending.pop(key, None)
+            else:
+                # copy, the caller may keep modifying dictionaries such as job_detail
+                self._pending[key] = copy.deepcopy(value)
+
+        if (
+            self._flush_interval is not None
+            and time.monotonic() - self._last_flush >= self._flush_interval
+        ):
+            self.flush()
+
+    def flush(self):
+        """Send the pending fields.
+
+        Returns:
+            the response of job_update, None if there was nothing to send
+        """
+        self._last_flush = time.monotonic()
+        if not self._pending:
+            return None
+
+        response = self._atlin.job_update(job_uid=self._job_uid, data=self._pending)
+        if response.ok:
+            self._sent.update(self._pending)
+            self._pending = {}
+        else:
+            logger.warning(
+                "Failed to update job %s (status code %s), keeping %s for the next flush",
+                self._job_uid,
+                response.status_code,
+                ", ".join(self._pending.keys()),
+            )
+        return response
@@ -13,6 +13,7 @@ class RedditJobDetails(JobDetail):
     _valid_sort_option = ["TOP", "HOT", "NEW"]
     _valid_timeframe = ["all", "year", "month", "week", "today", "now"]
     _valid_actions = ["POST", "COMMENT", "KEYWORD"]
+    _valid_output_format = ["TEXT", "PARQUET"]
 
     def __init__(self, data: dict = None, **kwargs):
         super().__init__(**kwargs)
@@ -137,6 +138,19 @@ class RedditJobDetails(JobDetail):
             )
         setattr(self, "_response_count", value)
 
+    @property
+    def output_format(self):
+        """format of the output file"""
+        return getattr(self, "_output_format", self._valid_output_format[0])
+
+    @output_format.setter
+    def output_format(self, value):
+        if value not in self._valid_output_format:
+            raise ValueError(
+                f'{value} is not a valid value. Valid values are: {", ".join(self._valid_output_format)}'
+            )
+        setattr(self, "_output_format", value)
+
     def to_json(self):
         """to json"""
         return json.dumps(self.to_dict())
@@ -154,6 +168,7 @@ class RedditJobDetails(JobDetail):
             "sort_option",
             "actions",
             "response_count",
+            "output_format",
         ]
         for key in required_keys:
             if key not in data.keys():
@@ -174,6 +189,7 @@ class RedditJobDetails(JobDetail):
                 "sort_option": self.sort_option,
                 "actions": self.actions,
                 "response_count": self.response_count,
+                "output_format": self.output_format,
             }
         }
 
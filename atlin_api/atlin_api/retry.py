@@ -0,0 +1,322 @@
+"""Retry policy, circuit breaker and outbox used to deliver requests to the backend."""
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+import requests
+
+logger = logging.getLogger("atlin_api:retry")
+
+
+class RetryError(Exception):
+    """Raised when a request could not be delivered before the deadline."""
+
+
+class CircuitOpenError(RetryError):
+    """Raised when the circuit breaker does not allow requests to be sent."""
+
+
+class RequestRejectedError(RetryError):
+    """Raised when the backend rejects a request (4xx other than 429), sending it
+    again would not change the answer."""
+
+    def __init__(self, message, response=None):
+        super().__init__(message)
+        self.response = response
+
+
+class CircuitBreaker:
+    """Stops sending requests after failure_threshold consecutive failures.
+
+    Once reset_timeout seconds have passed a single trial request is let through,
+    the circuit closes again if it succeeds.
+    """
+
+    closed = "CLOSED"
+    open = "OPEN"
+    half_open = "HALF_OPEN"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30):
+        self._failure_threshold = failure_threshold
+        self._reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._trial_sent = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        """state of the circuit"""
+        with self._lock:
+            return self._state()
+
+    def _state(self):
+        if self._opened_at is None:
+            return self.closed
+        if time.monotonic() - self._opened_at >= self._reset_timeout:
+            return self.half_open
+        return self.open
+
+    def allow_request(self) -> bool:
+        """True if a request can be sent"""
+        with self._lock:
+            state = self._state()
+            if state == self.closed:
+                return True
+            if state == self.half_open and not self._trial_sent:
+                self._trial_sent = True
+                return True
+            return False
+
+    def record_success(self):
+        """close the circuit"""
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_sent = False
+
+    def record_failure(self):
+        """count a failure, open the circuit when the threshold is reached"""
+        with self._lock:
+            self._failures += 1
+            if self._opened_at is not None or self._failures >= self._failure_threshold:
+                if self._opened_at is None:
+                    logger.warning("Circuit opened after %d failures", self._failures)
+                self._opened_at = time.monotonic()
+                self._trial_sent = False
+
+
+def _response_ok(response) -> bool:
+    return response is not None and response.ok
+
+
+def _response_retryable(response) -> bool:
+    """True if the request may succeed later: no response (connection error),
+    a server error (5xx) or too many requests (429)"""
+    status_code = getattr(response, "status_code", None)
+    return status_code is None or status_code >= 500 or status_code == 429
+
+
+class RetryPolicy:
+    """Retries a call with exponential backoff and full jitter until it succeeds
+    or deadline seconds have passed."""
+
+    def __init__(
+        self,
+        *,
+        base_delay: float = 0.5,
+        max_delay: float = 10,
+        deadline: float = 30,
+        jitter: bool = True,
+        circuit_breaker: CircuitBreaker = None,
+        retry_on: tuple = (requests.exceptions.RequestException,),
+    ):
+        self._base_delay = base_delay
+        self._max_delay = max_delay
+        self._deadline = deadline
+        self._jitter = jitter
+        self._circuit_breaker = circuit_breaker
+        self._retry_on = retry_on
+
+    @property
+    def circuit_breaker(self):
+        """circuit breaker shared by all calls of the policy"""
+        return self._circuit_breaker
+
+    def backoff(self, attempt: int) -> float:
+        """delay in seconds before retry number attempt (starting at 1)"""
+        delay = min(self._max_delay, self._base_delay * 2 ** (attempt - 1))
+        if self._jitter:
+            delay = random.uniform(0, delay)
+        return delay
+
+    def call(self, func, *args, is_success=_response_ok, is_retryable=_response_retryable, **kwargs):
+        """Call func(*args, **kwargs) until is_success(result) is True. Results which are
+        not is_retryable (e.g. a 404) are not retried.
+
+        Raises:
+            CircuitOpenError: the circuit breaker is open
+            RequestRejectedError: the result is not a success and can not be retried
+            RetryError: the call did not succeed before the deadline
+        """
+        start = time.monotonic()
+        attempt = 0
+        while True:
+            if self._circuit_breaker is not None and not self._circuit_breaker.allow_request():
+                raise CircuitOpenError("Circuit open, request not sent.")
+
+            try:
+                result = func(*args, **kwargs)
+                if is_success(result):
+                    if self._circuit_breaker is not None:
+                        self._circuit_breaker.record_success()
+                    return result
+                last_error = f"status code {getattr(result, 'status_code', None)}"
+                if not is_retryable(result):
+                    # the backend answered, it is not down
+                    if self._circuit_breaker is not None:
+                        self._circuit_breaker.record_success()
+                    raise RequestRejectedError(f"Request rejected: {last_error}", result)
+            except self._retry_on as exception:
+                last_error = exception
+
+            if self._circuit_breaker is not None:
+                self._circuit_breaker.record_failure()
+
+            attempt += 1
+            delay = self.backoff(attempt)
+            if time.monotonic() - start + delay > self._deadline:
+                raise RetryError(f"Gave up after {attempt} attempt(s): {last_error}")
+
+            logger.debug("Attempt %d failed (%s), retrying in %.2fs", attempt, last_error, delay)
+            time.sleep(delay)
+
+
+class StatusOutbox:
+    """Durable (SQLite) store of job status transitions which could not be delivered.
+
+    Only the latest status of a job is kept, replay() sends them to the backend. A status
+    the backend rejects (4xx), or still not delivered after max_attempts replays or
+    max_age seconds, is moved to the status_dead_letter table and not sent again.
+    """
+
+    def __init__(self, path: str, max_attempts: int = None, max_age: float = None):
+        self._path = path
+        self._max_attempts = max_attempts
+        self._max_age = max_age
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS status_outbox ("
+                "job_uid TEXT PRIMARY KEY, job_status TEXT NOT NULL, created TEXT NOT NULL, "
+                "attempts INTEGER NOT NULL DEFAULT 0)"
+            )
+            columns = [row[1] for row in connection.execute("PRAGMA table_info(status_outbox)")]
+            if "attempts" not in columns:
+                # outbox created before the attempts were counted
+                connection.execute(
+                    "ALTER TABLE status_outbox ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0"
+                )
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS status_dead_letter ("
+                "job_uid TEXT NOT NULL, job_status TEXT NOT NULL, created TEXT NOT NULL, "
+                "attempts INTEGER NOT NULL, reason TEXT, dead TEXT NOT NULL)"
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self._path, timeout=30)
+
+    def put(self, job_uid: str, job_status: str):
+        """store job_status as the status to deliver for job_uid"""
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO status_outbox (job_uid, job_status, created, attempts) "
+                "VALUES (?, ?, ?, 0)",
+                (job_uid, job_status, datetime.now().isoformat()),
+            )
+
+    def contains(self, job_uid: str) -> bool:
+        """True if a status is waiting to be delivered for job_uid"""
+        with self._connect() as connection:
+            row = connection.execute(
+                "SELECT 1 FROM status_outbox WHERE job_uid = ?", (job_uid,)
+            ).fetchone()
+        return row is not None
+
+    def pending(self) -> list:
+        """list of (job_uid, job_status) waiting to be delivered, oldest first"""
+        with self._connect() as connection:
+            return connection.execute(
+                "SELECT job_uid, job_status FROM status_outbox ORDER BY created"
+            ).fetchall()
+
+    def discard(self, job_uid: str, job_status: str = None):
+        """remove the status of job_uid (only if it is still job_status, when given)"""
+        with self._connect() as connection:
+            if job_status is None:
+                connection.execute("DELETE FROM status_outbox WHERE job_uid = ?", (job_uid,))
+            else:
+                connection.execute(
+                    "DELETE FROM status_outbox WHERE job_uid = ? AND job_status = ?",
+                    (job_uid, job_status),
+                )
+
+    def dead_letter(self, job_uid: str, job_status: str, reason: str):
+        """move the status of job_uid (if it is still job_status) to the dead letter table,
+        it is not delivered anymore"""
+        logger.warning("Status %s of job %s dropped from the outbox: %s", job_status, job_uid, reason)
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT INTO status_dead_letter (job_uid, job_status, created, attempts, reason, dead) "
+                "SELECT job_uid, job_status, created, attempts, ?, ? FROM status_outbox "
+                "WHERE job_uid = ? AND job_status = ?",
+                (reason, datetime.now().isoformat(), job_uid, job_status),
+            )
+            connection.execute(
+                "DELETE FROM status_outbox WHERE job_uid = ? AND job_status = ?",
+                (job_uid, job_status),
+            )
+
+    def _failed(self, job_uid: str, job_status: str, reason):
+        """count a failed delivery, the status expires after max_attempts or max_age"""
+        with self._connect() as connection:
+            connection.execute(
+                "UPDATE status_outbox SET attempts = attempts + 1 WHERE job_uid = ? AND job_status = ?",
+                (job_uid, job_status),
+            )
+            row = connection.execute(
+                "SELECT attempts, created FROM status_outbox WHERE job_uid = ? AND job_status = ?",
+                (job_uid, job_status),
+            ).fetchone()
+        if row is None:
+            return
+
+        attempts, created = row
+        if self._max_attempts is not None and attempts >= self._max_attempts:
+            self.dead_letter(job_uid, job_status, f"not delivered after {attempts} attempt(s): {reason}")
+        elif (
+            self._max_age is not None
+            and (datetime.now() - datetime.fromisoformat(created)).total_seconds() > self._max_age
+        ):
+            self.dead_letter(job_uid, job_status, f"not delivered since {created}: {reason}")
+
+    def replay(self, atlin, policy: RetryPolicy = None) -> int:
+        """Try to deliver the pending statuses with atlin.job_set_status.
+
+        Returns:
+            int: number of statuses delivered
+        """
+        delivered = 0
+        for job_uid, job_status in self.pending():
+            try:
+                if policy is None:
+                    response = atlin.job_set_status(job_uid, job_status)
+                    if not _response_ok(response):
+                        if not _response_retryable(response):
+                            raise RequestRejectedError(
+                                f"Request rejected: status code {response.status_code}", response
+                            )
+                        self._failed(job_uid, job_status, f"status code {getattr(response, 'status_code', None)}")
+                        continue
+                else:
+                    policy.call(atlin.job_set_status, job_uid, job_status)
+            except CircuitOpenError:
+                break
+            except RequestRejectedError as exception:
+                self.dead_letter(job_uid, job_status, str(exception))
+                continue
+            except (RetryError, requests.exceptions.RequestException) as exception:
+                logger.warning("Could not replay status of job %s: %s", job_uid, exception)
+                self._failed(job_uid, job_status, exception)
+                continue
+
+            self.discard(job_uid, job_status)
+            delivered += 1
+
+        return delivered
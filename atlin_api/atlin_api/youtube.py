@@ -3,13 +3,19 @@ import logging
 logger = logging.getLogger('atlin_api:youtube')
 class YoutubeJobDetailsSubmit:
     _required_fields = ["option_type","option_value","actions","video_count"]
+    _optional_fields = ["output_format", "text_format", "token_pool"]
+    _valid_output_formats = ["XLSX", "CSV", "JSONL", "PARQUET"]
+    _valid_text_formats = ["HTML", "PLAIN_TEXT"]
     def __init__(self,
                  option_type = None,
                  option_value = None,
                  actions = None,
-                 video_count = None):
+                 video_count = None,
+                 output_format = None,
+                 text_format = None,
+                 token_pool = None):
         loc = locals()
-        for key in self._required_fields:
+        for key in self._required_fields + self._optional_fields:
             if loc[key] is not None:
                 setattr(self, key, loc[key])
         
@@ -58,11 +64,44 @@ class YoutubeJobDetailsSubmit:
                 raise TypeError(f"value should be an integer.")
 
         self._video_count = value
+
+    @property
+    def output_format(self):
+        return getattr(self, "_output_format", self._valid_output_formats[0])
+
+    @output_format.setter
+    def output_format(self, value):
+        if value not in self._valid_output_formats:
+            raise ValueError(f"{value} is not valid. Valid values are {', '.join(self._valid_output_formats)}")
+        self._output_format = value
+
+    @property
+    def text_format(self):
+        return getattr(self, "_text_format", self._valid_text_formats[0])
+
+    @text_format.setter
+    def text_format(self, value):
+        if value not in self._valid_text_formats:
+            raise ValueError(f"{value} is not valid. Valid values are {', '.join(self._valid_text_formats)}")
+        self._text_format = value
+
+    @property
+    def token_pool(self):
+        """if True the job uses the user's other YouTube tokens when the quota of its token runs out"""
+        return getattr(self, "_token_pool", False)
+
+    @token_pool.setter
+    def token_pool(self, value):
+        if isinstance(value, str):
+            value = value.lower() == "true"
+        if not isinstance(value, bool):
+            raise TypeError("Should be of type bool")
+        self._token_pool = value
     
     def to_dict(self):
         out = dict()
         try:
-            for varname in self._required_fields:
+            for varname in self._required_fields + self._optional_fields:
                 out[varname] = getattr(self, varname)
         except Exception as exc:
             raise e
@@ -81,6 +120,10 @@ class YoutubeJobDetailsSubmit:
         
         for var in self._required_fields:
             setattr(self, var, data[var])
+
+        for var in self._optional_fields:
+            if var in data.keys():
+                setattr(self, var, data[var])
         
 class YoutubeJobDetailsResume:
     _required_fields = {
@@ -89,6 +132,9 @@ class YoutubeJobDetailsResume:
         "api_key_valid" : True,
         "videos_ids" :[],
         "comments_count" : {},
+        "videos_progress" : {},
+        "comments_filename" : "",
+        "plan" : {},
         "actions" : [],
         "all_videos_retrieved" : True,
         "all_comments_retrieved" : True,
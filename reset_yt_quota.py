@@ -1,4 +1,5 @@
 import atlin_api.atlin_api.atlin as atlinAPI
+from Scheduler.quota_ledger import get_quota_ledger
 import Config
 
 atlin = atlinAPI.Atlin(Config.ATLIN_API_ADDRESS)
@@ -11,9 +12,12 @@ def reset_Youtube_quota():
         response.raise_for_status()
         tokens = response.json()
 
-        quota = 0
+        # The quota ledger starts a new quota day at the reset time, the tokens get the units
+        # they committed since then (0 unless a job already ran)
+        ledger = get_quota_ledger()
         for token in tokens:
             try:
+                quota = ledger.committed(token["token_uid"], "YOUTUBE")
                 response = atlin.token_set_quota(token["token_uid"], "YOUTUBE", quota)
             except Exception as e:
                 print(f"Could not update token quota. {e}")